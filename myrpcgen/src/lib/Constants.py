@@ -5,3 +5,4 @@ RESERVED_PREFIXES = (MYRPC_PREFIX, U_MYRPC_PREFIX)
 ENCODING = "utf-8"
 IDENTIFIER_RE = r"^[a-zA-Z_][0-9a-zA-Z_]*$"
 RESULT_FIELD_NAME = "result"
+COMPRESS_METHODS = ("zlib",)
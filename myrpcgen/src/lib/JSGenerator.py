@@ -476,6 +476,7 @@ class JSGenerator(GeneratorBase):
             DataTypeKind.DOUBLE: ("DOUBLE", self._dtype_kind_primitive_gen, self._dtype_kind_primitive_read, self._dtype_kind_primitive_write),
             DataTypeKind.ENUM:   ("ENUM",   self._dtype_kind_enum_gen,      self._dtype_kind_enum_read,      self._dtype_kind_enum_write),
             DataTypeKind.LIST:   ("LIST",   self._dtype_kind_list_gen,      self._dtype_kind_list_read,      self._dtype_kind_list_write),
+            DataTypeKind.MAP:    ("MAP",    self._dtype_kind_map_gen,       self._dtype_kind_map_gen,        self._dtype_kind_map_gen),
             DataTypeKind.STRUCT: ("STRUCT", self._dtype_kind_struct_gen,    self._dtype_kind_struct_read,    self._dtype_kind_struct_write),
             # Exceptions are using the same methods as structs.
             DataTypeKind.EXC:    (None,     self._dtype_kind_struct_gen,    None,                            None)
@@ -655,6 +656,9 @@ class JSGenerator(GeneratorBase):
 
         return sb.get_string()
 
+    def _dtype_kind_map_gen(self, dtype, v = None):
+        raise GeneratorException("Map {} is not supported by js generator".format(dtype.get_name()))
+
     def _dtype_kind_struct_gen(self, dtype, classn = None, sfa = None):
         sb = StringBuilder()
         dtype_name = dtype.get_name()
@@ -667,6 +671,13 @@ class JSGenerator(GeneratorBase):
         if classn == None:
             classn = self._get_dtype_classn(dtype_name)
 
+        # JavaScript runtime doesn't support compressed fields.
+
+        for field in fields:
+            (compress, compress_min) = field.get_compress()
+            if compress != None:
+                raise GeneratorException("Struct {} field {} is compressed, it is not supported by js generator".format(dtype_name, field.get_name()))
+
         # Do we need to generate validation method?
 
         is_validate_needed = False
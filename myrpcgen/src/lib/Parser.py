@@ -1,8 +1,8 @@
 import re
 
-from myrpcgen.Constants import RESERVED_PREFIXES, ENCODING, IDENTIFIER_RE
+from myrpcgen.Constants import RESERVED_PREFIXES, ENCODING, IDENTIFIER_RE, COMPRESS_METHODS
 from myrpcgen.ParserInternalException import ParserInternalException
-from myrpcgen.TypeManager import EnumType, ListType, StructType, ExcType, Method, Field, TypeManager
+from myrpcgen.TypeManager import EnumType, ListType, MapType, StructType, ExcType, Method, Field, TypeManager
 from myrpcgen.GeneratorBase import GeneratorBase
 
 class ParserContext:
@@ -117,6 +117,19 @@ class Parser:
 
         self._tm.register_dtype(dtype)
 
+    def _main_map(self):
+        name = self._tok.get_id()
+        self._check_dtype_name(name)
+
+        key_dtype = self._tok.get_dtype()
+        value_dtype = self._tok.get_dtype()
+
+        dtype = MapType(name)
+        dtype.set_key_dtype(key_dtype)
+        dtype.set_value_dtype(value_dtype)
+
+        self._tm.register_dtype(dtype)
+
     def _main_beginenum(self):
         name = self._tok.get_id()
         self._check_dtype_name(name)
@@ -182,6 +195,7 @@ class Parser:
         name = self._tok.get_id()
 
         field = Field(fid, req, dtype, name)
+        self._set_field_opts(field)
         self._curr_dtype.add_field(field)
 
     def _struct_endstruct(self):
@@ -200,6 +214,7 @@ class Parser:
         name = self._tok.get_id()
 
         field = Field(fid, req, dtype, name)
+        self._set_field_opts(field)
         self._curr_dtype.add_field(field)
 
     def _exc_endexception(self):
@@ -218,6 +233,7 @@ class Parser:
         name = self._tok.get_id()
 
         field = Field(fid, req, dtype, name)
+        self._set_field_opts(field)
         self._curr_method.add_in_field(field)
 
     def _method_out(self):
@@ -244,6 +260,7 @@ class Parser:
             ParserContext.MAIN: {
                 "namespace":      self._main_namespace,
                 "list":           self._main_list,
+                "map":            self._main_map,
                 "beginenum":      self._main_beginenum,
                 "beginstruct":    self._main_beginstruct,
                 "beginexception": self._main_beginexception,
@@ -275,6 +292,12 @@ class Parser:
     def _set_context(self, context):
         self._context = context
 
+    def _set_field_opts(self, field):
+        (compress, compress_min) = self._tok.get_field_opts()
+
+        if compress != None:
+            field.set_compress(compress, compress_min)
+
     def _check_dtype_name(self, name):
         if self._tm.has_dtype(name):
             raise ParserInternalException("Type {} is already defined".format(name))
@@ -363,6 +386,49 @@ class Tokenizer:
 
         return i
 
+    def get_field_opts(self):
+        """Parse optional field options (compress=<method> min=<size>).
+
+        Return (method, min_size) tuple.
+        """
+
+        opts = {}
+
+        while self._pos < len(self._toks):
+            tok = self._get_tok()
+
+            (key, sep, value) = tok.partition("=")
+            if (sep == "" or value == ""):
+                raise ParserInternalException("Field option <key>=<value> expected")
+            if key not in ("compress", "min"):
+                raise ParserInternalException("Unknown field option {}".format(key))
+            if key in opts:
+                raise ParserInternalException("Field option {} is already specified".format(key))
+
+            opts[key] = value
+
+        compress = opts.get("compress")
+        compress_min = 0
+
+        if (compress != None and
+            compress not in COMPRESS_METHODS):
+            raise ParserInternalException("Unknown compression method {} ({})".format(compress, ", ".join(COMPRESS_METHODS)))
+
+        if "min" in opts:
+            if compress == None:
+                raise ParserInternalException("Field option min requires compress")
+
+            min_max = 0xffffffff
+
+            try:
+                compress_min = int(opts["min"])
+                if (compress_min < 0 or compress_min > min_max):
+                    raise ValueError()
+            except ValueError:
+                raise ParserInternalException("Field option min must be numeric (0 ... {})".format(min_max))
+
+        return (compress, compress_min)
+
     def eol(self):
         if self._pos < len(self._toks):
             raise ParserInternalException("End of line expected")
@@ -4,9 +4,19 @@ import re
 
 from myrpcgen.Constants import MYRPC_PREFIX, U_MYRPC_PREFIX, ENCODING, IDENTIFIER_RE, RESULT_FIELD_NAME
 from myrpcgen.GeneratorBase import StructFieldAccess, GeneratorBase, StringBuilder, GeneratorException
-from myrpcgen.TypeManager import DataTypeKind
+from myrpcgen.TypeManager import DataTypeKind, PrimitiveType
 from myrpcgen.InternalException import InternalException
 
+class Serializer:
+    """Specifies how (de)serializers are generated."""
+
+    (CODE,
+     TABLE) = range(2)
+
+_SERIALIZER = "code" # Default, must be in _SERIALIZER_CHOICES.
+_SERIALIZER_CHOICES = {"code":  Serializer.CODE,
+                       "table": Serializer.TABLE}
+
 _INIT_FILENAME = "__init__.py"
 _TYPES_MODULE = "Types"
 _TYPES_FILENAME = "{}.py".format(_TYPES_MODULE)
@@ -16,6 +26,13 @@ _ARGS_RESULT_SERI_SFA = StructFieldAccess.UNDERSCORE
 _STRUCT_READ = "{}read".format(MYRPC_PREFIX)
 _STRUCT_WRITE = "{}write".format(MYRPC_PREFIX)
 _STRUCT_VALIDATE = "{}validate".format(U_MYRPC_PREFIX)
+_STRUCT_READ_COMPACT = "{}read_compact".format(U_MYRPC_PREFIX)
+_STRUCT_WRITE_COMPACT = "{}write_compact".format(U_MYRPC_PREFIX)
+_SCHEMA_FINGERPRINT = "{}schema_fingerprint".format(MYRPC_PREFIX)
+_STRUCT_FREEZE = "{}freeze".format(MYRPC_PREFIX)
+_STRUCT_THAW = "{}thaw".format(MYRPC_PREFIX)
+_FROZEN_HASH = "{}hash".format(U_MYRPC_PREFIX)
+_DESC_MODULE = "myrpc.codec.TypeDescriptor"
 _NS_SEPARATOR = "."
 
 class PyGenerator(GeneratorBase):
@@ -27,15 +44,30 @@ class PyGenerator(GeneratorBase):
     def setup_gen(self):
         self._validate_ns()
 
+        self._serializer = _SERIALIZER_CHOICES[self._args.py_serializer]
+        self._frozen = self._args.py_frozen
+        self._async = self._args.py_async
+
         self._enum_read_funcp = "{}enum_read".format(MYRPC_PREFIX)
         self._enum_write_funcp = "{}enum_write".format(MYRPC_PREFIX)
         self._enum_validate_funcp = "{}enum_validate".format(MYRPC_PREFIX)
         self._list_read_funcp = "{}list_read".format(MYRPC_PREFIX)
         self._list_write_funcp = "{}list_write".format(MYRPC_PREFIX)
+        self._list_iter_funcp = "{}list_iter".format(MYRPC_PREFIX)
+        self._list_freeze_funcp = "{}list_freeze".format(MYRPC_PREFIX)
+        self._list_thaw_funcp = "{}list_thaw".format(MYRPC_PREFIX)
+        self._map_read_funcp = "{}map_read".format(MYRPC_PREFIX)
+        self._map_write_funcp = "{}map_write".format(MYRPC_PREFIX)
+        self._map_freeze_funcp = "{}map_freeze".format(MYRPC_PREFIX)
+        self._map_thaw_funcp = "{}map_thaw".format(MYRPC_PREFIX)
+        self._frozen_classp = "{}frozen".format(MYRPC_PREFIX)
+        self._client_iter_funcp = "{}iter".format(MYRPC_PREFIX)
         self._args_seri_classp = "{}args_seri".format(MYRPC_PREFIX)
         self._result_seri_classp = "{}result_seri".format(MYRPC_PREFIX)
         self._codec_dtype_classp = "myrpc.codec.CodecBase.DataType"
+        self._compression_classp = "myrpc.codec.CodecBase.Compression"
         self._exc_handler_funcp = "{}exc_handler".format(U_MYRPC_PREFIX)
+        self._desc_varp = "{}desc".format(MYRPC_PREFIX)
 
         self._setup_dtype_kinds()
 
@@ -73,6 +105,17 @@ class PyGenerator(GeneratorBase):
         sb = StringBuilder()
         sb.wl("import myrpc.Common")
         sb.wl("import myrpc.codec.CodecBase")
+
+        if self._serializer == Serializer.TABLE:
+            sb.wl("import {}".format(_DESC_MODULE))
+
+        sb.we()
+
+        # Compact encoding can be negotiated only between peers having the
+        # same fingerprint (see BinaryCodec.set_schema_fingerprint).
+
+        fingerprint = self._tm.get_schema_fingerprint(self._methods)
+        sb.wl("{} = 0x{:016x}".format(_SCHEMA_FINGERPRINT, fingerprint))
         sb.we()
         self._ws(sb.get_string())
 
@@ -90,14 +133,23 @@ class PyGenerator(GeneratorBase):
         sb = StringBuilder()
         sb.wl("from myrpc.Common import MessageHeaderException")
         sb.wl("from myrpc.util.ClientSubr import ClientSubr")
+
+        if self._async:
+            sb.wl("from myrpc.util.AsyncClientSubr import AsyncClientSubr")
+
         sb.we()
         sb.wl("from {} import {}".format(self._namespace, _TYPES_MODULE))
         sb.we()
         self._ws(sb.get_string())
 
-        self._gen_client()
+        self._gen_client("Client", "ClientSubr")
         self._gen_exc_handler()
 
+        # Async client shares the exception handlers.
+
+        if self._async:
+            self._gen_client("AsyncClient(Client)", "AsyncClientSubr", True)
+
         self._close()
 
     def gen_processor(self):
@@ -120,6 +172,20 @@ class PyGenerator(GeneratorBase):
 
         self._close()
 
+    @staticmethod
+    def setup_argparse(parser):
+        group = parser.add_argument_group("py specific arguments")
+        group.add_argument("--py_serializer", dest = "py_serializer",
+                           choices = _SERIALIZER_CHOICES,
+                           default = _SERIALIZER,
+                           help = "(de)serializer generation: code per type or type descriptors for the runtime engine (default: {})".format(_SERIALIZER))
+        group.add_argument("--py_frozen", dest = "py_frozen",
+                           action = "store_true",
+                           help = "generate immutable, hashable variants of structs")
+        group.add_argument("--py_async", dest = "py_async",
+                           action = "store_true",
+                           help = "generate asyncio client (AsyncClient) too")
+
     def _validate_ns_impl(self):
         if self._namespace == None:
             raise ValueError()
@@ -141,6 +207,14 @@ class PyGenerator(GeneratorBase):
             s = self._gtm.gen_dtype(dtype)
             self._ws(s)
 
+        # Descriptors reference each other, therefore they are generated in
+        # declaration order, after all classes.
+
+        if self._serializer == Serializer.TABLE:
+            for dtype in self._tm.list_dtype():
+                s = self._gen_desc(dtype)
+                self._ws(s)
+
     def _gen_args_result_seri(self):
         methods = self._sort_by_name(self._methods)
 
@@ -160,12 +234,24 @@ class PyGenerator(GeneratorBase):
             s = self._dtype_kind_struct_gen(out_struct, result_seri_classn, _ARGS_RESULT_SERI_SFA)
             self._ws(s)
 
-    def _gen_client(self):
+            if self._serializer == Serializer.TABLE:
+                s = self._gen_desc(in_struct, args_seri_classn, _ARGS_RESULT_SERI_SFA)
+                self._ws(s)
+
+                s = self._gen_desc(out_struct, result_seri_classn, _ARGS_RESULT_SERI_SFA)
+                self._ws(s)
+
+    def _gen_client(self, classn, subr_classn, is_async = False):
         sb = StringBuilder()
 
-        sb.wl("class Client:")
+        if is_async:
+            (def_kw, await_kw) = ("async def", "await ")
+        else:
+            (def_kw, await_kw) = ("def", "")
+
+        sb.wl("class {}:".format(classn))
         sb.wl("\tdef __init__(self, tr, codec):")
-        sb.wl("\t\tself._client = ClientSubr(tr, codec)")
+        sb.wl("\t\tself._client = {}(tr, codec)".format(subr_classn))
         sb.we()
 
         classn_prefix = "{}.".format(_TYPES_MODULE)
@@ -186,7 +272,7 @@ class PyGenerator(GeneratorBase):
             args_self.insert(0, "self")
             args_selff = ", ".join(args_self)
 
-            sb.wl("\tdef {}({}):".format(name, args_selff))
+            sb.wl("\t{} {}({}):".format(def_kw, name, args_selff))
             sb.wl("\t\targs_seri = {}()".format(args_seri_classn))
 
             for i in range(len(in_field_names)):
@@ -204,7 +290,47 @@ class PyGenerator(GeneratorBase):
             sb.wl("\t\texc_handler = self.{}".format(exc_handler_funcn))
             sb.we()
 
-            sb.wl("\t\tr = self._client.call(\"{}\", args_seri, result_seri, exc_handler)".format(name))
+            sb.wl("\t\tr = {}self._client.call(\"{}\", args_seri, result_seri, exc_handler)".format(await_kw, name))
+            sb.we()
+
+            sb.wl("\t\treturn r")
+            sb.we()
+
+            # Methods returning list have an iterator variant too, which
+            # decodes the elements of the received response lazily.
+
+            if not method.has_result():
+                continue
+
+            result_field = method.get_out_struct().get_fields()[0]
+            result_dtype = result_field.get_dtype()
+
+            if result_dtype.get_dtype_kind() != DataTypeKind.LIST:
+                continue
+
+            result_dtype_name = result_dtype.get_name()
+
+            if self._serializer == Serializer.TABLE:
+                list_iter = "{}{}.iter".format(classn_prefix, self._get_desc_varn(result_dtype_name))
+            else:
+                list_iter = "{}{}".format(classn_prefix, self._get_list_iter_funcn(result_dtype_name))
+
+            sb.wl("\t{} {}_{}({}):".format(def_kw, self._client_iter_funcp, name, args_selff))
+            sb.wl("\t\targs_seri = {}()".format(args_seri_classn))
+
+            for i in range(len(in_field_names)):
+                in_field_name = in_field_names[i]
+                arg = args[i]
+                setter_invoke = self._get_struct_field_setter_invoke("args_seri", in_field_name, arg, _ARGS_RESULT_SERI_SFA)
+
+                sb.wl("\t\t{}".format(setter_invoke))
+
+            sb.we()
+
+            sb.wl("\t\texc_handler = self.{}".format(exc_handler_funcn))
+            sb.we()
+
+            sb.wl("\t\tr = {}self._client.call_iter(\"{}\", args_seri, {}, {}, exc_handler)".format(await_kw, name, result_field.get_req(), list_iter))
             sb.we()
 
             sb.wl("\t\treturn r")
@@ -410,6 +536,7 @@ class PyGenerator(GeneratorBase):
             DataTypeKind.DOUBLE: ("DOUBLE", self._dtype_kind_primitive_gen, self._dtype_kind_primitive_read, self._dtype_kind_primitive_write),
             DataTypeKind.ENUM:   ("ENUM",   self._dtype_kind_enum_gen,      self._dtype_kind_enum_read,      self._dtype_kind_enum_write),
             DataTypeKind.LIST:   ("LIST",   self._dtype_kind_list_gen,      self._dtype_kind_list_read,      self._dtype_kind_list_write),
+            DataTypeKind.MAP:    ("MAP",    self._dtype_kind_map_gen,       self._dtype_kind_map_read,       self._dtype_kind_map_write),
             DataTypeKind.STRUCT: ("STRUCT", self._dtype_kind_struct_gen,    self._dtype_kind_struct_read,    self._dtype_kind_struct_write),
             # Exceptions are using the same methods as structs.
             DataTypeKind.EXC:    (None,     self._dtype_kind_struct_gen,    None,                            None)
@@ -458,6 +585,11 @@ class PyGenerator(GeneratorBase):
 
         sb.we()
 
+        # With table serializer, EnumDescriptor does the rest.
+
+        if self._serializer == Serializer.TABLE:
+            return sb.get_string()
+
         sb.wl("def {}(codec):".format(read_funcn))
         sb.wl("\tv = codec.read_i32()")
         sb.we()
@@ -511,11 +643,19 @@ class PyGenerator(GeneratorBase):
         return sb.get_string()
 
     def _dtype_kind_list_gen(self, dtype):
+        frozen = self._gen_list_frozen(dtype) if self._frozen else ""
+
+        # With table serializer, ListDescriptor does everything.
+
+        if self._serializer == Serializer.TABLE:
+            return frozen
+
         sb = StringBuilder()
         dtype_name = dtype.get_name()
         elem_dtype = dtype.get_elem_dtype()
         read_funcn = self._get_list_read_funcn(dtype_name)
         write_funcn = self._get_list_write_funcn(dtype_name)
+        iter_funcn = self._get_list_iter_funcn(dtype_name)
         codec_dtype_classn = self._get_codec_dtype_classn(elem_dtype)
 
         sb.wl("def {}(codec):".format(read_funcn))
@@ -526,31 +666,67 @@ class PyGenerator(GeneratorBase):
         sb.we()
         sb.wl("\tl = []")
         sb.we()
-        sb.wl("\tfor i in range(llen):")
+        sb.wl("\twhile llen > 0:")
+        sb.wl("\t\tfor i in range(llen):")
 
         s = self._gtm.read_dtype(elem_dtype, "elem")
-        sb.wlsindent("\t\t", s)
+        sb.wlsindent("\t\t\t", s)
 
-        sb.wl("\t\tl.append(elem)")
+        sb.wl("\t\t\tl.append(elem)")
+        sb.we()
+        sb.wl("\t\tllen = codec.read_list_chunk()")
         sb.we()
         sb.wl("\tcodec.read_list_end()")
         sb.we()
         sb.wl("\treturn l")
         sb.we()
 
+        sb.wl("def {}(codec):".format(iter_funcn))
+        sb.wl("\t(llen, dtype) = codec.read_list_begin()")
+        sb.we()
+        sb.wl("\tif dtype != {}:".format(codec_dtype_classn))
+        sb.wl("\t\traise myrpc.Common.MessageBodyException(\"List {} has unexpected elem data type {{}}\".format(dtype))".format(dtype_name))
+        sb.we()
+        sb.wl("\twhile llen > 0:")
+        sb.wl("\t\tfor i in range(llen):")
+
+        s = self._gtm.read_dtype(elem_dtype, "elem")
+        sb.wlsindent("\t\t\t", s)
+
+        sb.wl("\t\t\tyield elem")
+        sb.we()
+        sb.wl("\t\tllen = codec.read_list_chunk()")
+        sb.we()
+        sb.wl("\tcodec.read_list_end()")
+        sb.we()
+
+        # Iterables without length (e.g. generators) are written as
+        # chunked list.
+
         sb.wl("def {}(codec, l):".format(write_funcn))
-        sb.wl("\tcodec.write_list_begin(len(l), {})".format(codec_dtype_classn))
+        sb.wl("\tif hasattr(l, \"__len__\"):")
+        sb.wl("\t\tcodec.write_list_begin(len(l), {})".format(codec_dtype_classn))
         sb.we()
-        sb.wl("\tfor elem in l:")
+        sb.wl("\t\tfor elem in l:")
 
         s = self._gtm.write_dtype(elem_dtype, "elem")
-        sb.wlsindent("\t\t", s)
+        sb.wlsindent("\t\t\t", s)
 
+        sb.wl("\telse:")
+        sb.wl("\t\tcodec.write_list_begin(None, {})".format(codec_dtype_classn))
+        sb.we()
+        sb.wl("\t\tfor chunk in codec.split_list(l):")
+        sb.wl("\t\t\tcodec.write_list_chunk(len(chunk))")
+        sb.we()
+        sb.wl("\t\t\tfor elem in chunk:")
+        sb.wlsindent("\t\t\t\t", s)
+        sb.we()
+        sb.wl("\t\tcodec.write_list_chunk(0)")
         sb.we()
         sb.wl("\tcodec.write_list_end()")
         sb.we()
 
-        return sb.get_string()
+        return sb.get_string() + frozen
 
     def _dtype_kind_list_read(self, dtype, v):
         sb = StringBuilder()
@@ -570,6 +746,85 @@ class PyGenerator(GeneratorBase):
 
         return sb.get_string()
 
+    def _dtype_kind_map_gen(self, dtype):
+        frozen = self._gen_map_frozen(dtype) if self._frozen else ""
+
+        # With table serializer, MapDescriptor does everything.
+
+        if self._serializer == Serializer.TABLE:
+            return frozen
+
+        sb = StringBuilder()
+        dtype_name = dtype.get_name()
+        key_dtype = dtype.get_key_dtype()
+        value_dtype = dtype.get_value_dtype()
+        read_funcn = self._get_map_read_funcn(dtype_name)
+        write_funcn = self._get_map_write_funcn(dtype_name)
+        key_codec_dtype_classn = self._get_codec_dtype_classn(key_dtype)
+        value_codec_dtype_classn = self._get_codec_dtype_classn(value_dtype)
+
+        sb.wl("def {}(codec):".format(read_funcn))
+        sb.wl("\t(mlen, key_dtype, value_dtype) = codec.read_map_begin()")
+        sb.we()
+        sb.wl("\tif key_dtype != {}:".format(key_codec_dtype_classn))
+        sb.wl("\t\traise myrpc.Common.MessageBodyException(\"Map {} has unexpected key data type {{}}\".format(key_dtype))".format(dtype_name))
+        sb.we()
+        sb.wl("\tif value_dtype != {}:".format(value_codec_dtype_classn))
+        sb.wl("\t\traise myrpc.Common.MessageBodyException(\"Map {} has unexpected value data type {{}}\".format(value_dtype))".format(dtype_name))
+        sb.we()
+        sb.wl("\tm = {}")
+        sb.we()
+        sb.wl("\tfor i in range(mlen):")
+
+        s = self._gtm.read_dtype(key_dtype, "key")
+        sb.wlsindent("\t\t", s)
+        s = self._gtm.read_dtype(value_dtype, "value")
+        sb.wlsindent("\t\t", s)
+
+        sb.wl("\t\tm[key] = value")
+        sb.we()
+        sb.wl("\tif len(m) != mlen:")
+        sb.wl("\t\traise myrpc.Common.MessageBodyException(\"Map {} has duplicated key\")".format(dtype_name))
+        sb.we()
+        sb.wl("\tcodec.read_map_end()")
+        sb.we()
+        sb.wl("\treturn m")
+        sb.we()
+
+        sb.wl("def {}(codec, m):".format(write_funcn))
+        sb.wl("\tcodec.write_map_begin(len(m), {}, {})".format(key_codec_dtype_classn, value_codec_dtype_classn))
+        sb.we()
+        sb.wl("\tfor (key, value) in m.items():")
+
+        s = self._gtm.write_dtype(key_dtype, "key")
+        sb.wlsindent("\t\t", s)
+        s = self._gtm.write_dtype(value_dtype, "value")
+        sb.wlsindent("\t\t", s)
+
+        sb.we()
+        sb.wl("\tcodec.write_map_end()")
+        sb.we()
+
+        return sb.get_string() + frozen
+
+    def _dtype_kind_map_read(self, dtype, v):
+        sb = StringBuilder()
+        dtype_name = dtype.get_name()
+        funcn = self._get_map_read_funcn(dtype_name)
+
+        sb.wl("{} = {}(codec)".format(v, funcn))
+
+        return sb.get_string()
+
+    def _dtype_kind_map_write(self, dtype, v):
+        sb = StringBuilder()
+        dtype_name = dtype.get_name()
+        funcn = self._get_map_write_funcn(dtype_name)
+
+        sb.wl("{}(codec, {})".format(funcn, v))
+
+        return sb.get_string()
+
     def _dtype_kind_struct_gen(self, dtype, classn = None, sfa = None):
         sb = StringBuilder()
         dtype_name = dtype.get_name()
@@ -580,6 +835,10 @@ class PyGenerator(GeneratorBase):
         # during method args_seri/result_seri generation (these are
         # structs).
 
+        # Frozen variants are generated for IDL structs only.
+
+        is_frozen_needed = (self._frozen and classn == None and not dtype_kind_is_exc)
+
         if classn == None:
             classn = self._get_dtype_classn(dtype_name)
 
@@ -594,6 +853,11 @@ class PyGenerator(GeneratorBase):
         if sfa == None:
             sfa = self._sfa
 
+        frozen = ""
+
+        if is_frozen_needed:
+            frozen = self._gen_struct_frozen(dtype, classn, sfa)
+
         parent_classn = "(Exception)" if dtype_kind_is_exc else ""
         sb.wl("class {}{}:".format(classn, parent_classn))
 
@@ -638,9 +902,35 @@ class PyGenerator(GeneratorBase):
                 sb.wl("\t\t{} = {}".format(var_name, name))
                 sb.we()
 
+        if is_frozen_needed:
+            frozen_classn = self._get_frozen_classn(classn)
+            values = [self._get_freeze_expr(field.get_dtype(), self._get_struct_field_var_name(field.get_name(), sfa), True) for field in fields]
+
+            sb.wl("\tdef {}(self):".format(_STRUCT_FREEZE))
+            sb.wl("\t\treturn {}({})".format(frozen_classn, ", ".join(values)))
+            sb.we()
+
+        # With table serializer, delegate to StructDescriptor.
+
+        if self._serializer == Serializer.TABLE:
+            desc_varn = self._get_desc_varn(classn)
+
+            sb.wl("\tdef {}(self, codec):".format(_STRUCT_READ))
+            sb.wl("\t\t{}.read_into(codec, self)".format(desc_varn))
+            sb.we()
+            sb.wl("\tdef {}(self, codec):".format(_STRUCT_WRITE))
+            sb.wl("\t\t{}.write_from(codec, self)".format(desc_varn))
+            sb.we()
+
+            return sb.get_string() + frozen
+
         # Generate serializer, deserializer and validator methods.
 
         sb.wl("\tdef {}(self, codec):".format(_STRUCT_READ))
+        sb.wl("\t\tif codec.is_read_compact():")
+        sb.wl("\t\t\tself.{}(codec)".format(_STRUCT_READ_COMPACT))
+        sb.wl("\t\t\treturn")
+        sb.we()
         sb.wl("\t\tcodec.read_struct_begin()")
         sb.we()
         sb.wl("\t\twhile True:")
@@ -666,7 +956,7 @@ class PyGenerator(GeneratorBase):
             sb.wl("\t\t\t\t\terr_dup = True")
             sb.wl("\t\t\t\telse:")
 
-            s = self._gtm.read_dtype(field_dtype, var_name)
+            s = self._read_field(field, var_name)
             sb.wlsindent("\t\t\t\t\t", s)
 
         indent = "\t\t\t"
@@ -699,6 +989,10 @@ class PyGenerator(GeneratorBase):
             sb.wl("\t\tself.{}(False)".format(_STRUCT_VALIDATE))
             sb.we()
 
+        sb.wl("\t\tif codec.is_write_compact():")
+        sb.wl("\t\t\tself.{}(codec)".format(_STRUCT_WRITE_COMPACT))
+        sb.wl("\t\t\treturn")
+        sb.we()
         sb.wl("\t\tcodec.write_struct_begin()")
         sb.we()
 
@@ -718,7 +1012,7 @@ class PyGenerator(GeneratorBase):
 
             sb.wl("{}codec.write_field_begin({}, {})".format(indent, fid, codec_dtype_classn))
 
-            s = self._gtm.write_dtype(field_dtype, var_name)
+            s = self._write_field(field, var_name)
             sb.wlsindent(indent, s)
 
             sb.wl("{}codec.write_field_end()".format(indent))
@@ -729,6 +1023,8 @@ class PyGenerator(GeneratorBase):
         sb.wl("\t\tcodec.write_struct_end()")
         sb.we()
 
+        self._gen_struct_compact(sb, fields, sfa)
+
         if is_validate_needed:
             sb.wl("\tdef {}(self, is_read):".format(_STRUCT_VALIDATE))
             sb.wl("\t\tname = None")
@@ -757,6 +1053,349 @@ class PyGenerator(GeneratorBase):
             sb.wl("\t\t\t\traise myrpc.Common.MessageEncodeException(msg)")
             sb.we()
 
+        return sb.get_string() + frozen
+
+    def _gen_struct_frozen(self, dtype, classn, sfa):
+        # Frozen struct: the same fields (in slots) and getters, but
+        # without setters, with value equality and cached hash.
+
+        sb = StringBuilder()
+        dtype_name = dtype.get_name()
+        fields = dtype.get_fields()
+        frozen_classn = self._get_frozen_classn(classn)
+
+        names = [field.get_name() for field in fields]
+        var_names = [self._get_struct_field_var_name(name, sfa) for name in names]
+        attrs = [var_name.split(".", 1)[1] for var_name in var_names]
+
+        slots = ["\"{}\"".format(attr) for attr in attrs + [_FROZEN_HASH]]
+
+        sb.wl("class {}:".format(frozen_classn))
+        sb.wl("\t__slots__ = {}".format(self._get_tuple_expr(slots)))
+        sb.we()
+
+        args = ["{} = None".format(name) for name in names]
+        args.insert(0, "self")
+
+        sb.wl("\tdef __init__({}):".format(", ".join(args)))
+
+        for (name, attr) in zip(names, attrs):
+            sb.wl("\t\tobject.__setattr__(self, \"{}\", {})".format(attr, name))
+
+        sb.wl("\t\tobject.__setattr__(self, \"{}\", None)".format(_FROZEN_HASH))
+        sb.we()
+
+        for (name, var_name) in zip(names, var_names):
+            getter_name = self._get_struct_field_getter_name(name, sfa)
+
+            if getter_name != None:
+                sb.wl("\tdef {}(self):".format(getter_name))
+                sb.wl("\t\treturn {}".format(var_name))
+                sb.we()
+
+        for funcn in ("__setattr__(self, name, value)", "__delattr__(self, name)"):
+            sb.wl("\tdef {}:".format(funcn))
+            sb.wl("\t\traise AttributeError(\"Struct {} is frozen\")".format(dtype_name))
+            sb.we()
+
+        values = self._get_tuple_expr(var_names)
+        other_values = self._get_tuple_expr(["other.{}".format(attr) for attr in attrs])
+
+        sb.wl("\tdef __eq__(self, other):")
+        sb.wl("\t\tif other.__class__ is not self.__class__:")
+        sb.wl("\t\t\treturn NotImplemented")
+        sb.we()
+        sb.wl("\t\treturn {} == {}".format(values, other_values))
+        sb.we()
+
+        sb.wl("\tdef __hash__(self):")
+        sb.wl("\t\th = self.{}".format(_FROZEN_HASH))
+        sb.we()
+        sb.wl("\t\tif h == None:")
+        sb.wl("\t\t\th = hash({})".format(values))
+        sb.wl("\t\t\tobject.__setattr__(self, \"{}\", h)".format(_FROZEN_HASH))
+        sb.we()
+        sb.wl("\t\treturn h")
+        sb.we()
+
+        sb.wl("\tdef {}(self):".format(_STRUCT_THAW))
+        sb.wl("\t\tobj = {}()".format(classn))
+
+        for (field, var_name, attr) in zip(fields, var_names, attrs):
+            value = self._get_thaw_expr(field.get_dtype(), var_name, True)
+            sb.wl("\t\tobj.{} = {}".format(attr, value))
+
+        sb.we()
+        sb.wl("\t\treturn obj")
+        sb.we()
+
+        return sb.get_string()
+
+    def _gen_list_frozen(self, dtype):
+        # Frozen lists are tuples.
+
+        sb = StringBuilder()
+        dtype_name = dtype.get_name()
+        elem_dtype = dtype.get_elem_dtype()
+
+        freeze_expr = self._get_freeze_expr(elem_dtype, "elem", False)
+        thaw_expr = self._get_thaw_expr(elem_dtype, "elem", False)
+
+        sb.wl("def {}(l):".format(self._get_list_freeze_funcn(dtype_name)))
+
+        if freeze_expr == "elem":
+            sb.wl("\treturn tuple(l)")
+        else:
+            sb.wl("\treturn tuple([{} for elem in l])".format(freeze_expr))
+
+        sb.we()
+
+        sb.wl("def {}(l):".format(self._get_list_thaw_funcn(dtype_name)))
+
+        if thaw_expr == "elem":
+            sb.wl("\treturn list(l)")
+        else:
+            sb.wl("\treturn [{} for elem in l]".format(thaw_expr))
+
+        sb.we()
+
+        return sb.get_string()
+
+    def _gen_map_frozen(self, dtype):
+        # Frozen maps are frozensets of (key, value) tuples, keys are
+        # hashable already.
+
+        sb = StringBuilder()
+        dtype_name = dtype.get_name()
+        value_dtype = dtype.get_value_dtype()
+
+        freeze_expr = self._get_freeze_expr(value_dtype, "value", False)
+        thaw_expr = self._get_thaw_expr(value_dtype, "value", False)
+
+        sb.wl("def {}(m):".format(self._get_map_freeze_funcn(dtype_name)))
+
+        if freeze_expr == "value":
+            sb.wl("\treturn frozenset(m.items())")
+        else:
+            sb.wl("\treturn frozenset([(key, {}) for (key, value) in m.items()])".format(freeze_expr))
+
+        sb.we()
+
+        sb.wl("def {}(m):".format(self._get_map_thaw_funcn(dtype_name)))
+
+        if thaw_expr == "value":
+            sb.wl("\treturn dict(m)")
+        else:
+            sb.wl("\treturn {{key: {} for (key, value) in m}}".format(thaw_expr))
+
+        sb.we()
+
+        return sb.get_string()
+
+    def _get_tuple_expr(self, items):
+        expr = "({}{})".format(", ".join(items), "," if len(items) == 1 else "")
+
+        return expr
+
+    def _get_freeze_expr(self, dtype, v, nullable):
+        dtype_kind = dtype.get_dtype_kind()
+
+        if dtype_kind == DataTypeKind.BINARY:
+            # Binary may be bytearray or memoryview, which are not hashable.
+
+            expr = "bytes({})".format(v)
+        elif dtype_kind == DataTypeKind.LIST:
+            expr = "{}({})".format(self._get_list_freeze_funcn(dtype.get_name()), v)
+        elif dtype_kind == DataTypeKind.MAP:
+            expr = "{}({})".format(self._get_map_freeze_funcn(dtype.get_name()), v)
+        elif dtype_kind == DataTypeKind.STRUCT:
+            expr = "{}.{}()".format(v, _STRUCT_FREEZE)
+        else:
+            return v
+
+        if nullable:
+            expr = "{} if {} != None else None".format(expr, v)
+
+        return expr
+
+    def _get_thaw_expr(self, dtype, v, nullable):
+        dtype_kind = dtype.get_dtype_kind()
+
+        if dtype_kind == DataTypeKind.LIST:
+            expr = "{}({})".format(self._get_list_thaw_funcn(dtype.get_name()), v)
+        elif dtype_kind == DataTypeKind.MAP:
+            expr = "{}({})".format(self._get_map_thaw_funcn(dtype.get_name()), v)
+        elif dtype_kind == DataTypeKind.STRUCT:
+            expr = "{}.{}()".format(v, _STRUCT_THAW)
+        else:
+            return v
+
+        if nullable:
+            expr = "{} if {} != None else None".format(expr, v)
+
+        return expr
+
+    def _gen_struct_compact(self, sb, fields, sfa):
+        # Compact encoding: presence bitmap of optional fields, followed by
+        # the values in declaration order, without field headers.
+
+        opt_var_names = []
+
+        for field in fields:
+            if not field.get_req():
+                name = field.get_name()
+                var_name = self._get_struct_field_var_name(name, sfa)
+                opt_var_names.append(var_name)
+
+        presence = ["p{}".format(i) for i in range(len(opt_var_names))]
+
+        sb.wl("\tdef {}(self, codec):".format(_STRUCT_READ_COMPACT))
+        sb.wl("\t\tcodec.read_struct_begin()")
+        sb.we()
+
+        if len(presence) > 0:
+            sb.wl("\t\t({}{}) = codec.read_presence({})".format(", ".join(presence), "," if len(presence) == 1 else "", len(presence)))
+            sb.we()
+
+        i = 0
+
+        for field in fields:
+            req = field.get_req()
+            name = field.get_name()
+            var_name = self._get_struct_field_var_name(name, sfa)
+            indent = "\t\t"
+
+            if not req:
+                sb.wl("\t\tif {}:".format(presence[i]))
+                indent += "\t"
+                i += 1
+
+            s = self._read_field(field, var_name)
+            sb.wlsindent(indent, s)
+
+        if len(fields) > 0:
+            sb.we()
+
+        sb.wl("\t\tcodec.read_struct_end()")
+        sb.we()
+
+        sb.wl("\tdef {}(self, codec):".format(_STRUCT_WRITE_COMPACT))
+        sb.wl("\t\tcodec.write_struct_begin()")
+        sb.we()
+
+        if len(opt_var_names) > 0:
+            presencef = ", ".join(["{} != None".format(var_name) for var_name in opt_var_names])
+            sb.wl("\t\tcodec.write_presence(({}{}))".format(presencef, "," if len(opt_var_names) == 1 else ""))
+            sb.we()
+
+        for field in fields:
+            req = field.get_req()
+            name = field.get_name()
+            var_name = self._get_struct_field_var_name(name, sfa)
+            indent = "\t\t"
+
+            if not req:
+                sb.wl("\t\tif {} != None:".format(var_name))
+                indent += "\t"
+
+            s = self._write_field(field, var_name)
+            sb.wlsindent(indent, s)
+
+        if len(fields) > 0:
+            sb.we()
+
+        sb.wl("\t\tcodec.write_struct_end()")
+        sb.we()
+
+    def _read_field(self, field, v):
+        (compress, compress_min) = field.get_compress()
+
+        if compress == None:
+            return self._gtm.read_dtype(field.get_dtype(), v)
+
+        sb = StringBuilder()
+
+        sb.wl("{} = codec.read_{}_compressed()".format(v, field.get_dtype().get_name()))
+
+        return sb.get_string()
+
+    def _write_field(self, field, v):
+        (compress, compress_min) = field.get_compress()
+
+        if compress == None:
+            return self._gtm.write_dtype(field.get_dtype(), v)
+
+        sb = StringBuilder()
+
+        sb.wl("codec.write_{}_compressed({}, {}, {})".format(field.get_dtype().get_name(), v, self._get_compression_constn(compress), compress_min))
+
+        return sb.get_string()
+
+    def _get_compression_constn(self, method):
+        constn = "{}.{}".format(self._compression_classp, method.upper())
+
+        return constn
+
+    def _gen_desc(self, dtype, classn = None, sfa = None):
+        # Generate type descriptor (table serializer), classn and sfa
+        # have the same meaning as in _dtype_kind_struct_gen.
+
+        sb = StringBuilder()
+        dtype_name = dtype.get_name()
+        dtype_kind = dtype.get_dtype_kind()
+
+        if dtype_kind == DataTypeKind.ENUM:
+            values = dtype.get_values()
+            valuesf = ", ".join(values)
+            if len(values) == 1:
+                valuesf += ","
+
+            sb.wl("{} = {}.EnumDescriptor(\"{}\", ({}))".format(self._get_desc_varn(dtype_name), _DESC_MODULE, dtype_name, valuesf))
+            sb.we()
+        elif dtype_kind == DataTypeKind.LIST:
+            elem_desc = self._get_desc_expr(dtype.get_elem_dtype())
+
+            sb.wl("{} = {}.ListDescriptor(\"{}\", {})".format(self._get_desc_varn(dtype_name), _DESC_MODULE, dtype_name, elem_desc))
+            sb.we()
+        elif dtype_kind == DataTypeKind.MAP:
+            key_desc = self._get_desc_expr(dtype.get_key_dtype())
+            value_desc = self._get_desc_expr(dtype.get_value_dtype())
+
+            sb.wl("{} = {}.MapDescriptor(\"{}\", {}, {})".format(self._get_desc_varn(dtype_name), _DESC_MODULE, dtype_name, key_desc, value_desc))
+            sb.we()
+        elif (dtype_kind == DataTypeKind.STRUCT or
+              dtype_kind == DataTypeKind.EXC):
+            if classn == None:
+                classn = self._get_dtype_classn(dtype_name)
+
+            desc_varn = self._get_desc_varn(classn)
+
+            if sfa == None:
+                sfa = self._sfa
+
+            fields = dtype.get_fields()
+
+            sb.wl("{} = {}.StructDescriptor(\"{}\", {}, (".format(desc_varn, _DESC_MODULE, dtype_name, classn))
+
+            for field in fields:
+                fid = field.get_fid()
+                req = field.get_req()
+                name = field.get_name()
+                field_desc = self._get_desc_expr(field.get_dtype())
+
+                (compress, compress_min) = field.get_compress()
+                if compress != None:
+                    field_desc = "{}.CompressedDescriptor({}, {}, {})".format(_DESC_MODULE, field_desc, self._get_compression_constn(compress), compress_min)
+
+                # Attribute name is the variable name without "self.".
+
+                attr = self._get_struct_field_var_name(name, sfa).split(".", 1)[1]
+
+                sb.wl("\t{}.FieldDescriptor({}, \"{}\", \"{}\", {}, {}),".format(_DESC_MODULE, fid, name, attr, req, field_desc))
+
+            sb.wl("))")
+            sb.we()
+
         return sb.get_string()
 
     def _dtype_kind_struct_read(self, dtype, v):
@@ -801,11 +1440,51 @@ class PyGenerator(GeneratorBase):
 
         return funcn
 
+    def _get_list_freeze_funcn(self, name):
+        funcn = "{}_{}".format(self._list_freeze_funcp, name)
+
+        return funcn
+
+    def _get_list_thaw_funcn(self, name):
+        funcn = "{}_{}".format(self._list_thaw_funcp, name)
+
+        return funcn
+
+    def _get_frozen_classn(self, classn):
+        frozen_classn = "{}_{}".format(self._frozen_classp, classn)
+
+        return frozen_classn
+
+    def _get_list_iter_funcn(self, name):
+        funcn = "{}_{}".format(self._list_iter_funcp, name)
+
+        return funcn
+
     def _get_list_write_funcn(self, name):
         funcn = "{}_{}".format(self._list_write_funcp, name)
 
         return funcn
 
+    def _get_map_read_funcn(self, name):
+        funcn = "{}_{}".format(self._map_read_funcp, name)
+
+        return funcn
+
+    def _get_map_write_funcn(self, name):
+        funcn = "{}_{}".format(self._map_write_funcp, name)
+
+        return funcn
+
+    def _get_map_freeze_funcn(self, name):
+        funcn = "{}_{}".format(self._map_freeze_funcp, name)
+
+        return funcn
+
+    def _get_map_thaw_funcn(self, name):
+        funcn = "{}_{}".format(self._map_thaw_funcp, name)
+
+        return funcn
+
     def _get_args_seri_classn(self, name, prefix = ""):
         classn = "{}{}_{}".format(prefix, self._args_seri_classp, name)
 
@@ -825,6 +1504,21 @@ class PyGenerator(GeneratorBase):
 
         return classn
 
+    def _get_desc_varn(self, name):
+        varn = "{}_{}".format(self._desc_varp, name)
+
+        return varn
+
+    def _get_desc_expr(self, dtype):
+        # Primitive types have predefined descriptors.
+
+        if isinstance(dtype, PrimitiveType):
+            expr = "{}.{}".format(_DESC_MODULE, dtype.get_name().upper())
+        else:
+            expr = self._get_desc_varn(dtype.get_name())
+
+        return expr
+
     def _get_exc_handler_funcn(self, name):
         funcn = "{}_{}".format(self._exc_handler_funcp, name)
 
@@ -1,6 +1,8 @@
+import hashlib
+
 from abc import ABCMeta, abstractmethod
 
-from myrpcgen.Constants import RESULT_FIELD_NAME
+from myrpcgen.Constants import ENCODING, RESULT_FIELD_NAME
 from myrpcgen.ParserInternalException import ParserInternalException
 from myrpcgen.InternalException import InternalException
 
@@ -27,8 +29,24 @@ class DataTypeKind:
      ENUM,
      # Container types:
      LIST,
+     MAP,
      STRUCT,
-     EXC) = range(17)
+     EXC) = range(18)
+
+# Map keys are decoded into dict keys, therefore they have to be hashable.
+_MAP_KEY_DTYPE_KINDS = (DataTypeKind.STRING,
+                        DataTypeKind.BOOL,
+                        DataTypeKind.UI8,
+                        DataTypeKind.UI16,
+                        DataTypeKind.UI32,
+                        DataTypeKind.UI64,
+                        DataTypeKind.I8,
+                        DataTypeKind.I16,
+                        DataTypeKind.I32,
+                        DataTypeKind.I64,
+                        DataTypeKind.FLOAT,
+                        DataTypeKind.DOUBLE,
+                        DataTypeKind.ENUM)
 
 class TypeBase(metaclass = ABCMeta):
     """Base class of all data types."""
@@ -45,6 +63,11 @@ class TypeBase(metaclass = ABCMeta):
     def get_dtype_kind(self):
         return self._dtype_kind
 
+    def get_schema(self):
+        """Return canonical description of the type, used for schema fingerprint."""
+
+        return self._name
+
     def check_container_compat(self):
         if not self._container_compat:
             raise ParserInternalException("Type {} can't be used in containers".format(self._name))
@@ -85,6 +108,12 @@ class EnumType(TypeBase):
 
         self._entries[name] = value
 
+    def get_schema(self):
+        entries = ["{}={}".format(name, value) for (name, value) in self.get_entries()]
+        s = "enum {} ({})".format(self._name, ", ".join(entries))
+
+        return s
+
 class ListType(TypeBase):
     """Class for list types."""
 
@@ -101,6 +130,44 @@ class ListType(TypeBase):
 
         self._elem_dtype = elem_dtype
 
+    def get_schema(self):
+        s = "list {} {}".format(self._name, self._elem_dtype.get_name())
+
+        return s
+
+class MapType(TypeBase):
+    """Class for map types."""
+
+    def __init__(self, name):
+        super().__init__(name, DataTypeKind.MAP)
+
+        self._key_dtype = None
+        self._value_dtype = None
+
+    def get_key_dtype(self):
+        return self._key_dtype
+
+    def set_key_dtype(self, key_dtype):
+        key_dtype.check_container_compat()
+
+        if key_dtype.get_dtype_kind() not in _MAP_KEY_DTYPE_KINDS:
+            raise ParserInternalException("Type {} can't be used as map key".format(key_dtype.get_name()))
+
+        self._key_dtype = key_dtype
+
+    def get_value_dtype(self):
+        return self._value_dtype
+
+    def set_value_dtype(self, value_dtype):
+        value_dtype.check_container_compat()
+
+        self._value_dtype = value_dtype
+
+    def get_schema(self):
+        s = "map {} {} {}".format(self._name, self._key_dtype.get_name(), self._value_dtype.get_name())
+
+        return s
+
 class StructType(TypeBase):
     """Class for structure types."""
 
@@ -115,6 +182,11 @@ class StructType(TypeBase):
     def add_field(self, field):
         self._fieldh.add_field(field)
 
+    def get_schema(self):
+        s = "struct {} ({})".format(self._name, self._fieldh.get_schema())
+
+        return s
+
 class ExcType(TypeBase):
     """Class for exception types."""
 
@@ -130,6 +202,11 @@ class ExcType(TypeBase):
     def add_field(self, field):
         self._fieldh.add_field(field)
 
+    def get_schema(self):
+        s = "exception {} ({})".format(self._name, self._fieldh.get_schema())
+
+        return s
+
 class Method:
     """Represent a method (methods live outside TypeManager namespace)."""
 
@@ -178,6 +255,15 @@ class Method:
 
         self._excs[name] = exc
 
+    def get_schema(self):
+        excs = sorted(self._excs.keys())
+        s = "method {} {} {} throw ({})".format(self._name,
+                                               self._in_struct.get_schema(),
+                                               self._out_struct.get_schema(),
+                                               ", ".join(excs))
+
+        return s
+
     def finalize(self):
         # Return value is handled by creating a struct with one element.
 
@@ -193,6 +279,8 @@ class Field:
         self._req = req
         self._dtype = dtype
         self._name = name
+        self._compress = None
+        self._compress_min = 0
 
     def get_fid(self):
         return self._fid
@@ -206,6 +294,31 @@ class Field:
     def get_name(self):
         return self._name
 
+    def get_compress(self):
+        """Return (method, min_size) tuple, method is None if the field is not compressed."""
+
+        return (self._compress, self._compress_min)
+
+    def set_compress(self, method, min_size):
+        if self._dtype.get_dtype_kind() not in (DataTypeKind.BINARY, DataTypeKind.STRING):
+            raise ParserInternalException("Field {} can't be compressed, binary or string expected".format(self._name))
+
+        self._compress = method
+        self._compress_min = min_size
+
+    def get_schema(self):
+        s = "{} {} {} {}".format(self._fid,
+                                 "required" if self._req else "optional",
+                                 self._dtype.get_name(),
+                                 self._name)
+
+        # Compression changes the wire format.
+
+        if self._compress != None:
+            s += " compress={} min={}".format(self._compress, self._compress_min)
+
+        return s
+
 class FieldHandler:
     """Handler for fields."""
 
@@ -236,6 +349,13 @@ class FieldHandler:
     def get_fields(self):
         return self._fields
 
+    def get_schema(self):
+        # Declaration order matters (e.g. compact encoding), keep it.
+
+        s = "; ".join([field.get_schema() for field in self._fields])
+
+        return s
+
 class TypeManager:
     """Type manager."""
 
@@ -271,6 +391,27 @@ class TypeManager:
 
         return dtypes
 
+    def get_schema_fingerprint(self, methods):
+        """Calculate 64 bit fingerprint of user-defined types and methods.
+
+        Peers generated from IDLs with the same fingerprint have identical
+        wire-level schema.
+        """
+
+        lines = []
+
+        for dtype in sorted(self._dtypes.values(), key = lambda dtype: dtype.get_name()):
+            if not isinstance(dtype, PrimitiveType):
+                lines.append(dtype.get_schema())
+
+        for method in sorted(methods, key = lambda method: method.get_name()):
+            lines.append(method.get_schema())
+
+        digest = hashlib.sha256("\n".join(lines).encode(ENCODING)).digest()
+        fingerprint = int.from_bytes(digest[:8], "big")
+
+        return fingerprint
+
     def _register_primitive_dtypes(self):
         self.register_dtype(PrimitiveType("binary", DataTypeKind.BINARY))
         self.register_dtype(PrimitiveType("string", DataTypeKind.STRING))
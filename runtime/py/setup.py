@@ -10,6 +10,7 @@ config = create_config({"name": "myrpc-runtime",
                         "package_dir": {"myrpc": "src"},
                         "packages": ("myrpc",
                                      "myrpc.codec",
+                                     "myrpc.server",
                                      "myrpc.transport",
                                      "myrpc.util")})
 
@@ -54,6 +54,12 @@ class MessageBodyException(MessageDecodeException):
     def __init__(self, msg):
         super().__init__(msg)
 
+class MessageLimitException(MessageDecodeException):
+    """Thrown by codec or transport if the received message exceeds a configured limit."""
+
+    def __init__(self, msg):
+        super().__init__(msg)
+
 class ServerErrorException(MyRPCException):
     """Thrown by client code if ERROR message is received from server."""
 
@@ -1,10 +1,27 @@
 import struct
+import zlib
 
-from myrpc.Common import MyRPCInternalException, MessageHeaderException, MessageBodyException
-from myrpc.codec.CodecBase import FID_STOP, MessageType, DataType, CallRequestMessage, CallResponseMessage, CallExceptionMessage, ErrorMessage, CodecBase
+from myrpc.Common import MyRPCInternalException, MessageEncodeException, MessageTruncatedException, MessageHeaderException, MessageBodyException, MessageLimitException
+from myrpc.codec.CodecBase import FID_STOP, MessageType, DataType, Compression, CallRequestMessage, CallResponseMessage, CallExceptionMessage, ErrorMessage, CodecBase, FINGERPRINT_MISMATCH
+
+VERSION_1 = 0x0001
+VERSION_2 = 0x0002
+
+# Size of the fixed part of version 2 header: signature, version, message type,
+# flags and length.
+HEADER_SIZE_V2 = 10
 
 _SIGNATURE = 0x5341
-_VERSION = 0x0001
+_VERSIONS = (VERSION_1, VERSION_2)
+_HEADER_PREFIX_FORMAT = "!HH"
+_HEADER_PREFIX_SIZE = 4
+_HEADER_FORMAT_V2 = "!HHBBI"
+_FLAG_COMPACT = 0x01
+_FLAG_REQUEST_ID = 0x02
+_FLAGS = _FLAG_COMPACT | _FLAG_REQUEST_ID
+_REQUEST_ID_FORMAT = "!I"
+_REQUEST_ID_SIZE = 4
+_LIST_CHUNKED = 0xffffffff
 _ENCODING = "utf-8"
 _FORMAT = {"B": 1,
            "H": 2,
@@ -18,21 +35,183 @@ _FORMAT = {"B": 1,
            "d": 8}
 
 class BinaryCodec(CodecBase):
-    """Provide binary-based codec."""
+    """Provide binary-based codec.
+
+    Version 1 header doesn't carry the message length, version 2 header
+    does (the length of the message following the fixed part of the header).
+    Messages are written with the version configured by set_version, but
+    once a message is received, the version of the peer is used for writing.
+    Therefore replies are always written with the version of the request, and
+    clients fall back to version 1 if the server doesn't support version 2.
+
+    Compact struct encoding is negotiated the same way: it is used if version 2
+    is used and the schema fingerprints (myrpc_schema_fingerprint in the
+    generated Types module) of the peers are the same. Servers reject
+    compact messages with different fingerprint (the ERROR reply is written
+    without compact encoding), and clients fall back to the non-compact
+    encoding, repeating the rejected call.
+
+    Request ids can only be carried by version 2 header, therefore messages
+    with request id are always written with version 2.
+    """
+
+    SIGNATURE = struct.pack("!H", _SIGNATURE)
+    CONTENT_TYPE = "application/x-myrpc-binary"
 
     def __init__(self):
         super().__init__()
 
+        self._version = VERSION_1
+        self._fingerprint = None
+        self._peer_version = None
+        self._peer_compact = False
+        self._rend = None
+        self._rcompact = False
+        self._rlists = []
+        self._wbody = None
+        self._wcompact = False
+        self._zero_copy = False
+
+    def set_version(self, version):
+        if version not in _VERSIONS:
+            raise ValueError("Unknown version {}".format(version))
+
+        self._version = version
+
+    def set_schema_fingerprint(self, fingerprint):
+        """Enable compact encoding for the specified schema (None disables it)."""
+
+        self._fingerprint = fingerprint
+
+    def get_schema_fingerprint(self):
+        return self._fingerprint
+
+    def set_zero_copy(self, enabled):
+        """Decode binary values as read-only memoryviews of the received message.
+
+        By default binary values are decoded as bytes. With zero-copy, they
+        reference the buffer of the transport instead of copying it (and keep
+        the buffer alive), if the transport allows it (see
+        TransportBase.can_share_read_buffer).
+        """
+
+        self._zero_copy = enabled
+
+    @staticmethod
+    def peek_message_size(buf):
+        """Return the total size of message, based on the first HEADER_SIZE_V2 bytes of buf.
+
+        Only version 2 header carries the message length, None is returned
+        for version 1 messages (4 bytes are enough to detect them).
+        """
+
+        # Signature and version are common to all versions.
+
+        if len(buf) < _HEADER_PREFIX_SIZE:
+            raise MessageTruncatedException()
+
+        (signature, version) = struct.unpack_from(_HEADER_PREFIX_FORMAT, buf)
+        if signature != _SIGNATURE:
+            raise MessageHeaderException("Invalid message signature")
+
+        if version == VERSION_1:
+            return None
+        elif version != VERSION_2:
+            raise MessageHeaderException("Unknown message version")
+
+        if len(buf) < HEADER_SIZE_V2:
+            raise MessageTruncatedException()
+
+        (signature, version, mtype, flags, length) = struct.unpack_from(_HEADER_FORMAT_V2, buf)
+
+        return HEADER_SIZE_V2 + length
+
+    @staticmethod
+    def peek_request_id(buf):
+        """Return the request id of the message in buf (None if it has no request id)."""
+
+        # Signature and version are common to all versions.
+
+        if len(buf) < _HEADER_PREFIX_SIZE:
+            raise MessageTruncatedException()
+
+        (signature, version) = struct.unpack_from(_HEADER_PREFIX_FORMAT, buf)
+        if signature != _SIGNATURE:
+            raise MessageHeaderException("Invalid message signature")
+
+        if version == VERSION_1:
+            return None
+        elif version != VERSION_2:
+            raise MessageHeaderException("Unknown message version")
+
+        if len(buf) < HEADER_SIZE_V2:
+            raise MessageTruncatedException()
+
+        (signature, version, mtype, flags, length) = struct.unpack_from(_HEADER_FORMAT_V2, buf)
+        if not flags & _FLAG_REQUEST_ID:
+            return None
+
+        if len(buf) < HEADER_SIZE_V2 + _REQUEST_ID_SIZE:
+            raise MessageTruncatedException()
+
+        (request_id,) = struct.unpack_from(_REQUEST_ID_FORMAT, buf, HEADER_SIZE_V2)
+
+        return request_id
+
     def read_message_begin(self):
+        self._reset_limits()
+        self._rend = None
+        self._rcompact = False
+        self._rlists = []
+
+        # Until the header is read successfully, the peer is unknown (replies to
+        # invalid messages are written with the configured settings).
+
+        self._peer_version = None
+        self._peer_compact = False
+
         signature = self.read_ui16()
         if signature != _SIGNATURE:
             raise MessageHeaderException("Invalid message signature")
 
         version = self.read_ui16()
-        if version != _VERSION:
+        if version not in _VERSIONS:
             raise MessageHeaderException("Unknown message version")
 
         mtype = self.read_ui8()
+        request_id = None
+
+        if version == VERSION_2:
+            flags = self.read_ui8()
+            if flags & ~_FLAGS:
+                raise MessageHeaderException("Unknown message flags {}".format(flags))
+
+            # Reject oversized messages before reading the body.
+
+            length = self.read_ui32()
+            rend = HEADER_SIZE_V2 + length
+
+            if (self._max_message_size != None and
+                rend > self._max_message_size):
+                raise MessageLimitException("Message size {} exceeds {} bytes".format(rend, self._max_message_size))
+
+            self._rend = rend
+
+            if flags & _FLAG_REQUEST_ID:
+                request_id = self.read_ui32()
+
+            if flags & _FLAG_COMPACT:
+                fingerprint = self.read_ui64()
+                if fingerprint != self._fingerprint:
+                    # Reply uncompacted, the peer can read that with any schema.
+
+                    self._peer_version = version
+                    self._peer_compact = False
+
+                    raise MessageHeaderException(FINGERPRINT_MISMATCH)
+
+                self._rcompact = True
+
         if mtype == MessageType.CALL_REQUEST:
             name = self.read_string(True)
             msg = CallRequestMessage(name)
@@ -47,14 +226,55 @@ class BinaryCodec(CodecBase):
         else:
             raise MessageHeaderException("Unknown message type {}".format(mtype))
 
+        msg.set_request_id(request_id)
+
+        # Header is valid, use the version of the peer from now on.
+
+        self._peer_version = version
+        self._peer_compact = self._rcompact
+
         return msg
 
     def write_message_begin(self, msg):
         mtype = msg.get_mtype()
+        request_id = msg.get_request_id()
+
+        if self._peer_version != None:
+            version = self._peer_version
+            compact = self._peer_compact
+        else:
+            version = self._version
+            compact = (self._fingerprint != None)
+
+        if request_id != None:
+            version = VERSION_2
+
+        # Drop leftover of a previously failed write.
+
+        self._wbody = None
+        self._wcompact = False
+
+        if version == VERSION_1:
+            self.write_ui16(_SIGNATURE)
+            self.write_ui16(VERSION_1)
+            self.write_ui8(mtype)
+        else:
+            # Collect the rest of the message, the header is written in
+            # write_message_end when the length is known.
+
+            self._wmtype = mtype
+            self._wflags = _FLAG_COMPACT if compact else 0
+            self._wbody = []
+            self._wbody_len = 0
+
+            if request_id != None:
+                self._wflags |= _FLAG_REQUEST_ID
+                self.write_ui32(request_id)
 
-        self.write_ui16(_SIGNATURE)
-        self.write_ui16(_VERSION)
-        self.write_ui8(mtype)
+            if compact:
+                self.write_ui64(self._fingerprint)
+
+            self._wcompact = compact
 
         if mtype == MessageType.CALL_REQUEST:
             name = msg.get_name()
@@ -71,35 +291,116 @@ class BinaryCodec(CodecBase):
             raise MyRPCInternalException("Unknown message type ".format(mtype))
 
     def read_message_end(self):
-        pass
+        if (self._rend != None and
+            self._message_size != self._rend):
+            raise MessageBodyException("Message length mismatch")
 
     def write_message_end(self):
-        pass
+        if self._wbody == None:
+            return
+
+        # The body is buffered until the message is complete, since the
+        # header carries its length (chunked lists are buffered too).
+
+        (body, self._wbody) = (self._wbody, None)
+
+        buf = struct.pack(_HEADER_FORMAT_V2, _SIGNATURE, VERSION_2, self._wmtype, self._wflags, self._wbody_len)
+        self._tr.write(buf)
+
+        for buf in body:
+            self._tr.write(buf)
 
     def read_list_begin(self):
+        self._enter()
+
         llen = self.read_ui32()
+        chunked = (llen == _LIST_CHUNKED)
         dtype = self._read_dtype()
 
+        if not chunked:
+            self._check_list_chunk(llen, llen, dtype)
+
+        # Track chunked state, total length and element type of nested lists.
+
+        rlist = [chunked, 0, dtype]
+        self._rlists.append(rlist)
+
+        if chunked:
+            llen = self.read_list_chunk()
+
         return (llen, dtype)
 
     def write_list_begin(self, llen, dtype):
+        if llen == None:
+            llen = _LIST_CHUNKED
+        elif llen >= _LIST_CHUNKED:
+            raise MessageEncodeException("List length {} is too large".format(llen))
+
         self.write_ui32(llen)
         self._write_dtype(dtype)
 
+    def read_list_chunk(self):
+        rlist = self._rlists[-1]
+        if not rlist[0]:
+            return 0
+
+        count = self.read_ui32()
+        rlist[1] += count
+
+        self._check_list_chunk(count, rlist[1], rlist[2])
+
+        return count
+
+    def write_list_chunk(self, count):
+        self.write_ui32(count)
+
     def read_list_end(self):
-        pass
+        self._rlists.pop()
+        self._leave()
 
     def write_list_end(self):
         pass
 
-    def read_struct_begin(self):
+    def read_map_begin(self):
+        self._enter()
+
+        mlen = self.read_ui32()
+        self._check_list_len(mlen)
+
+        key_dtype = self._read_dtype()
+        value_dtype = self._read_dtype()
+
+        min_size = self._get_min_size(key_dtype) + self._get_min_size(value_dtype)
+
+        if (self._rend != None and
+            min_size > 0 and
+            mlen > (self._rend - self._message_size) // min_size):
+            raise MessageBodyException("Map length {} exceeds message length".format(mlen))
+
+        return (mlen, key_dtype, value_dtype)
+
+    def write_map_begin(self, mlen, key_dtype, value_dtype):
+        if mlen > 0xffffffff:
+            raise MessageEncodeException("Map length {} is too large".format(mlen))
+
+        self.write_ui32(mlen)
+        self._write_dtype(key_dtype)
+        self._write_dtype(value_dtype)
+
+    def read_map_end(self):
+        self._leave()
+
+    def write_map_end(self):
         pass
 
+    def read_struct_begin(self):
+        self._enter()
+
     def write_struct_begin(self):
         pass
 
     def read_struct_end(self):
-        pass
+        self._leave()
 
     def write_struct_end(self):
         pass
@@ -126,25 +427,41 @@ class BinaryCodec(CodecBase):
     def write_field_stop(self):
         self.write_ui16(FID_STOP)
 
+    def is_read_compact(self):
+        return self._rcompact
+
+    def is_write_compact(self):
+        return self._wcompact
+
+    def read_presence(self, count):
+        buf = self._read((count + 7) // 8)
+        flags = [(buf[i >> 3] >> (i & 7)) & 1 != 0 for i in range(count)]
+
+        return flags
+
+    def write_presence(self, flags):
+        buf = bytearray((len(flags) + 7) // 8)
+
+        for (i, flag) in enumerate(flags):
+            if flag:
+                buf[i >> 3] |= 1 << (i & 7)
+
+        self._write(bytes(buf))
+
     def read_binary(self):
-        buflen = self.read_ui32()
-        buf = self._tr.read(buflen)
+        buf = self._read_binary_view()
+        buf = self._export_binary(buf)
 
         return buf
 
     def write_binary(self, buf):
         buflen = len(buf)
         self.write_ui32(buflen)
-        self._tr.write(buf)
+        self._write(buf)
 
     def read_string(self, _in_header = False):
-        buf = self.read_binary()
-        try:
-            s = buf.decode(_ENCODING)
-        except UnicodeError:
-            msg = "Can't decode unicode string"
-            exc = MessageHeaderException(msg) if _in_header else MessageBodyException(msg)
-            raise exc
+        buf = self._read_binary_view()
+        s = self._decode_string(buf, _in_header)
 
         return s
 
@@ -152,6 +469,42 @@ class BinaryCodec(CodecBase):
         buf = s.encode(_ENCODING)
         self.write_binary(buf)
 
+    def read_binary_compressed(self):
+        buf = self._read_binary_compressed_view()
+        buf = self._export_binary(buf)
+
+        return buf
+
+    def write_binary_compressed(self, buf, method, min_size):
+        if method not in (Compression.NONE, Compression.ZLIB):
+            raise MyRPCInternalException("Unknown compression method {}".format(method))
+
+        if (method == Compression.ZLIB and
+            len(buf) >= min_size):
+            cbuf = zlib.compress(buf)
+
+            # Don't send incompressible (e.g. already compressed) data
+            # compressed.
+
+            if len(cbuf) < len(buf):
+                self.write_ui8(method)
+                self.write_binary(cbuf)
+
+                return
+
+        self.write_ui8(Compression.NONE)
+        self.write_binary(buf)
+
+    def read_string_compressed(self):
+        buf = self._read_binary_compressed_view()
+        s = self._decode_string(buf, False)
+
+        return s
+
+    def write_string_compressed(self, s, method, min_size):
+        buf = s.encode(_ENCODING)
+        self.write_binary_compressed(buf, method, min_size)
+
     def read_bool(self):
         b = self.read_ui8()
 
@@ -240,6 +593,101 @@ class BinaryCodec(CodecBase):
     def write_double(self, f):
         self._write_num("d", f)
 
+    def _read_binary_view(self):
+        # Return the binary as returned by the transport (it may be a view
+        # of the transport's buffer).
+
+        buflen = self.read_ui32()
+        self._check_binary_len(buflen)
+
+        if (self._rend != None and
+            buflen > self._rend - self._message_size):
+            raise MessageBodyException("Binary length {} exceeds message length".format(buflen))
+
+        buf = self._read(buflen)
+
+        return buf
+
+    def _read_binary_compressed_view(self):
+        method = self.read_ui8()
+        buf = self._read_binary_view()
+
+        if method == Compression.NONE:
+            pass
+        elif method == Compression.ZLIB:
+            buf = self._decompress_zlib(buf)
+        else:
+            raise MessageBodyException("Unknown compression method {}".format(method))
+
+        return buf
+
+    def _export_binary(self, buf):
+        # Binary values passed to the application are bytes, or read-only
+        # views if zero-copy is enabled and the transport allows it.
+
+        if (self._zero_copy and
+            self._tr.can_share_read_buffer()):
+            if isinstance(buf, memoryview):
+                buf = buf.toreadonly()
+        else:
+            buf = bytes(buf)
+
+        return buf
+
+    def _check_list_chunk(self, count, total, dtype):
+        self._check_list_len(total)
+
+        min_size = self._get_min_size(dtype)
+
+        if (self._rend != None and
+            min_size > 0 and
+            count > (self._rend - self._message_size) // min_size):
+            raise MessageBodyException("List length {} exceeds message length".format(count))
+
+    def _get_min_size(self, dtype):
+        # Lower bound of the encoded size of a value: compact structs
+        # without fields are empty, every other value takes at least one
+        # byte.
+
+        if (dtype == DataType.STRUCT and
+            self._rcompact):
+            return 0
+
+        return 1
+
+    def _decode_string(self, buf, in_header):
+        # Transports may return memoryview (see MmapTransport), which doesn't
+        # have decode().
+
+        try:
+            s = str(buf, _ENCODING)
+        except UnicodeError:
+            msg = "Can't decode unicode string"
+            exc = MessageHeaderException(msg) if in_header else MessageBodyException(msg)
+            raise exc
+
+        return s
+
+    def _decompress_zlib(self, buf):
+        # Decompressed size is subject to the limits, don't inflate more
+        # than that (one byte more is inflated to detect the overflow).
+
+        max_len = self._get_max_inflated_len(len(buf))
+        d = zlib.decompressobj()
+
+        try:
+            dbuf = d.decompress(buf, max_len + 1)
+        except zlib.error:
+            raise MessageBodyException("Can't decompress data")
+
+        self._check_inflated_len(len(buf), len(dbuf))
+
+        if (not d.eof or
+            len(d.unused_data) > 0):
+            raise MessageBodyException("Can't decompress data")
+
+        return dbuf
+
     def _read_dtype(self):
         dtype = self.read_ui8()
         if dtype >= DataType._MAX:
@@ -255,11 +703,25 @@ class BinaryCodec(CodecBase):
 
     def _read_num(self, fmt):
         buflen = _FORMAT[fmt]
-        buf = self._tr.read(buflen)
+        buf = self._read(buflen)
         (n,) = struct.unpack("!" + fmt, buf)
 
         return n
 
+    def _read(self, count):
+        self._check_message_size(count)
+
+        buf = self._tr.read(count)
+
+        return buf
+
     def _write_num(self, fmt, n):
         buf = struct.pack("!" + fmt, n)
-        self._tr.write(buf)
+        self._write(buf)
+
+    def _write(self, buf):
+        if self._wbody != None:
+            self._wbody.append(buf)
+            self._wbody_len += len(buf)
+        else:
+            self._tr.write(buf)
@@ -1,7 +1,21 @@
+import itertools
+
 from abc import ABCMeta, abstractmethod
 
+from myrpc.Common import MessageEncodeException, MessageBodyException, MessageLimitException
+
 FID_STOP = 0xffff
 
+# Number of elements in a chunk of chunked lists (see CodecBase.split_list).
+LIST_CHUNK_LEN = 1024
+
+# Maximal size of decompressed values if no limit applies (see CodecLimits).
+MAX_INFLATED_SIZE = 64 * 1024 * 1024
+
+# Error message of servers rejecting compact messages written with a different
+# schema fingerprint. Clients repeat such calls without compact encoding.
+FINGERPRINT_MISMATCH = "Schema fingerprint mismatch"
+
 class MessageType:
     """Represent message type.
 
@@ -36,22 +50,43 @@ class DataType:
      ENUM,
      LIST,
      STRUCT,
-     _MAX) = range(17)
+     MAP,
+     _MAX) = range(18)
+
+class Compression:
+    """Compression methods of compressed fields.
+
+    Values are sent on the wire, see read_binary_compressed.
+    """
+
+    (NONE,
+     ZLIB) = range(2)
 
 class MessageBase(metaclass = ABCMeta):
     """Base class for messages.
 
     Message classes represent only information, the actual
     (de)serialization is done in codec implementation classes.
+
+    The optional request id (None if not present) is used to match
+    replies to requests if more requests are in flight on the same
+    connection: replies carry the request id of the request.
     """
 
     @abstractmethod
     def __init__(self, mtype):
         self._mtype = mtype
+        self._request_id = None
 
     def get_mtype(self):
         return self._mtype
 
+    def get_request_id(self):
+        return self._request_id
+
+    def set_request_id(self, request_id):
+        self._request_id = request_id
+
 class CallRequestMessage(MessageBase):
     """CALL_REQUEST message (name: method to call)."""
 
@@ -91,6 +126,41 @@ class ErrorMessage(MessageBase):
     def get_err_msg(self):
         return self._err_msg
 
+class CodecLimits:
+    """Limits applied during decoding (None means unlimited).
+
+    Limits:
+     - max_message_size: maximal size of a message in bytes.
+     - max_list_len: maximal number of list elements (map entries).
+     - max_binary_len: maximal size of binary and string in bytes.
+     - max_depth: maximal nesting depth of structs and lists (method
+       arguments and results are structs, so they are at depth 1).
+
+    Limits are checked before the data is read from the transport,
+    therefore oversized lengths never cause allocation. Decompressed
+    values count toward max_message_size with their decompressed size,
+    and they are never inflated beyond the limits (or MAX_INFLATED_SIZE,
+    if there are no limits).
+    """
+
+    def __init__(self, max_message_size = None, max_list_len = None, max_binary_len = None, max_depth = None):
+        self._max_message_size = max_message_size
+        self._max_list_len = max_list_len
+        self._max_binary_len = max_binary_len
+        self._max_depth = max_depth
+
+    def get_max_message_size(self):
+        return self._max_message_size
+
+    def get_max_list_len(self):
+        return self._max_list_len
+
+    def get_max_binary_len(self):
+        return self._max_binary_len
+
+    def get_max_depth(self):
+        return self._max_depth
+
 class CodecBase(metaclass = ABCMeta):
     """Base class for codec implementation classes.
 
@@ -101,12 +171,128 @@ class CodecBase(metaclass = ABCMeta):
        subclass).
     """
 
+    # Leading bytes of every message written by the codec, and the content
+    # type of the messages (None if there is no specific one), see
+    # CodecRegistry.
+    SIGNATURE = None
+    CONTENT_TYPE = None
+
     def __init__(self):
         self._tr = None
 
+        self.set_limits(CodecLimits())
+
+    @staticmethod
+    def peek_request_id(buf):
+        """Return the request id of the message in buf, without decoding the message.
+
+        None is returned if the message doesn't have request id (or the
+        codec doesn't support request ids).
+        """
+
+        return None
+
     def set_transport(self, tr):
         self._tr = tr
 
+    def get_limits(self):
+        return self._limits
+
+    def set_limits(self, limits):
+        self._limits = limits
+
+        # Cache limits, they are consulted on every read.
+
+        self._max_message_size = limits.get_max_message_size()
+        self._max_list_len = limits.get_max_list_len()
+        self._max_binary_len = limits.get_max_binary_len()
+        self._max_depth = limits.get_max_depth()
+
+        self._reset_limits()
+
+    def split_list(self, l):
+        """Split iterable into lists of at most LIST_CHUNK_LEN elements.
+
+        Used for writing chunked lists, see write_list_begin.
+        """
+
+        it = iter(l)
+
+        while True:
+            chunk = list(itertools.islice(it, LIST_CHUNK_LEN))
+            if len(chunk) == 0:
+                break
+
+            yield chunk
+
+    def _reset_limits(self):
+        """Reset per-message counters, implementations call it when a new message is read."""
+
+        self._message_size = 0
+        self._inflated_size = 0
+        self._depth = 0
+
+    def _check_message_size(self, count):
+        """Account count bytes to be read from the current message."""
+
+        self._message_size += count
+
+        if (self._max_message_size != None and
+            self._message_size + self._inflated_size > self._max_message_size):
+            raise MessageLimitException("Message size exceeds {} bytes".format(self._max_message_size))
+
+    def _get_max_inflated_len(self, buflen):
+        """Return the maximal size of a value decompressed from buflen bytes (already accounted)."""
+
+        max_len = MAX_INFLATED_SIZE
+
+        if self._max_binary_len != None:
+            max_len = min(max_len, self._max_binary_len)
+
+        if self._max_message_size != None:
+            remaining = self._max_message_size - self._message_size - self._inflated_size
+            max_len = min(max_len, buflen + max(0, remaining))
+
+        return max_len
+
+    def _check_inflated_len(self, buflen, inflated_len):
+        """Account the value decompressed from buflen bytes to inflated_len bytes."""
+
+        if inflated_len > MAX_INFLATED_SIZE:
+            raise MessageLimitException("Decompressed size exceeds {} bytes".format(MAX_INFLATED_SIZE))
+
+        self._check_binary_len(inflated_len)
+
+        # The compressed data is already accounted.
+
+        self._inflated_size += max(0, inflated_len - buflen)
+
+        if (self._max_message_size != None and
+            self._message_size + self._inflated_size > self._max_message_size):
+            raise MessageLimitException("Decompressed message size exceeds {} bytes".format(self._max_message_size))
+
+    def _check_list_len(self, llen):
+        if (self._max_list_len != None and
+            llen > self._max_list_len):
+            raise MessageLimitException("List length {} exceeds {}".format(llen, self._max_list_len))
+
+    def _check_binary_len(self, buflen):
+        if (self._max_binary_len != None and
+            buflen > self._max_binary_len):
+            raise MessageLimitException("Binary length {} exceeds {}".format(buflen, self._max_binary_len))
+
+    def _enter(self):
+        """Enter a nested struct, list or map."""
+
+        self._depth += 1
+
+        if (self._max_depth != None and
+            self._depth > self._max_depth):
+            raise MessageLimitException("Nesting depth exceeds {}".format(self._max_depth))
+
+    def _leave(self):
+        self._depth -= 1
+
     @abstractmethod
     def read_message_begin(self):
         pass
@@ -129,8 +315,31 @@ class CodecBase(metaclass = ABCMeta):
 
     @abstractmethod
     def write_list_begin(self, llen, dtype):
+        """Begin writing a list.
+
+        If llen is None, then the list is chunked: every chunk of elements is
+        preceded by write_list_chunk(count), and the list is terminated by
+        write_list_chunk(0). Chunked lists can be written without knowing
+        the number of elements in advance.
+        """
+
         pass
 
+    def read_list_chunk(self):
+        """Return the number of elements in the next chunk of the list.
+
+        read_list_begin returns the number of elements in the first chunk
+        (or in the whole list, if it is not chunked). After these elements
+        are read, read_list_chunk has to be called until it returns 0.
+        For not chunked lists, it returns 0 immediately. Codecs not
+        supporting chunked lists don't have to override the chunk methods.
+        """
+
+        return 0
+
+    def write_list_chunk(self, count):
+        raise MessageEncodeException("Chunked lists are not supported by {}".format(type(self).__name__))
+
     @abstractmethod
     def read_list_end(self):
         pass
@@ -139,6 +348,24 @@ class CodecBase(metaclass = ABCMeta):
     def write_list_end(self):
         pass
 
+    def read_map_begin(self):
+        """Begin reading a map, return (mlen, key dtype, value dtype).
+
+        mlen keys and values follow, interleaved. Codecs not supporting
+        maps don't have to override the map methods.
+        """
+
+        raise MessageBodyException("Maps are not supported by {}".format(type(self).__name__))
+
+    def write_map_begin(self, mlen, key_dtype, value_dtype):
+        raise MessageEncodeException("Maps are not supported by {}".format(type(self).__name__))
+
+    def read_map_end(self):
+        pass
+
+    def write_map_end(self):
+        pass
+
     @abstractmethod
     def read_struct_begin(self):
         pass
@@ -175,6 +402,33 @@ class CodecBase(metaclass = ABCMeta):
     def write_field_stop(self):
         pass
 
+    def is_read_compact(self):
+        """Return True if structs of the message being read use compact encoding.
+
+        Compact encoding is written by generated code: presence bitmap
+        of optional fields (see read_presence), followed by the field
+        values in declaration order. Codecs not supporting it don't have
+        to override the compact methods.
+        """
+
+        return False
+
+    def is_write_compact(self):
+        """Return True if structs of the message being written use compact encoding."""
+
+        return False
+
+    def read_presence(self, count):
+        """Read presence bitmap of count fields, return a list of bools."""
+
+        flags = [self.read_bool() for i in range(count)]
+
+        return flags
+
+    def write_presence(self, flags):
+        for flag in flags:
+            self.write_bool(flag)
+
     @abstractmethod
     def read_binary(self):
         pass
@@ -191,6 +445,32 @@ class CodecBase(metaclass = ABCMeta):
     def write_string(self, s):
         pass
 
+    def read_binary_compressed(self):
+        """Read binary written by write_binary_compressed, and decompress it."""
+
+        buf = self.read_binary()
+
+        return buf
+
+    def write_binary_compressed(self, buf, method, min_size):
+        """Write binary compressed by method (see Compression).
+
+        Only buffers of at least min_size bytes are compressed. If compression
+        doesn't reduce the size, then the buffer is written uncompressed.
+        Codecs not supporting compression don't have to override the
+        compressed methods, values are written uncompressed.
+        """
+
+        self.write_binary(buf)
+
+    def read_string_compressed(self):
+        s = self.read_string()
+
+        return s
+
+    def write_string_compressed(self, s, method, min_size):
+        self.write_string(s)
+
     @abstractmethod
     def read_bool(self):
         pass
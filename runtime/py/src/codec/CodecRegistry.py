@@ -0,0 +1,120 @@
+from myrpc.Common import MessageHeaderException
+from myrpc.transport.TransportBase import TransportException
+from myrpc.codec.BinaryCodec import BinaryCodec
+
+class CodecRegistry:
+    """Registry of codecs served on the same endpoint.
+
+    Pass the registry to Processor.process_one instead of a codec: the codec
+    of every request is selected by the first bytes of the message (see
+    CodecBase.SIGNATURE). Signatures are matched by prefix, and the longest
+    matching one wins, therefore a codec can be registered for a specific
+    version by including the version in its signature. If more codecs
+    have the same signature, the one registered for the content type of
+    the transport (see TransportBase.set_content_type) is preferred.
+
+    The reply is written with the same codec, and the content type of the
+    transport is set to the content type of the codec.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._signature_len = 0
+
+    def register(self, factory, signature = None, content_type = None):
+        """Register factory (a callable returning a new codec instance).
+
+        signature and content_type default to the SIGNATURE and CONTENT_TYPE
+        of the codec. The first registered codec is the default one, it is
+        used for replying to unrecognized messages.
+        """
+
+        codec = factory()
+
+        if signature == None:
+            signature = codec.SIGNATURE
+
+        if content_type == None:
+            content_type = codec.CONTENT_TYPE
+
+        if signature == None:
+            raise ValueError("Codec has no signature")
+
+        if content_type != None:
+            content_type = content_type.lower()
+
+        entry = (bytes(signature), content_type, factory)
+        self._entries.append(entry)
+
+        self._signature_len = max(self._signature_len, len(signature))
+
+    def get_default(self):
+        """Return (factory, content type) of the default codec."""
+
+        if len(self._entries) == 0:
+            raise ValueError("No codec is registered")
+
+        (signature, content_type, factory) = self._entries[0]
+
+        return (factory, content_type)
+
+    def lookup(self, tr):
+        """Return (factory, content type) of the codec of the message being read from tr.
+
+        If tr can't peek, then the codec is selected by the content type of
+        tr (the default codec is used if it is not set). Throw
+        MessageHeaderException if the codec is unknown.
+        """
+
+        tr_content_type = tr.get_content_type()
+
+        if tr_content_type != None:
+            # Parameters (e.g. charset) are ignored.
+
+            tr_content_type = tr_content_type.split(";", 1)[0].strip().lower()
+
+        try:
+            buf = bytes(tr.peek(self._signature_len))
+        except TransportException:
+            # Transport can't peek, select the codec by content type.
+
+            return self._lookup_content_type(tr_content_type)
+
+        match = None
+        match_rank = None
+
+        for entry in self._entries:
+            (signature, content_type, factory) = entry
+
+            if not buf.startswith(signature):
+                continue
+
+            rank = (len(signature), tr_content_type != None and content_type == tr_content_type)
+
+            if (match == None or
+                rank > match_rank):
+                match = entry
+                match_rank = rank
+
+        if match == None:
+            raise MessageHeaderException("Unknown codec")
+
+        (signature, content_type, factory) = match
+
+        return (factory, content_type)
+
+    def _lookup_content_type(self, tr_content_type):
+        if tr_content_type == None:
+            return self.get_default()
+
+        for entry in self._entries:
+            (signature, content_type, factory) = entry
+
+            if content_type == tr_content_type:
+                return (factory, content_type)
+
+        raise MessageHeaderException("Unknown content type {}".format(tr_content_type))
+
+# Registry of the codecs shipped with the runtime.
+DefaultCodecRegistry = CodecRegistry()
+DefaultCodecRegistry.register(BinaryCodec)
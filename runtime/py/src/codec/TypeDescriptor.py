@@ -0,0 +1,394 @@
+from operator import methodcaller
+
+from myrpc.Common import MessageEncodeException, MessageBodyException
+from myrpc.codec.CodecBase import FID_STOP, DataType
+
+class TypeDescriptor:
+    """Base class for type descriptors.
+
+    Type descriptors describe IDL types at runtime, and (de)serialize
+    values of the described type:
+     - read(codec): deserialize and return a value.
+     - write(codec, v): serialize a value.
+
+    Descriptors are emitted by myrpcgen (see --py_serializer table), the
+    generated struct classes delegate myrpc_read and myrpc_write to them.
+    They can also be used for reflection.
+    """
+
+    def __init__(self, name, dtype):
+        self._name = name
+        self._dtype = dtype
+
+    def get_name(self):
+        return self._name
+
+    def get_dtype(self):
+        """Return codec data type (see DataType)."""
+
+        return self._dtype
+
+class PrimitiveDescriptor(TypeDescriptor):
+    """Descriptor for builtin primitive types."""
+
+    def __init__(self, name, dtype):
+        super().__init__(name, dtype)
+
+        # Resolve codec method name once, not on every call.
+
+        self.read = methodcaller("read_{}".format(name))
+        self._write_name = "write_{}".format(name)
+
+    def write(self, codec, v):
+        getattr(codec, self._write_name)(v)
+
+class CompressedDescriptor(TypeDescriptor):
+    """Descriptor for compressed binary and string fields.
+
+    desc is the descriptor of the field type (BINARY or STRING).
+    """
+
+    def __init__(self, desc, method, min_size):
+        super().__init__(desc.get_name(), desc.get_dtype())
+
+        self._method = method
+        self._min_size = min_size
+
+        self.read = methodcaller("read_{}_compressed".format(self._name))
+        self._write_name = "write_{}_compressed".format(self._name)
+
+    def get_method(self):
+        return self._method
+
+    def get_min_size(self):
+        return self._min_size
+
+    def write(self, codec, v):
+        getattr(codec, self._write_name)(v, self._method, self._min_size)
+
+class EnumDescriptor(TypeDescriptor):
+    """Descriptor for enumerated types."""
+
+    def __init__(self, name, values):
+        super().__init__(name, DataType.ENUM)
+
+        self._values = frozenset(values)
+
+    def get_values(self):
+        return self._values
+
+    def read(self, codec):
+        v = codec.read_i32()
+
+        if v not in self._values:
+            raise MessageBodyException("Enum {} unknown value {}".format(self._name, v))
+
+        return v
+
+    def write(self, codec, v):
+        if v not in self._values:
+            raise MessageEncodeException("Enum {} unknown value {}".format(self._name, v))
+
+        codec.write_i32(v)
+
+class ListDescriptor(TypeDescriptor):
+    """Descriptor for list types."""
+
+    def __init__(self, name, elem_desc):
+        super().__init__(name, DataType.LIST)
+
+        self._elem_desc = elem_desc
+
+    def get_elem_desc(self):
+        return self._elem_desc
+
+    def read(self, codec):
+        (llen, dtype) = codec.read_list_begin()
+
+        if dtype != self._elem_desc.get_dtype():
+            raise MessageBodyException("List {} has unexpected elem data type {}".format(self._name, dtype))
+
+        read = self._elem_desc.read
+        l = []
+
+        while llen > 0:
+            l.extend([read(codec) for i in range(llen)])
+            llen = codec.read_list_chunk()
+
+        codec.read_list_end()
+
+        return l
+
+    def iter(self, codec):
+        """Deserialize the list and yield its elements one by one."""
+
+        (llen, dtype) = codec.read_list_begin()
+
+        if dtype != self._elem_desc.get_dtype():
+            raise MessageBodyException("List {} has unexpected elem data type {}".format(self._name, dtype))
+
+        read = self._elem_desc.read
+
+        while llen > 0:
+            for i in range(llen):
+                yield read(codec)
+
+            llen = codec.read_list_chunk()
+
+        codec.read_list_end()
+
+    def write(self, codec, l):
+        """Serialize the list.
+
+        Iterables without length (e.g. generators) are written as chunked
+        list, without collecting the elements into a list (the encoded
+        message is still sent only when it is complete).
+        """
+
+        dtype = self._elem_desc.get_dtype()
+        write = self._elem_desc.write
+
+        if hasattr(l, "__len__"):
+            codec.write_list_begin(len(l), dtype)
+
+            for elem in l:
+                write(codec, elem)
+        else:
+            codec.write_list_begin(None, dtype)
+
+            for chunk in codec.split_list(l):
+                codec.write_list_chunk(len(chunk))
+
+                for elem in chunk:
+                    write(codec, elem)
+
+            codec.write_list_chunk(0)
+
+        codec.write_list_end()
+
+class MapDescriptor(TypeDescriptor):
+    """Descriptor for map types."""
+
+    def __init__(self, name, key_desc, value_desc):
+        super().__init__(name, DataType.MAP)
+
+        self._key_desc = key_desc
+        self._value_desc = value_desc
+
+    def get_key_desc(self):
+        return self._key_desc
+
+    def get_value_desc(self):
+        return self._value_desc
+
+    def read(self, codec):
+        (mlen, key_dtype, value_dtype) = codec.read_map_begin()
+
+        if key_dtype != self._key_desc.get_dtype():
+            raise MessageBodyException("Map {} has unexpected key data type {}".format(self._name, key_dtype))
+
+        if value_dtype != self._value_desc.get_dtype():
+            raise MessageBodyException("Map {} has unexpected value data type {}".format(self._name, value_dtype))
+
+        read_key = self._key_desc.read
+        read_value = self._value_desc.read
+        m = {}
+
+        for i in range(mlen):
+            key = read_key(codec)
+            m[key] = read_value(codec)
+
+        if len(m) != mlen:
+            raise MessageBodyException("Map {} has duplicated key".format(self._name))
+
+        codec.read_map_end()
+
+        return m
+
+    def write(self, codec, m):
+        write_key = self._key_desc.write
+        write_value = self._value_desc.write
+
+        codec.write_map_begin(len(m), self._key_desc.get_dtype(), self._value_desc.get_dtype())
+
+        for (key, value) in m.items():
+            write_key(codec, key)
+            write_value(codec, value)
+
+        codec.write_map_end()
+
+class FieldDescriptor:
+    """Descriptor for struct and exception fields.
+
+    attr is the name of the instance attribute holding the field value.
+    """
+
+    def __init__(self, fid, name, attr, req, desc):
+        self._fid = fid
+        self._name = name
+        self._attr = attr
+        self._req = req
+        self._desc = desc
+
+    def get_fid(self):
+        return self._fid
+
+    def get_name(self):
+        return self._name
+
+    def get_attr(self):
+        return self._attr
+
+    def get_req(self):
+        return self._req
+
+    def get_desc(self):
+        return self._desc
+
+class StructDescriptor(TypeDescriptor):
+    """Descriptor for structure and exception types."""
+
+    def __init__(self, name, cls, fields):
+        super().__init__(name, DataType.STRUCT)
+
+        self._cls = cls
+        self._fields = tuple(fields)
+
+        # Precalculate lookup tables used by the hot loops.
+
+        self._fids = {field.get_fid(): field for field in self._fields}
+        self._req_attrs = tuple([(field.get_attr(), field.get_name()) for field in self._fields if field.get_req()])
+        self._opt_attrs = tuple([field.get_attr() for field in self._fields if not field.get_req()])
+
+    def get_cls(self):
+        return self._cls
+
+    def get_fields(self):
+        return self._fields
+
+    def read(self, codec):
+        obj = self._cls()
+        self.read_into(codec, obj)
+
+        return obj
+
+    def write(self, codec, obj):
+        self.write_from(codec, obj)
+
+    def read_into(self, codec, obj):
+        """Deserialize fields into obj."""
+
+        if codec.is_read_compact():
+            self._read_compact(codec, obj)
+            return
+
+        values = obj.__dict__
+        fids = self._fids
+
+        codec.read_struct_begin()
+
+        while True:
+            (fid, dtype) = codec.read_field_begin()
+
+            if fid == FID_STOP:
+                break
+
+            try:
+                field = fids[fid]
+            except KeyError:
+                raise MessageBodyException("Struct {} unknown fid {}".format(self._name, fid))
+
+            desc = field._desc
+            attr = field._attr
+
+            if dtype != desc._dtype:
+                raise MessageBodyException("Struct {} fid {} has unexpected data type {}".format(self._name, fid, dtype))
+            if values[attr] != None:
+                raise MessageBodyException("Struct {} fid {} is duplicated".format(self._name, fid))
+
+            values[attr] = desc.read(codec)
+
+            codec.read_field_end()
+
+        codec.read_struct_end()
+
+        self._validate(values, True)
+
+    def write_from(self, codec, obj):
+        """Serialize fields of obj."""
+
+        values = obj.__dict__
+
+        self._validate(values, False)
+
+        if codec.is_write_compact():
+            self._write_compact(codec, values)
+            return
+
+        codec.write_struct_begin()
+
+        for field in self._fields:
+            v = values[field._attr]
+
+            if v != None:
+                desc = field._desc
+
+                codec.write_field_begin(field._fid, desc._dtype)
+                desc.write(codec, v)
+                codec.write_field_end()
+
+        codec.write_field_stop()
+
+        codec.write_struct_end()
+
+    def _read_compact(self, codec, obj):
+        values = obj.__dict__
+
+        codec.read_struct_begin()
+
+        presence = iter(codec.read_presence(len(self._opt_attrs)))
+
+        for field in self._fields:
+            if field._req or next(presence):
+                values[field._attr] = field._desc.read(codec)
+
+        codec.read_struct_end()
+
+    def _write_compact(self, codec, values):
+        codec.write_struct_begin()
+
+        codec.write_presence([values[attr] != None for attr in self._opt_attrs])
+
+        for field in self._fields:
+            v = values[field._attr]
+
+            if v != None:
+                field._desc.write(codec, v)
+
+        codec.write_struct_end()
+
+    def _validate(self, values, is_read):
+        for (attr, name) in self._req_attrs:
+            if values[attr] == None:
+                msg = "Struct {} field {} is None".format(self._name, name)
+
+                if is_read:
+                    raise MessageBodyException(msg)
+                else:
+                    raise MessageEncodeException(msg)
+
+# Descriptors of primitive types.
+
+BINARY = PrimitiveDescriptor("binary", DataType.BINARY)
+STRING = PrimitiveDescriptor("string", DataType.STRING)
+BOOL = PrimitiveDescriptor("bool", DataType.BOOL)
+UI8 = PrimitiveDescriptor("ui8", DataType.UI8)
+UI16 = PrimitiveDescriptor("ui16", DataType.UI16)
+UI32 = PrimitiveDescriptor("ui32", DataType.UI32)
+UI64 = PrimitiveDescriptor("ui64", DataType.UI64)
+I8 = PrimitiveDescriptor("i8", DataType.I8)
+I16 = PrimitiveDescriptor("i16", DataType.I16)
+I32 = PrimitiveDescriptor("i32", DataType.I32)
+I64 = PrimitiveDescriptor("i64", DataType.I64)
+FLOAT = PrimitiveDescriptor("float", DataType.FLOAT)
+DOUBLE = PrimitiveDescriptor("double", DataType.DOUBLE)
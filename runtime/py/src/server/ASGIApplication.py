@@ -0,0 +1,324 @@
+import asyncio
+import http.client
+
+from myrpc.Common import MessageLimitException
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.codec.CodecRegistry import CodecRegistry
+from myrpc.server.AsyncSocketServer import AsyncCall, _MAX_IDLE_PROCESSORS, _current_call
+from myrpc.server.Connection import Connection, set_current_connection, reset_current_connection
+from myrpc.server.WSGIApplication import DEFAULT_CONTENT_TYPE
+from myrpc.transport.BufferPool import DefaultBufferPool
+from myrpc.transport.MemoryTransport import MemoryTransport
+from myrpc.transport.SpoolBuffer import SpoolBuffer
+
+_ENCODING = "latin-1"
+
+class ASGIApplication:
+    """ASGI application processing the requests (POST bodies) by a processor.
+
+    Method implementations are called in the event loop, they must not
+    block. Every request is processed by its own processor (created by
+    processor_factory, and reused when the call is finished), therefore
+    asynchronous method execution is supported the same way as by
+    AsyncSocketServer: a method implementation can keep the call (see
+    get_current_call()), return ProcessorNotFinished, and finish the call
+    later with AsyncCall.call_continue(). Waiting calls (e.g. long polling)
+    don't hold threads. If the client disconnects, AsyncCall.is_closed()
+    returns True.
+
+    codec is a codec factory (e.g. BinaryCodec) or a CodecRegistry. The
+    request body is collected into a buffer of the buffer pool (or into a
+    SpoolBuffer if it is larger than the spill threshold), and the reply is
+    streamed from the segments of the transport with Content-Length set.
+    """
+
+    def __init__(self, processor_factory, codec = BinaryCodec):
+        self._processor_factory = processor_factory
+        self._codec = codec
+        self._max_message_size = None
+        self._spill_threshold = None
+        self._pool = DefaultBufferPool
+
+        self._idle_procs = []
+
+    def set_max_message_size(self, size):
+        """Limit the size of requests (None means unlimited), 413 is returned for larger ones."""
+
+        self._max_message_size = size
+
+    def set_spill_threshold(self, size):
+        """Spill requests larger than size bytes to a temporary file (None means never)."""
+
+        self._spill_threshold = size
+
+    def set_buffer_pool(self, pool):
+        self._pool = pool
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+
+            return
+
+        if scope["type"] != "http":
+            raise ValueError("Unsupported scope type {}".format(scope["type"]))
+
+        if scope["method"] != "POST":
+            await self._error(send, http.client.METHOD_NOT_ALLOWED, [(b"allow", b"POST")])
+
+            return
+
+        size = None
+        content_type = None
+
+        for (name, value) in scope["headers"]:
+            name = name.lower()
+
+            if name == b"content-length":
+                try:
+                    size = int(value)
+                except ValueError:
+                    await self._error(send, http.client.BAD_REQUEST)
+
+                    return
+            elif name == b"content-type":
+                content_type = value.decode(_ENCODING)
+
+        body = _RequestBody(self._pool)
+
+        try:
+            try:
+                rbuf = await body.receive(receive, size, self._max_message_size, self._spill_threshold)
+            except MessageLimitException:
+                await self._error(send, http.client.REQUEST_ENTITY_TOO_LARGE)
+
+                return
+
+            if rbuf == None:
+                # Client disconnected.
+
+                return
+
+            if size != None and len(rbuf) < size:
+                await self._error(send, http.client.BAD_REQUEST)
+
+                return
+
+            tr = MemoryTransport(rbuf)
+            tr.set_buffer_pool(self._pool)
+            tr.set_content_type(content_type)
+
+            try:
+                tr = await self._process(scope, receive, tr)
+
+                if tr != None:
+                    await self._send_reply(send, tr)
+            finally:
+                if tr != None:
+                    tr.close()
+        finally:
+            body.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+
+                break
+
+    async def _process(self, scope, receive, tr):
+        """Process the request, return the transport of the reply (None if the client disconnected)."""
+
+        (proc, codec) = self._acquire_processor()
+
+        conn = Connection(scope.get("client"))
+        reply = _Reply()
+        call = AsyncCall(self, reply, conn, proc, codec, tr)
+
+        conn_token = set_current_connection(conn)
+        call_token = _current_call.set(call)
+
+        try:
+            finished = proc.process_one(tr, codec)
+        finally:
+            _current_call.reset(call_token)
+            reset_current_connection(conn_token)
+
+        if finished:
+            call._finish()
+        else:
+            # Wait for the call to be finished, meanwhile watch the client.
+
+            await reply.wait(receive)
+
+        return reply.get_tr()
+
+    async def _send_reply(self, send, tr):
+        segs = tr.get_segments()
+
+        await send({"type": "http.response.start",
+                    "status": http.client.OK,
+                    "headers": [(b"content-type", (tr.get_content_type() or DEFAULT_CONTENT_TYPE).encode(_ENCODING)),
+                                (b"content-length", str(tr.get_segments_size()).encode(_ENCODING))]})
+
+        # ASGI requires bytes.
+
+        for (i, seg) in enumerate(segs):
+            await send({"type": "http.response.body",
+                        "body": bytes(seg),
+                        "more_body": i < len(segs) - 1})
+
+        if len(segs) == 0:
+            await send({"type": "http.response.body"})
+
+    async def _error(self, send, status, headers = ()):
+        body = "{} {}".format(status, http.client.responses[status]).encode("ascii")
+
+        await send({"type": "http.response.start",
+                    "status": status,
+                    "headers": [(b"content-type", b"text/plain"),
+                                (b"content-length", str(len(body)).encode(_ENCODING))] + list(headers)})
+        await send({"type": "http.response.body",
+                    "body": body})
+
+    def _send(self, reply, tr):
+        # Called by AsyncCall when the call is finished.
+
+        if reply.is_closed():
+            tr.close()
+        else:
+            reply.set_tr(tr)
+
+    def _is_closed(self, reply):
+        closed = reply.is_closed()
+
+        return closed
+
+    def _acquire_processor(self):
+        if len(self._idle_procs) > 0:
+            return self._idle_procs.pop()
+
+        if isinstance(self._codec, CodecRegistry):
+            codec = self._codec
+        else:
+            codec = self._codec()
+
+        return (self._processor_factory(), codec)
+
+    def _release_processor(self, proc, codec):
+        if len(self._idle_procs) < _MAX_IDLE_PROCESSORS:
+            self._idle_procs.append((proc, codec))
+
+class _Reply:
+    """Reply of a call processed by ASGIApplication."""
+
+    def __init__(self):
+        self._tr = None
+        self._closed = False
+        self._event = asyncio.Event()
+
+    def get_tr(self):
+        return self._tr
+
+    def set_tr(self, tr):
+        self._tr = tr
+        self._event.set()
+
+    def is_closed(self):
+        return self._closed
+
+    async def wait(self, receive):
+        """Wait for the reply, or for the client to disconnect."""
+
+        ready = asyncio.ensure_future(self._event.wait())
+
+        try:
+            while not ready.done():
+                message = asyncio.ensure_future(receive())
+
+                try:
+                    await asyncio.wait((ready, message), return_when = asyncio.FIRST_COMPLETED)
+                finally:
+                    if not message.done():
+                        message.cancel()
+
+                if message.done() and not message.cancelled() and message.result()["type"] == "http.disconnect":
+                    self._closed = True
+
+                    break
+        finally:
+            ready.cancel()
+
+class _RequestBody:
+    """Request body collected into a pooled buffer or a SpoolBuffer."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._buf = None
+        self._spool = None
+
+    async def receive(self, receive, size, max_size, spill_threshold):
+        """Receive the body of size bytes (None means unknown), return it as memoryview.
+
+        None is returned if the client disconnected. If the body is
+        truncated, then the returned buffer is shorter than size.
+        """
+
+        if size != None and max_size != None and size > max_size:
+            raise MessageLimitException("Message size {} exceeds {} bytes".format(size, max_size))
+
+        if (size == None or
+            (spill_threshold != None and size > spill_threshold)):
+            self._spool = SpoolBuffer(spill_threshold)
+        else:
+            self._buf = self._pool.acquire(size)
+
+        count = 0
+
+        while True:
+            message = await receive()
+
+            if message["type"] == "http.disconnect":
+                return None
+
+            chunk = message.get("body", b"")
+
+            if self._buf != None:
+                # Data exceeding Content-Length is ignored.
+
+                chunk_size = min(len(chunk), size - count)
+
+                with memoryview(chunk) as view:
+                    self._buf[count:count + chunk_size] = view[:chunk_size]
+            else:
+                chunk_size = len(chunk)
+
+                if max_size != None and count + chunk_size > max_size:
+                    raise MessageLimitException("Message size exceeds {} bytes".format(max_size))
+
+                self._spool.write(chunk)
+
+            count += chunk_size
+
+            if not message.get("more_body", False):
+                break
+
+        if self._buf != None:
+            return memoryview(self._buf)[:count]
+
+        return self._spool.get_view()
+
+    def close(self):
+        # The pool doesn't take it back, if decoded values still reference it.
+
+        if self._buf != None:
+            self._pool.release(self._buf)
+            self._buf = None
+
+        if self._spool != None:
+            self._spool.close()
+            self._spool = None
@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import os
+import socket
+
+from myrpc.Common import MessageLimitException
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.codec.CodecRegistry import CodecRegistry
+from myrpc.server.Connection import Connection, get_socket_peer_credentials, set_current_connection, reset_current_connection
+from myrpc.transport.BufferPool import DefaultBufferPool
+from myrpc.transport.MemoryTransport import MemoryTransport
+from myrpc.transport.Framing import FRAME_HEADER_SIZE, pack_frame_header, unpack_frame_header
+
+# Maximal number of processors kept for reuse (after many parked calls are
+# finished, the rest is dropped).
+_MAX_IDLE_PROCESSORS = 64
+
+_current_call = contextvars.ContextVar("myrpc_async_call", default = None)
+
+class AsyncSocketServer:
+    """asyncio server for framed messages (see Framing).
+
+    address is (host, port) for TCP, or the socket file path for Unix
+    domain socket, the same clients can be used as for SocketServer and
+    UnixSocketServer. Method implementations are called in the event loop,
+    they must not block.
+
+    Requests are processed as they arrive, every request by its own
+    processor (created by processor_factory, and reused when the call is
+    finished), and the replies are sent when they are ready. Therefore
+    asynchronous method execution is supported: a method implementation
+    can keep the call (see get_current_call()), return ProcessorNotFinished,
+    and finish the call later from any coroutine with AsyncCall.call_continue().
+    Parked calls don't hold threads, only their processor and request.
+
+    codec is a codec factory (e.g. BinaryCodec) or a CodecRegistry.
+    Method implementations can get information about the client with
+    get_current_connection() (see Connection).
+    """
+
+    def __init__(self, address, processor_factory, codec = BinaryCodec):
+        self._address = address
+        self._processor_factory = processor_factory
+        self._codec = codec
+        self._max_message_size = None
+        self._pool = DefaultBufferPool
+
+        self._server = None
+        self._writers = set()
+        self._tasks = set()
+        self._idle_procs = []
+
+    def get_address(self):
+        """Return the address the server is listening on."""
+
+        sock = self._server.sockets[0]
+
+        return sock.getsockname()
+
+    def set_max_message_size(self, size):
+        """Limit the size of requests (None means unlimited), connections sending larger ones are closed."""
+
+        self._max_message_size = size
+
+    def set_buffer_pool(self, pool):
+        self._pool = pool
+
+    async def start(self):
+        """Start listening, connections are accepted by the event loop."""
+
+        if isinstance(self._address, tuple):
+            (host, port) = self._address
+            self._server = await asyncio.start_server(self._serve_connection, host, port)
+        else:
+            self._server = await asyncio.start_unix_server(self._serve_connection, self._address)
+
+    async def serve_forever(self):
+        """Accept connections until the task is cancelled or close() is called."""
+
+        if self._server == None:
+            await self.start()
+
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            # serve_forever is cancelled by close().
+
+            if self._server.is_serving():
+                raise
+
+    def close(self):
+        """Stop listening, and close the connections (see wait_closed)."""
+
+        self._server.close()
+
+        for writer in list(self._writers):
+            writer.transport.abort()
+
+        if (isinstance(self._address, (str, bytes)) and
+            self._address[:1] not in ("\0", b"\0")):
+            try:
+                os.unlink(self._address)
+            except FileNotFoundError:
+                pass
+
+    async def wait_closed(self):
+        """Cancel the tasks serving the connections, and wait until they and the server are closed."""
+
+        tasks = list(self._tasks)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+        await self._server.wait_closed()
+
+    async def _serve_connection(self, reader, writer):
+        # Every connection is served by its own task, which has its own
+        # context.
+
+        task = asyncio.current_task()
+
+        self._writers.add(writer)
+        self._tasks.add(task)
+
+        sock = writer.get_extra_info("socket")
+        address = writer.get_extra_info("peername")
+
+        if sock.family == socket.AF_UNIX:
+            conn = Connection(address, get_socket_peer_credentials(sock))
+        else:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = Connection(address)
+
+        set_current_connection(conn)
+
+        try:
+            while True:
+                buf = await self._read_frame(reader)
+                if buf == None:
+                    break
+
+                self._process(writer, conn, buf)
+
+                await writer.drain()
+        except (OSError, EOFError, MessageLimitException):
+            # Connection is broken or the peer misbehaves, close it.
+
+            pass
+        except asyncio.CancelledError:
+            # Cancelled by wait_closed(). The task has to finish normally,
+            # the stream protocol reports cancelled tasks as errors.
+
+            pass
+        except Exception as e:
+            asyncio.get_running_loop().call_exception_handler({"message": "Exception in processing request",
+                                                               "exception": e,
+                                                               "peername": address})
+        finally:
+            self._writers.discard(writer)
+            self._tasks.discard(task)
+            writer.transport.abort()
+
+    async def _read_frame(self, reader):
+        try:
+            header = await reader.readexactly(FRAME_HEADER_SIZE)
+        except asyncio.IncompleteReadError as e:
+            if len(e.partial) == 0:
+                return None
+
+            raise
+
+        size = unpack_frame_header(header)
+
+        if (self._max_message_size != None and
+            size > self._max_message_size):
+            raise MessageLimitException("Message size {} exceeds {} bytes".format(size, self._max_message_size))
+
+        buf = await reader.readexactly(size)
+
+        return buf
+
+    def _process(self, writer, conn, buf):
+        (proc, codec) = self._acquire_processor()
+
+        tr = MemoryTransport(buf)
+        tr.set_buffer_pool(self._pool)
+
+        call = AsyncCall(self, writer, conn, proc, codec, tr)
+        token = _current_call.set(call)
+
+        try:
+            finished = proc.process_one(tr, codec)
+        finally:
+            _current_call.reset(token)
+
+        if finished:
+            call._finish()
+
+    def _send(self, writer, tr):
+        if writer.is_closing():
+            tr.close()
+
+            return
+
+        writer.writelines([pack_frame_header(tr.get_segments_size())] + tr.get_segments())
+
+        # If the reply is not sent entirely, then the event loop may
+        # reference the segments, don't return them to the pool.
+
+        if writer.transport.get_write_buffer_size() == 0:
+            tr.close()
+
+    def _is_closed(self, writer):
+        closed = writer.is_closing()
+
+        return closed
+
+    def _acquire_processor(self):
+        if len(self._idle_procs) > 0:
+            return self._idle_procs.pop()
+
+        if isinstance(self._codec, CodecRegistry):
+            codec = self._codec
+        else:
+            codec = self._codec()
+
+        return (self._processor_factory(), codec)
+
+    def _release_processor(self, proc, codec):
+        if len(self._idle_procs) < _MAX_IDLE_PROCESSORS:
+            self._idle_procs.append((proc, codec))
+
+class AsyncCall:
+    """Call of a method processed by AsyncSocketServer (or ASGIApplication).
+
+    If the method implementation returns ProcessorNotFinished, the call
+    can be finished later by call_continue(). It has to be called in the
+    thread of the event loop (from other threads, use
+    loop.call_soon_threadsafe).
+    """
+
+    def __init__(self, server, writer, conn, proc, codec, tr):
+        self._server = server
+        self._writer = writer
+        self._conn = conn
+        self._proc = proc
+        self._codec = codec
+        self._tr = tr
+        self._finished = False
+
+    def get_connection(self):
+        return self._conn
+
+    def is_finished(self):
+        return self._finished
+
+    def is_closed(self):
+        """Return True if the connection of the call is closed, the reply can't be sent."""
+
+        closed = self._server._is_closed(self._writer)
+
+        return closed
+
+    def call_continue(self, func, user_data = None):
+        """Finish the call: the return value of func(user_data) is the return value of the method.
+
+        func is called the same way as the method implementation: it can
+        throw exceptions defined in IDL, or return ProcessorNotFinished
+        again. Return True if the call is finished.
+        """
+
+        if self._finished:
+            raise ValueError("Call is finished")
+
+        token = set_current_connection(self._conn)
+
+        try:
+            finished = self._proc.call_continue(func, user_data)
+        finally:
+            reset_current_connection(token)
+
+        if finished:
+            self._finish()
+
+        return finished
+
+    def _finish(self):
+        self._finished = True
+
+        self._server._send(self._writer, self._tr)
+        self._server._release_processor(self._proc, self._codec)
+
+        self._tr = None
+        self._proc = None
+        self._codec = None
+
+def get_current_call():
+    """Return the AsyncCall of the request being processed by AsyncSocketServer or ASGIApplication (None outside of request processing).
+
+    Method implementations returning ProcessorNotFinished keep it, and
+    finish the call later with AsyncCall.call_continue().
+    """
+
+    return _current_call.get()
@@ -0,0 +1,63 @@
+import contextvars
+import socket
+import struct
+
+# struct ucred of SO_PEERCRED.
+_UCRED_FORMAT = "3i"
+
+_current_connection = contextvars.ContextVar("myrpc_connection", default = None)
+
+class Connection:
+    """Information about a client connection of a server.
+
+    Method implementations can get the connection of the request being
+    processed with get_current_connection().
+    """
+
+    def __init__(self, peer_address, peer_credentials = None):
+        self._peer_address = peer_address
+        self._peer_credentials = peer_credentials
+
+    def get_peer_address(self):
+        """Return the address of the client (e.g. (host, port) for TCP)."""
+
+        return self._peer_address
+
+    def get_peer_credentials(self):
+        """Return (pid, uid, gid) of the client process.
+
+        It is available only for Unix domain socket connections on platforms
+        supporting SO_PEERCRED, otherwise None is returned. The credentials
+        are the ones of the client at the time it connected.
+        """
+
+        return self._peer_credentials
+
+def get_current_connection():
+    """Return the Connection of the request being processed (None if called outside of request processing)."""
+
+    return _current_connection.get()
+
+def set_current_connection(conn):
+    """Set the connection of the current thread (or asyncio task), return a token for reset_current_connection().
+
+    It is used by the servers.
+    """
+
+    token = _current_connection.set(conn)
+
+    return token
+
+def reset_current_connection(token):
+    _current_connection.reset(token)
+
+def get_socket_peer_credentials(sock):
+    """Return (pid, uid, gid) of the peer process of Unix domain socket sock (None if SO_PEERCRED is not supported)."""
+
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+
+    buf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize(_UCRED_FORMAT))
+    (pid, uid, gid) = struct.unpack(_UCRED_FORMAT, buf)
+
+    return (pid, uid, gid)
@@ -0,0 +1,277 @@
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.server.SharedCounters import SharedCounters
+from myrpc.server.SocketServer import SocketServer
+
+# Workers exiting sooner after their start are restarted with delay, to
+# avoid a busy loop of restarts if they crash on startup.
+_MIN_WORKER_LIFETIME = 1.0
+
+# Default time (in seconds) stopped workers wait for the requests being
+# processed.
+_DRAIN_TIMEOUT = 30.0
+
+# Counters maintained by the workers.
+_WORKER_COUNTERS = ("requests", "errors")
+
+# Signals handled by the workers themselves.
+_WORKER_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+class PreforkServer:
+    """Pre-fork server for framed messages (see Framing) on TCP connections.
+
+    To use all cores despite the GIL, workers processes are forked (the
+    default is the number of CPUs), every worker runs its own SocketServer
+    (processor_factory and codec are passed to it) listening on address
+    with SO_REUSEPORT, and the kernel distributes the connections between
+    them. The supervisor process (the one calling serve_forever) restarts
+    the workers which exit or crash, and it can read the statistics of the
+    workers aggregated in shared memory (see get_counters). Method
+    implementations can maintain further counters, their names are passed
+    in counter_names.
+
+    The workers can be pinned to CPUs (see set_cpu_affinity). It works only
+    on platforms supporting fork and SO_REUSEPORT (e.g. Linux). Worker
+    processes inherit the state of the supervisor, therefore the server
+    has to be created before starting threads, and resources which can't
+    be shared (e.g. database connections) should be created lazily in the
+    workers (e.g. by processor_factory).
+    """
+
+    def __init__(self, address, processor_factory, codec = BinaryCodec, workers = None, counter_names = ()):
+        if workers == None:
+            workers = os.cpu_count() or 1
+
+        self._processor_factory = processor_factory
+        self._codec = codec
+        self._workers = workers
+        self._cpus = None
+        self._drain_timeout = _DRAIN_TIMEOUT
+
+        self._counters = SharedCounters(_WORKER_COUNTERS + tuple(counter_names), workers)
+        self._pids = {}
+        self._started = {}
+        self._restarts = 0
+        self._stopping = False
+
+        # Bind the address in the supervisor: errors are reported early,
+        # port 0 is resolved for all the workers, and the port is kept
+        # while the workers are restarted.
+
+        self._sock = self._create_socket(address)
+        self._address = self._sock.getsockname()
+
+    def get_address(self):
+        """Return the address the workers are listening on."""
+
+        return self._address
+
+    def get_workers(self):
+        return self._workers
+
+    def get_worker_pids(self):
+        """Return the process ids of the running workers."""
+
+        return list(self._pids.keys())
+
+    def get_counters(self):
+        """Return the SharedCounters of the workers.
+
+        The counters "requests" and "errors" (uncaught exceptions of the
+        processor) are maintained by the server, the rest by the method
+        implementations (e.g. server.get_counters().increment("hits") in a
+        worker). Every worker has its own slot: slot i belongs to worker i.
+        """
+
+        return self._counters
+
+    def get_restarts(self):
+        """Return the number of workers restarted by the supervisor."""
+
+        return self._restarts
+
+    def set_cpu_affinity(self, cpus):
+        """Pin worker i to CPU cpus[i % len(cpus)] (None disables it).
+
+        For example: sorted(os.sched_getaffinity(0)). It has to be called
+        before serve_forever(), and it is ignored on platforms not
+        supporting os.sched_setaffinity.
+        """
+
+        self._cpus = list(cpus) if cpus != None else None
+
+    def serve_forever(self):
+        """Start the workers, and restart them until shutdown() is called.
+
+        It returns when all the workers exited.
+        """
+
+        self._stopping = False
+
+        for slot in range(self._workers):
+            self._start_worker(slot)
+
+        while len(self._pids) > 0:
+            try:
+                (pid, status) = os.wait()
+            except ChildProcessError:
+                break
+
+            slot = self._pids.pop(pid, None)
+            if slot == None or self._stopping:
+                continue
+
+            self._restarts += 1
+
+            lifetime = time.monotonic() - self._started[slot]
+            if lifetime < _MIN_WORKER_LIFETIME:
+                time.sleep(_MIN_WORKER_LIFETIME - lifetime)
+
+            if not self._stopping:
+                self._start_worker(slot)
+
+    def set_drain_timeout(self, timeout):
+        """Set how long stopped workers wait for the requests being processed (default: 30 seconds, None means forever)."""
+
+        self._drain_timeout = timeout
+
+    def shutdown(self):
+        """Stop the workers, serve_forever() returns when they exited.
+
+        The workers stop accepting connections and reading requests, and
+        exit when the requests being processed are finished (see
+        set_drain_timeout).
+
+        It can be called from a signal handler of the supervisor.
+        """
+
+        self._stopping = True
+
+        for pid in list(self._pids.keys()):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def close(self):
+        """Release the address, it has to be called after serve_forever() returned."""
+
+        self._sock.close()
+
+    def _create_socket(self, address):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(address)
+        except:
+            sock.close()
+
+            raise
+
+        # The socket is not listening, therefore no connection is
+        # assigned to it.
+
+        return sock
+
+    def _create_server(self, processor_factory):
+        """Create the SocketServer of a worker, it can be overridden to configure the server."""
+
+        server = SocketServer(self._address, processor_factory, self._codec, reuse_port = True)
+
+        return server
+
+    def _start_worker(self, slot):
+        # Signal handlers of the supervisor must not run in the worker
+        # before it sets its own ones.
+
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, _WORKER_SIGNALS)
+
+        try:
+            pid = os.fork()
+        except:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+            raise
+
+        if pid != 0:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+        if pid == 0:
+            status = 1
+
+            try:
+                self._run_worker(slot, mask)
+
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+
+        self._pids[pid] = slot
+        self._started[slot] = time.monotonic()
+
+    def _run_worker(self, slot, mask):
+        # Interrupts (e.g. Ctrl-C in the terminal) are handled by the
+        # supervisor.
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+        self._pids = {}
+        self._sock.close()
+        self._counters.set_slot(slot)
+
+        if self._cpus != None and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, (self._cpus[slot % len(self._cpus)],))
+
+        counters = self._counters
+        processor_factory = self._processor_factory
+        server = self._create_server(lambda: _CountingProcessor(processor_factory(), counters))
+
+        # shutdown() of SocketServer can't be called by the thread running
+        # serve_forever().
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target = server.shutdown, daemon = True).start())
+
+        try:
+            server.serve_forever()
+
+            # Stopped by SIGTERM.
+
+            server.drain(self._drain_timeout)
+        finally:
+            server.close()
+
+class _CountingProcessor:
+    """Processor wrapper maintaining the counters of PreforkServer."""
+
+    def __init__(self, proc, counters):
+        self._proc = proc
+        self._counters = counters
+
+    def process_one(self, tr, codec):
+        try:
+            finished = self._proc.process_one(tr, codec)
+        except Exception:
+            self._counters.increment("errors")
+
+            raise
+
+        self._counters.increment("requests")
+
+        return finished
+
+    def call_continue(self, func, user_data = None):
+        finished = self._proc.call_continue(func, user_data)
+
+        return finished
@@ -0,0 +1,183 @@
+import queue
+import threading
+import time
+import traceback
+
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.codec.CodecRegistry import CodecRegistry
+from myrpc.server.Connection import set_current_connection, reset_current_connection
+
+class ProcessorPool:
+    """Thread pool processing requests with per-worker processors.
+
+    Processors are not thread-safe (they keep the state of the call being
+    processed), therefore every worker thread has its own processor and
+    codec (created by processor_factory, e.g. lambda: Processor(impl), and
+    codec, a codec factory or a CodecRegistry). Method implementations
+    which release the GIL (I/O, zlib, image processing, ...) run in
+    parallel.
+
+    Requests are queued until a worker is free. The queue is bounded: if
+    it is full, submit() and process() block, therefore the callers
+    (e.g. the threads reading the connections) are slowed down.
+
+    Statistics of the time the requests spent in the queue are kept (see
+    get_queue_wait_time).
+    """
+
+    def __init__(self, processor_factory, codec = BinaryCodec, workers = 8, max_queued = 64):
+        self._processor_factory = processor_factory
+        self._codec = codec
+        self._workers = workers
+
+        self._queue = queue.Queue(max_queued)
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._shutdown = False
+        self._reset_stats()
+
+        self._threads = []
+
+        for i in range(workers):
+            thread = threading.Thread(target = self._work, daemon = True)
+            thread.start()
+
+            self._threads.append(thread)
+
+    def get_workers(self):
+        return self._workers
+
+    def submit(self, func):
+        """Call func(proc, codec) in a worker thread with the processor and codec of the worker.
+
+        func has to handle its exceptions, uncaught exceptions are printed.
+        """
+
+        # Jobs can't be queued after the stop markers of the workers.
+
+        with self._submit_lock:
+            if self._shutdown:
+                raise RuntimeError("ProcessorPool is shut down")
+
+            self._queue.put((func, time.monotonic()))
+
+    def process(self, tr, conn = None):
+        """Process one message of transport tr in a worker thread (see Processor.process_one), and wait for it.
+
+        conn is the Connection of the client (see get_current_connection),
+        if available. Exceptions of the processor are thrown by process.
+        """
+
+        job = _Job(tr, conn)
+        self.submit(job.run)
+
+        finished = job.wait()
+
+        return finished
+
+    def shutdown(self, wait = True):
+        """Stop the workers after the queued requests are processed."""
+
+        with self._submit_lock:
+            if self._shutdown:
+                return
+
+            self._shutdown = True
+
+        for thread in self._threads:
+            self._queue.put(None)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def get_queue_length(self):
+        """Return the number of requests waiting for a worker."""
+
+        return self._queue.qsize()
+
+    def get_processed(self):
+        """Return the number of requests taken by the workers."""
+
+        return self._processed
+
+    def get_queue_wait_time(self):
+        """Return the total time (in seconds) the requests spent in the queue.
+
+        Divide it by get_processed() to get the average.
+        """
+
+        return self._queue_wait_time
+
+    def get_max_queue_wait_time(self):
+        """Return the maximal time (in seconds) a request spent in the queue."""
+
+        return self._max_queue_wait_time
+
+    def reset_stats(self):
+        with self._lock:
+            self._reset_stats()
+
+    def _reset_stats(self):
+        self._processed = 0
+        self._queue_wait_time = 0.0
+        self._max_queue_wait_time = 0.0
+
+    def _work(self):
+        proc = self._processor_factory()
+
+        if isinstance(self._codec, CodecRegistry):
+            codec = self._codec
+        else:
+            codec = self._codec()
+
+        while True:
+            item = self._queue.get()
+            if item == None:
+                break
+
+            (func, queued) = item
+            wait_time = time.monotonic() - queued
+
+            with self._lock:
+                self._processed += 1
+                self._queue_wait_time += wait_time
+                self._max_queue_wait_time = max(self._max_queue_wait_time, wait_time)
+
+            try:
+                func(proc, codec)
+            except Exception:
+                traceback.print_exc()
+
+class _Job:
+    """Message processed by ProcessorPool.process."""
+
+    def __init__(self, tr, conn):
+        self._tr = tr
+        self._conn = conn
+        self._event = threading.Event()
+        self._finished = None
+        self._exc = None
+
+    def run(self, proc, codec):
+        token = set_current_connection(self._conn)
+
+        try:
+            self._finished = proc.process_one(self._tr, codec)
+        except BaseException as e:
+            self._exc = e
+        finally:
+            reset_current_connection(token)
+
+            self._event.set()
+
+    def wait(self):
+        self._event.wait()
+
+        if self._exc != None:
+            try:
+                raise self._exc
+            finally:
+                self._exc = None
+
+        return self._finished
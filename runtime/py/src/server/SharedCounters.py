@@ -0,0 +1,76 @@
+import mmap
+import threading
+
+_COUNTER_FORMAT = "Q"
+_COUNTER_SIZE = 8
+
+class SharedCounters:
+    """Counters shared by processes (e.g. the workers of PreforkServer).
+
+    The counters are stored in anonymous shared memory, which is shared
+    with the child processes forked after the counters are created. Every
+    process has its own slot (see set_slot), and increments only the
+    counters of its slot, therefore no inter-process locking is needed.
+    Counters are 64 bit unsigned integers.
+    """
+
+    def __init__(self, names, slots):
+        self._indexes = {}
+
+        for name in names:
+            self._indexes.setdefault(name, len(self._indexes))
+
+        self._slots = slots
+        self._mem = mmap.mmap(-1, max(1, slots * len(self._indexes)) * _COUNTER_SIZE)
+        self._counters = memoryview(self._mem).cast(_COUNTER_FORMAT)
+        self._slot = 0
+        self._lock = threading.Lock()
+
+    def get_names(self):
+        return tuple(self._indexes.keys())
+
+    def get_slots(self):
+        return self._slots
+
+    def set_slot(self, slot):
+        """Set the slot of the current process, it is called in the child process after fork."""
+
+        if not (0 <= slot < self._slots):
+            raise ValueError("Invalid slot {}".format(slot))
+
+        self._slot = slot
+
+        # The lock may have been held by another thread during fork.
+
+        self._lock = threading.Lock()
+
+    def increment(self, name, count = 1):
+        """Increment counter name of the slot of the current process."""
+
+        i = self._get_index(self._slot, name)
+
+        with self._lock:
+            self._counters[i] += count
+
+    def get(self, name, slot = None):
+        """Return the value of counter name of slot (None means the sum of all slots)."""
+
+        if slot != None:
+            return self._counters[self._get_index(slot, name)]
+
+        value = sum(self._counters[self._get_index(slot, name)] for slot in range(self._slots))
+
+        return value
+
+    def reset(self):
+        with self._lock:
+            for i in range(len(self._counters)):
+                self._counters[i] = 0
+
+    def _get_index(self, slot, name):
+        try:
+            index = self._indexes[name]
+        except KeyError:
+            raise ValueError("Unknown counter {}".format(name))
+
+        return slot * len(self._indexes) + index
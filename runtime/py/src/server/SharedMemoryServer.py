@@ -0,0 +1,64 @@
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.codec.CodecRegistry import CodecRegistry
+from myrpc.server.Connection import Connection, set_current_connection, reset_current_connection
+from myrpc.transport.SharedMemoryTransport import SharedMemoryTransportException
+
+class SharedMemoryServer:
+    """Server for the requests of a SharedMemoryChannel.
+
+    The requests are processed one after another by the thread calling
+    serve_forever(), with the processor created by processor_factory (e.g.
+    lambda: Processor(impl)). codec is a codec factory (e.g. BinaryCodec) or
+    a CodecRegistry. The peer address of the Connection (see
+    get_current_connection) is the name of the channel.
+
+    Replies larger than the channel can carry (see
+    SharedMemoryChannel.get_max_message_size) are replaced by an ERROR
+    message. Asynchronous method execution (ProcessorNotFinished) is not
+    supported, the channel is closed in this case.
+    """
+
+    def __init__(self, channel, processor_factory, codec = BinaryCodec):
+        self._channel = channel
+        self._processor_factory = processor_factory
+        self._codec = codec
+        self._max_message_size = None
+
+    def set_max_message_size(self, size):
+        """Limit the size of requests (None means unlimited), larger ones are skipped and replied with an ERROR message."""
+
+        self._max_message_size = size
+
+    def serve_forever(self):
+        """Process requests until the channel is closed (by either process, see close())."""
+
+        proc = self._processor_factory()
+
+        if isinstance(self._codec, CodecRegistry):
+            codec = self._codec
+        else:
+            codec = self._codec()
+
+        tr = self._channel.create_server_transport()
+        tr.set_max_message_size(self._max_message_size)
+
+        token = set_current_connection(Connection(self._channel.get_name()))
+
+        try:
+            while proc.process_one(tr, codec):
+                pass
+        except SharedMemoryTransportException:
+            # Channel is closed.
+
+            if not self._channel.is_closed():
+                raise
+        finally:
+            reset_current_connection(token)
+
+            tr.close()
+            self._channel.close()
+
+    def close(self):
+        """Close the channel, serve_forever() returns (it can be called from another thread)."""
+
+        self._channel.close()
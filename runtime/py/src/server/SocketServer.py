@@ -0,0 +1,404 @@
+import socket
+import socketserver
+import threading
+
+from myrpc.Common import MessageDecodeException, MessageLimitException
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.codec.CodecBase import ErrorMessage
+from myrpc.codec.CodecRegistry import CodecRegistry
+from myrpc.server.Connection import Connection, set_current_connection, reset_current_connection
+from myrpc.server.ProcessorPool import ProcessorPool
+from myrpc.transport.BufferPool import DefaultBufferPool
+from myrpc.transport.MemoryTransport import MemoryTransport
+from myrpc.transport.Framing import send_frame, recv_frame
+from myrpc.transport.TransportBase import TransportState
+
+# Reported to the client if processing of a request with request id fails
+# unexpectedly.
+_INTERNAL_ERROR = "Internal server error"
+
+class SocketServer:
+    """Server for framed messages (see Framing) on TCP connections.
+
+    Every connection is served by its own thread with its own processor
+    (created by processor_factory, e.g. lambda: Processor(impl)), therefore
+    processors don't need to be thread-safe. Requests of a connection are
+    processed one after another, and the replies are sent on the same
+    connection.
+
+    Requests with request id (see MultiplexConnection) are processed
+    concurrently by a ProcessorPool, and their replies are sent as soon as
+    they are ready. The worker threads have their own processors, which
+    are not bound to connections. If processing such a request fails
+    unexpectedly, then an ERROR reply is sent for it, and the other
+    requests of the connection are not affected.
+
+    If a ProcessorPool is set by set_processor_pool(), then every request
+    is processed by it, the connection threads only receive the requests
+    and send the replies.
+
+    codec is a codec factory (e.g. BinaryCodec) or a CodecRegistry.
+    Method implementations can get information about the client with
+    get_current_connection() (see Connection).
+    Asynchronous method execution (ProcessorNotFinished) is not supported,
+    the connection is closed in this case.
+
+    If reuse_port is True, then SO_REUSEPORT is set on the listening socket,
+    therefore more servers (e.g. in different processes, see PreforkServer)
+    can listen on the same port, and the connections are distributed
+    between them by the kernel.
+    """
+
+    def __init__(self, address, processor_factory, codec = BinaryCodec, reuse_port = False):
+        self._processor_factory = processor_factory
+        self._codec = codec
+        self._reuse_port = reuse_port
+        self._max_message_size = None
+        self._pool = DefaultBufferPool
+        self._max_workers = 16
+        self._max_pending_requests = 64
+
+        self._lock = threading.Lock()
+        self._conns = set()
+        self._conns_closed = threading.Condition(self._lock)
+        self._draining = False
+        self._proc_pool = None
+        self._own_proc_pool = None
+
+        self._server = self._create_server(address)
+        self._server.myrpc_server = self
+
+    def get_address(self):
+        """Return the address the server is listening on."""
+
+        return self._server.server_address
+
+    def set_max_message_size(self, size):
+        """Limit the size of requests (None means unlimited), connections sending larger ones are closed."""
+
+        self._max_message_size = size
+
+    def set_buffer_pool(self, pool):
+        self._pool = pool
+
+    def set_max_workers(self, count):
+        """Set the number of threads processing requests with request id (default: 16).
+
+        It has to be called before serving connections, and it has no
+        effect if set_processor_pool() is used.
+        """
+
+        self._max_workers = count
+
+    def set_processor_pool(self, pool):
+        """Process every request by pool (None disables it).
+
+        The pool is not shut down by close(), it can be shared by more
+        servers. It has to be called before serving connections.
+        """
+
+        self._proc_pool = pool
+
+    def set_max_pending_requests(self, count):
+        """Limit the number of requests with request id being processed per connection (default: 64).
+
+        If the limit is reached, further requests of the connection are not
+        read until one of them is finished.
+        """
+
+        self._max_pending_requests = count
+
+    def serve_forever(self, poll_interval = 0.5):
+        """Accept connections until shutdown() is called."""
+
+        self._server.serve_forever(poll_interval)
+
+    def shutdown(self):
+        """Stop serve_forever() (it has to be called from another thread)."""
+
+        self._server.shutdown()
+
+    def drain(self, timeout = None):
+        """Let the connections finish the requests being processed, and wait for them to close.
+
+        Further requests are not read from the connections, the replies of
+        the requests being processed are sent. It waits at most timeout
+        seconds (None means forever), return True if all the connections
+        are closed. Call it after serve_forever() returned, before close().
+        """
+
+        with self._lock:
+            self._draining = True
+
+            for sock in self._conns:
+                self._shutdown_read(sock)
+
+            closed = self._conns_closed.wait_for(lambda: len(self._conns) == 0, timeout)
+
+        return closed
+
+    def close(self):
+        """Close the listening socket and the connections."""
+
+        self._server.server_close()
+
+        with self._lock:
+            conns = list(self._conns)
+
+        for sock in conns:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        with self._lock:
+            pool = self._own_proc_pool
+            self._own_proc_pool = None
+
+        if pool != None:
+            pool.shutdown(False)
+
+    def _create_server(self, address):
+        if self._reuse_port:
+            server = _ReusePortThreadingTCPServer(address, _ConnectionHandler)
+        else:
+            server = _ThreadingTCPServer(address, _ConnectionHandler)
+
+        return server
+
+    def _setup_connection(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _create_connection(self, sock, address):
+        conn = Connection(address)
+
+        return conn
+
+    def _serve_connection(self, sock, address):
+        self._setup_connection(sock)
+
+        with self._lock:
+            self._conns.add(sock)
+
+            if self._draining:
+                self._shutdown_read(sock)
+
+        token = None
+        pending = _PendingRequests(self._max_pending_requests)
+
+        try:
+            conn = self._create_connection(sock, address)
+            token = set_current_connection(conn)
+
+            # Processors of the connection are needed only if the requests
+            # are processed by the connection thread.
+
+            if self._proc_pool == None:
+                proc = self._processor_factory()
+                codec = self._create_codec()
+            else:
+                proc = None
+                codec = None
+
+            while self._serve_one(sock, conn, proc, codec, pending):
+                pass
+        except (OSError, EOFError, MessageLimitException):
+            # Connection is broken or the peer misbehaves, close it.
+
+            pass
+        finally:
+            # The socket is closed when we return, wait for the requests
+            # being processed.
+
+            pending.wait_all()
+
+            if token != None:
+                reset_current_connection(token)
+
+            with self._lock:
+                self._conns.discard(sock)
+                self._conns_closed.notify_all()
+
+    def _shutdown_read(self, sock):
+        # Reading the next request returns EOF, replies can still be sent.
+
+        try:
+            sock.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+    def _serve_one(self, sock, conn, proc, codec, pending):
+        frame = recv_frame(sock, self._pool, self._max_message_size)
+        if frame == None:
+            return False
+
+        (buf, size) = frame
+        (factory, request_id) = self._peek_request(buf, size)
+
+        if request_id == None:
+            if self._proc_pool != None:
+                process_one = lambda tr: self._proc_pool.process(tr, conn)
+            else:
+                process_one = lambda tr: proc.process_one(tr, codec)
+
+            finished = self._process(sock, process_one, buf, size, pending)
+
+            return finished
+
+        # Process the request in the thread pool.
+
+        pending.acquire()
+
+        try:
+            self._get_processor_pool().submit(lambda proc, codec: self._process_pending(sock, conn, proc, codec, buf, size, pending, factory, request_id))
+        except:
+            pending.release()
+            self._pool.release(buf)
+
+            raise
+
+        return True
+
+    def _process(self, sock, process_one, buf, size, pending):
+        tr = MemoryTransport(memoryview(buf)[:size])
+        tr.set_buffer_pool(self._pool)
+
+        try:
+            finished = process_one(tr)
+            if not finished:
+                return False
+
+            with pending.get_send_lock():
+                send_frame(sock, tr.get_segments(), tr.get_segments_size())
+        finally:
+            tr.close()
+
+            # The pool doesn't take it back, if decoded values still
+            # reference it.
+
+            self._pool.release(buf)
+
+        return True
+
+    def _process_pending(self, sock, conn, proc, codec, buf, size, pending, factory, request_id):
+        token = set_current_connection(conn)
+
+        try:
+            finished = self._process(sock, lambda tr: proc.process_one(tr, codec), buf, size, pending)
+        except OSError:
+            finished = False
+        except Exception:
+            self._server.handle_error(sock, conn.get_peer_address())
+
+            # Fail only this request, the connection is kept open for the
+            # other ones.
+
+            try:
+                self._send_error(sock, factory, request_id, pending)
+                finished = True
+            except OSError:
+                finished = False
+        finally:
+            reset_current_connection(token)
+            pending.release()
+
+        if not finished:
+            # Close the connection, the thread serving it will return.
+
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _send_error(self, sock, factory, request_id, pending):
+        msg = ErrorMessage(_INTERNAL_ERROR)
+        msg.set_request_id(request_id)
+
+        tr = MemoryTransport()
+        codec = factory()
+        codec.set_transport(tr)
+
+        tr.set_state(TransportState.WRITE_BEGIN)
+        codec.write_message_begin(msg)
+        codec.write_message_end()
+        tr.set_state(TransportState.WRITE_END)
+
+        with pending.get_send_lock():
+            send_frame(sock, tr.get_segments(), tr.get_segments_size())
+
+    def _peek_request(self, buf, size):
+        # Return the codec factory and the request id of the message.
+
+        view = memoryview(buf)[:size]
+
+        try:
+            if isinstance(self._codec, CodecRegistry):
+                (factory, content_type) = self._codec.lookup(MemoryTransport(view))
+            else:
+                factory = self._codec
+
+            request_id = factory.peek_request_id(view)
+        except MessageDecodeException:
+            # Invalid messages are reported by the processor.
+
+            factory = None
+            request_id = None
+
+        return (factory, request_id)
+
+    def _create_codec(self):
+        if isinstance(self._codec, CodecRegistry):
+            codec = self._codec
+        else:
+            codec = self._codec()
+
+        return codec
+
+    def _get_processor_pool(self):
+        if self._proc_pool != None:
+            return self._proc_pool
+
+        with self._lock:
+            if self._own_proc_pool == None:
+                self._own_proc_pool = ProcessorPool(self._processor_factory, self._codec, self._max_workers)
+
+            pool = self._own_proc_pool
+
+        return pool
+
+class _PendingRequests:
+    """Requests of a connection being processed by the thread pool."""
+
+    def __init__(self, max_count):
+        self._max_count = max_count
+        self._sem = threading.BoundedSemaphore(max_count)
+        self._send_lock = threading.Lock()
+
+    def get_send_lock(self):
+        # Replies of concurrent requests must not be interleaved.
+
+        return self._send_lock
+
+    def acquire(self):
+        self._sem.acquire()
+
+    def release(self):
+        self._sem.release()
+
+    def wait_all(self):
+        for i in range(self._max_count):
+            self._sem.acquire()
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class _ReusePortThreadingTCPServer(_ThreadingTCPServer):
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        super().server_bind()
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.myrpc_server._serve_connection(self.request, self.client_address)
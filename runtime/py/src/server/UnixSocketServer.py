@@ -0,0 +1,51 @@
+import os
+import socketserver
+
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.server.Connection import Connection, get_socket_peer_credentials
+from myrpc.server.SocketServer import SocketServer, _ConnectionHandler
+
+class UnixSocketServer(SocketServer):
+    """Server for framed messages (see Framing) on Unix domain socket connections.
+
+    It works like SocketServer, but listens on the socket file path, and
+    the credentials of the client process are available for method
+    implementations (see Connection.get_peer_credentials()). Access to the
+    server can be restricted with the permissions of the socket file (or
+    its directory). On Linux, path can also be an abstract socket address
+    (starting with a NUL character).
+
+    The socket file is removed by close(). It is not removed on startup, the
+    stale socket file of a crashed server has to be removed by the caller.
+    """
+
+    def __init__(self, path, processor_factory, codec = BinaryCodec):
+        super().__init__(path, processor_factory, codec)
+
+        self._path = path
+
+    def close(self):
+        super().close()
+
+        if (isinstance(self._path, (str, bytes)) and
+            self._path[:1] not in ("\0", b"\0")):
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+
+    def _create_server(self, address):
+        server = _ThreadingUnixStreamServer(address, _ConnectionHandler)
+
+        return server
+
+    def _setup_connection(self, sock):
+        pass
+
+    def _create_connection(self, sock, address):
+        conn = Connection(address, get_socket_peer_credentials(sock))
+
+        return conn
+
+class _ThreadingUnixStreamServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
@@ -0,0 +1,269 @@
+import http.client
+import threading
+
+from myrpc.Common import MessageLimitException
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.codec.CodecRegistry import CodecRegistry
+from myrpc.server.Connection import Connection, set_current_connection, reset_current_connection
+from myrpc.transport.BufferPool import DefaultBufferPool
+from myrpc.transport.MemoryTransport import MemoryTransport
+from myrpc.transport.SpoolBuffer import CHUNK_SIZE, SpoolBuffer
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+class WSGIApplication:
+    """WSGI application processing the requests (POST bodies) by a processor.
+
+    Every thread of the WSGI server has its own processor (created by
+    processor_factory, e.g. lambda: Processor(impl)), therefore processors
+    don't need to be thread-safe. codec is a codec factory (e.g. BinaryCodec)
+    or a CodecRegistry, in the latter case the codec is selected by the
+    Content-Type of the request, and the reply is written with the same
+    codec.
+
+    The request body is read (with readinto, if wsgi.input supports it)
+    into a buffer of the buffer pool, or into a SpoolBuffer if it is larger
+    than the spill threshold. The reply is streamed from the segments of
+    the transport with Content-Length set. Method implementations can get
+    information about the client with get_current_connection() (see
+    Connection).
+
+    Asynchronous method execution (ProcessorNotFinished) is not supported,
+    500 is returned in this case (see ASGIApplication).
+    """
+
+    def __init__(self, processor_factory, codec = BinaryCodec):
+        self._processor_factory = processor_factory
+        self._codec = codec
+        self._max_message_size = None
+        self._spill_threshold = None
+        self._pool = DefaultBufferPool
+
+        self._local = threading.local()
+
+    def set_max_message_size(self, size):
+        """Limit the size of requests (None means unlimited), 413 is returned for larger ones."""
+
+        self._max_message_size = size
+
+    def set_spill_threshold(self, size):
+        """Spill requests larger than size bytes to a temporary file (None means never)."""
+
+        self._spill_threshold = size
+
+    def set_buffer_pool(self, pool):
+        self._pool = pool
+
+    def __call__(self, environ, start_response):
+        if environ["REQUEST_METHOD"] != "POST":
+            return self._error(start_response, http.client.METHOD_NOT_ALLOWED, [("Allow", "POST")])
+
+        try:
+            size = int(environ["CONTENT_LENGTH"])
+        except (KeyError, ValueError):
+            size = None
+
+        # Without Content-Length, the body can be read only if the server
+        # marks its end (e.g. chunked transfer encoding).
+
+        if size == None and not environ.get("wsgi.input_terminated", False):
+            return self._error(start_response, http.client.LENGTH_REQUIRED)
+
+        body = _RequestBody(self._pool)
+        tr = None
+
+        try:
+            try:
+                rbuf = body.read(environ["wsgi.input"], size, self._max_message_size, self._spill_threshold)
+            except MessageLimitException:
+                return self._error(start_response, http.client.REQUEST_ENTITY_TOO_LARGE)
+
+            if rbuf == None:
+                return self._error(start_response, http.client.BAD_REQUEST)
+
+            tr = MemoryTransport(rbuf)
+            tr.set_buffer_pool(self._pool)
+            tr.set_content_type(environ.get("CONTENT_TYPE"))
+
+            if not self._process(environ, tr):
+                return self._error(start_response, http.client.INTERNAL_SERVER_ERROR)
+
+            response_headers = [("Content-Type", tr.get_content_type() or DEFAULT_CONTENT_TYPE),
+                                ("Content-Length", str(tr.get_segments_size()))]
+
+            start_response("{} {}".format(http.client.OK, http.client.responses[http.client.OK]), response_headers)
+
+            # The reply releases the buffers when it is sent.
+
+            reply = _ReplyIterable(tr, body)
+            tr = None
+            body = None
+        finally:
+            if tr != None:
+                tr.close()
+
+            if body != None:
+                body.close()
+
+        return reply
+
+    def _process(self, environ, tr):
+        (proc, codec) = self._get_processor()
+
+        try:
+            port = int(environ["REMOTE_PORT"])
+        except (KeyError, ValueError):
+            peer_address = environ.get("REMOTE_ADDR")
+        else:
+            peer_address = (environ.get("REMOTE_ADDR"), port)
+
+        token = set_current_connection(Connection(peer_address))
+
+        try:
+            finished = proc.process_one(tr, codec)
+        except:
+            self._local.proc = None
+
+            raise
+        finally:
+            reset_current_connection(token)
+
+        # The unfinished call would be kept by the processor.
+
+        if not finished:
+            self._local.proc = None
+
+        return finished
+
+    def _get_processor(self):
+        proc = getattr(self._local, "proc", None)
+
+        if proc == None:
+            if isinstance(self._codec, CodecRegistry):
+                codec = self._codec
+            else:
+                codec = self._codec()
+
+            proc = (self._processor_factory(), codec)
+            self._local.proc = proc
+
+        return proc
+
+    def _error(self, start_response, status, headers = ()):
+        body = "{} {}".format(status, http.client.responses[status]).encode("ascii")
+
+        start_response(body.decode("ascii"), [("Content-Type", "text/plain"),
+                                              ("Content-Length", str(len(body)))] + list(headers))
+
+        return [body]
+
+class _RequestBody:
+    """Request body read into a pooled buffer or a SpoolBuffer."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._buf = None
+        self._spool = None
+
+    def read(self, f, size, max_size, spill_threshold):
+        """Read the body of size bytes (None means until EOF) from f, return it as memoryview.
+
+        None is returned if the body is truncated.
+        """
+
+        if size != None:
+            if max_size != None and size > max_size:
+                raise MessageLimitException("Message size {} exceeds {} bytes".format(size, max_size))
+
+            if spill_threshold != None and size > spill_threshold:
+                self._spool = SpoolBuffer(spill_threshold)
+
+                if self._spool.readfrom(_Reader(f), size) < size:
+                    return None
+
+                return self._spool.get_view()
+
+            self._buf = self._pool.acquire(size)
+
+            with memoryview(self._buf) as view:
+                if _Reader(f).readinto_all(view[:size]) < size:
+                    return None
+
+            return memoryview(self._buf)[:size]
+
+        self._spool = SpoolBuffer(spill_threshold)
+
+        while True:
+            buf = f.read(CHUNK_SIZE)
+            if not buf:
+                break
+
+            self._spool.write(buf)
+
+            if max_size != None and self._spool.get_size() > max_size:
+                raise MessageLimitException("Message size exceeds {} bytes".format(max_size))
+
+        return self._spool.get_view()
+
+    def close(self):
+        # The pool doesn't take it back, if decoded values still reference it.
+
+        if self._buf != None:
+            self._pool.release(self._buf)
+            self._buf = None
+
+        if self._spool != None:
+            self._spool.close()
+            self._spool = None
+
+class _Reader:
+    """readinto for WSGI input streams, which are required to have only read()."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def readinto(self, view):
+        if hasattr(self._f, "readinto"):
+            return self._f.readinto(view)
+
+        buf = self._f.read(len(view))
+        count = len(buf)
+        view[:count] = buf
+
+        return count
+
+    def readinto_all(self, view):
+        count = 0
+        size = len(view)
+
+        while count < size:
+            with view[count:] as chunk_view:
+                n = self.readinto(chunk_view)
+
+            if not n:
+                break
+
+            count += n
+
+        return count
+
+class _ReplyIterable:
+    """Reply body streamed from the segments of the transport.
+
+    The transport and the request body are released by close(), which is
+    called by the WSGI server when the reply is sent.
+    """
+
+    def __init__(self, tr, body):
+        self._tr = tr
+        self._body = body
+
+    def __iter__(self):
+        # WSGI requires bytes.
+
+        for seg in self._tr.get_segments():
+            yield bytes(seg)
+
+    def close(self):
+        self._tr.close()
+        self._body.close()
@@ -0,0 +1,247 @@
+import asyncio
+import http.client
+import ssl
+import urllib.parse
+
+from myrpc.transport.AsyncTransportBase import AsyncTransportBase
+from myrpc.transport.HTTPClientTransport import HTTPClientException
+from myrpc.transport.SpoolBuffer import CHUNK_SIZE
+
+_ENCODING = "latin-1"
+_MAX_HEADERS = 100
+
+# Errors of reused connections which mean that the server closed the
+# connection while it was idle.
+_STALE_EXCEPTIONS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+class AsyncHTTPClientTransport(AsyncTransportBase):
+    """Provide asyncio HTTP client transport.
+
+    Requests are sent on a persistent (keep-alive) HTTP/1.1 connection,
+    which is opened on the first transfer(). If the server has closed the
+    connection while it was idle, the request is retried once on a new
+    connection. Requests are never resent after they are sent completely.
+    Errors are reported by HTTPClientException.
+    """
+
+    def __init__(self, url, ssl_context = None):
+        super().__init__()
+
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+
+        if scheme == "http":
+            self._ssl = None
+            default_port = http.client.HTTP_PORT
+        elif scheme == "https":
+            self._ssl = ssl_context if ssl_context != None else ssl.create_default_context()
+            default_port = http.client.HTTPS_PORT
+        else:
+            raise ValueError("Unsupported URL scheme {}".format(scheme))
+
+        self._host = parts.hostname
+        self._port = parts.port if parts.port != None else default_port
+        self._netloc = parts.netloc.rpartition("@")[2]
+
+        self._path = parts.path if parts.path else "/"
+        if parts.query:
+            self._path += "?" + parts.query
+
+        self._reader = None
+        self._writer = None
+
+    async def transfer(self):
+        try:
+            if self._timeout != None:
+                buf = await asyncio.wait_for(self._transfer(), self._timeout)
+            else:
+                buf = await self._transfer()
+        except (OSError, EOFError, ValueError, http.client.HTTPException, asyncio.TimeoutError) as e:
+            self._close_connection()
+
+            raise HTTPClientException(e)
+        except:
+            self._close_connection()
+
+            raise
+        finally:
+            self._reset_segments()
+
+        self._set_rbuf(buf)
+
+    async def aclose(self):
+        writer = self._writer
+
+        self._reader = None
+        self._writer = None
+
+        if writer != None:
+            writer.close()
+
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+        await super().aclose()
+
+    async def _transfer(self):
+        if self._writer != None:
+            # Let the event loop process a pending end of stream, then check
+            # whether the server has closed the connection while it was idle.
+
+            await asyncio.sleep(0)
+
+            if self._reader.at_eof() or self._writer.is_closing():
+                self._close_connection()
+
+        reused = (self._writer != None)
+
+        if not reused:
+            await self._open_connection()
+
+        try:
+            await self._send_request()
+        except _STALE_EXCEPTIONS:
+            # The server couldn't receive the whole request, it is safe to
+            # send it again.
+
+            if not reused:
+                raise
+
+            self._close_connection()
+            await self._open_connection()
+
+            await self._send_request()
+
+        return await self._read_response()
+
+    async def _open_connection(self):
+        (self._reader, self._writer) = await asyncio.open_connection(self._host, self._port, ssl = self._ssl)
+
+    async def _send_request(self):
+        content_type = self._content_type if self._content_type != None else "application/octet-stream"
+
+        head = ("POST {} HTTP/1.1\r\n"
+                "Host: {}\r\n"
+                "Content-Type: {}\r\n"
+                "Content-Length: {}\r\n"
+                "\r\n").format(self._path, self._netloc, content_type, self._get_segments_size())
+
+        self._writer.writelines([head.encode(_ENCODING)] + self._get_segments())
+        await self._writer.drain()
+
+    async def _read_response(self):
+        # Status line.
+
+        line = await self._reader.readline()
+        if len(line) == 0:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+
+        try:
+            (version, status, reason) = (str(line, _ENCODING).rstrip("\r\n").split(" ", 2) + [""])[:3]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(line)
+
+        if not version.startswith("HTTP/1."):
+            raise http.client.BadStatusLine(line)
+
+        # Headers.
+
+        headers = {}
+
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n"):
+                break
+
+            if len(line) == 0:
+                raise http.client.IncompleteRead(b"")
+
+            if len(headers) >= _MAX_HEADERS:
+                raise http.client.HTTPException("Too many headers")
+
+            (name, sep, value) = str(line, _ENCODING).partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (version != "HTTP/1.0")
+        connection = headers.get("connection", "").lower()
+
+        if connection == "close":
+            keep_alive = False
+        elif connection == "keep-alive":
+            keep_alive = True
+
+        if not (200 <= status < 300):
+            self._close_connection()
+
+            raise HTTPClientException("HTTP Error {}: {}".format(status, reason))
+
+        # Body.
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            buf = await self._read_chunked()
+        elif "content-length" in headers:
+            size = int(headers["content-length"])
+            self._check_message_size(size)
+
+            buf = await self._reader.readexactly(size)
+        else:
+            buf = await self._read_until_eof()
+
+            keep_alive = False
+
+        if not keep_alive:
+            self._close_connection()
+
+        return buf
+
+    async def _read_chunked(self):
+        buf = bytearray()
+
+        while True:
+            line = await self._reader.readline()
+            size = int(line.split(b";", 1)[0], 16)
+
+            if size == 0:
+                break
+
+            self._check_message_size(len(buf) + size)
+
+            buf += await self._reader.readexactly(size)
+            await self._reader.readexactly(2)
+
+        # Skip trailers.
+
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+        return buf
+
+    async def _read_until_eof(self):
+        # Read in chunks to stop at the message size limit.
+
+        buf = bytearray()
+
+        while True:
+            data = await self._reader.read(CHUNK_SIZE)
+            if len(data) == 0:
+                break
+
+            self._check_message_size(len(buf) + len(data))
+
+            buf += data
+
+        return buf
+
+    def _close_connection(self):
+        # Unsent data (which may reference our buffers) is discarded.
+
+        if self._writer != None:
+            self._writer.transport.abort()
+
+        self._reader = None
+        self._writer = None
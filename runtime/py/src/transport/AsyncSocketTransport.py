@@ -0,0 +1,111 @@
+import asyncio
+import socket
+
+from myrpc.transport.TransportBase import TransportException
+from myrpc.transport.AsyncTransportBase import AsyncTransportBase
+from myrpc.transport.Framing import FRAME_HEADER_SIZE, pack_frame_header, unpack_frame_header
+
+class AsyncSocketTransport(AsyncTransportBase):
+    """Provide asyncio TCP client transport.
+
+    Messages are framed (see Framing), and sent on a persistent connection,
+    which is opened on the first transfer(). If the transfer fails (or is
+    cancelled), the connection is closed, and a new one is opened on the
+    next transfer().
+    """
+
+    def __init__(self, host, port):
+        super().__init__()
+
+        self._host = host
+        self._port = port
+        self._reader = None
+        self._writer = None
+
+    async def transfer(self):
+        try:
+            if self._timeout != None:
+                buf = await asyncio.wait_for(self._transfer(), self._timeout)
+            else:
+                buf = await self._transfer()
+        except (OSError, EOFError, asyncio.TimeoutError) as e:
+            self._close_connection()
+
+            raise AsyncSocketTransportException(e)
+        except:
+            self._close_connection()
+
+            raise
+        finally:
+            self._reset_segments()
+
+        self._set_rbuf(buf)
+
+    async def aclose(self):
+        writer = self._writer
+
+        self._reader = None
+        self._writer = None
+
+        if writer != None:
+            writer.close()
+
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+        await super().aclose()
+
+    async def _open_connection(self):
+        (reader, writer) = await asyncio.open_connection(self._host, self._port)
+
+        sock = writer.get_extra_info("socket")
+        if sock != None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        return (reader, writer)
+
+    async def _transfer(self):
+        if self._writer == None:
+            (self._reader, self._writer) = await self._open_connection()
+
+        # The frame header and the segments are passed to the event loop
+        # without joining them.
+
+        segs = self._get_segments()
+        header = pack_frame_header(self._get_segments_size())
+
+        self._writer.writelines([header] + segs)
+        await self._writer.drain()
+
+        # IncompleteReadError is EOFError.
+
+        header = await self._reader.readexactly(FRAME_HEADER_SIZE)
+        size = unpack_frame_header(header)
+
+        self._check_message_size(size)
+
+        buf = await self._reader.readexactly(size)
+
+        return buf
+
+    def _close_connection(self):
+        # Unsent data (which may reference our buffers) is discarded.
+
+        if self._writer != None:
+            self._writer.transport.abort()
+
+        self._reader = None
+        self._writer = None
+
+class AsyncSocketTransportException(TransportException):
+    """Exception class for socket errors."""
+
+    def __init__(self, reason):
+        super().__init__(str(reason))
+
+        self._reason = reason
+
+    def get_reason(self):
+        return self._reason
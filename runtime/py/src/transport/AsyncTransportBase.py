@@ -0,0 +1,68 @@
+from abc import abstractmethod
+
+from myrpc.Common import MessageTruncatedException
+from myrpc.transport.TransportBase import TransportState, TransportBase
+
+class AsyncTransportBase(TransportBase):
+    """Base class for asyncio client transport implementation classes.
+
+    Codecs read and write synchronously, therefore the I/O is separated:
+    the request written between WRITE_BEGIN...WRITE_END is collected in
+    memory, transfer() sends it and receives the response, which is read
+    between READ_BEGIN...READ_END from memory (read() returns memoryview
+    slices of it). See AsyncClientSubr.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self._timeout = None
+        self._set_rbuf(b"")
+
+    def set_state(self, state):
+        if state == TransportState.READ_BEGIN:
+            self._check_message_size(self._rsize)
+        elif state == TransportState.READ_END:
+            self._set_rbuf(b"")
+        elif state == TransportState.WRITE_BEGIN:
+            self._set_rbuf(b"")
+            self._reset_segments()
+
+    def read(self, count):
+        end = self._rpos + count
+        if end > self._rsize:
+            raise MessageTruncatedException()
+
+        buf = self._rbuf[self._rpos:end]
+        self._rpos = end
+
+        return buf
+
+    def peek(self, count):
+        buf = self._rbuf[self._rpos:self._rpos + count]
+
+        return buf
+
+    def write(self, buf):
+        self._write_segment(buf)
+
+    def set_timeout(self, timeout):
+        """Set the timeout of transfer() in seconds (None means no timeout)."""
+
+        self._timeout = timeout
+
+    @abstractmethod
+    async def transfer(self):
+        """Send the request, and receive the response."""
+
+        pass
+
+    async def aclose(self):
+        """Close the connection, and return buffers to the pool."""
+
+        self.close()
+
+    def _set_rbuf(self, buf):
+        self._rbuf = memoryview(buf)
+        self._rpos = 0
+        self._rsize = len(self._rbuf)
@@ -0,0 +1,21 @@
+import asyncio
+
+from myrpc.transport.AsyncSocketTransport import AsyncSocketTransport
+
+class AsyncUnixSocketTransport(AsyncSocketTransport):
+    """Provide asyncio Unix domain socket client transport.
+
+    It works like AsyncSocketTransport, but connects to the socket file path
+    of a server on the same host, see UnixSocketServer. Errors are reported
+    by AsyncSocketTransportException.
+    """
+
+    def __init__(self, path):
+        super().__init__(None, None)
+
+        self._path = path
+
+    async def _open_connection(self):
+        (reader, writer) = await asyncio.open_unix_connection(self._path)
+
+        return (reader, writer)
@@ -0,0 +1,99 @@
+import threading
+
+class BufferPool:
+    """Thread-safe pool of reusable bytearray buffers.
+
+    Buffers are grouped into size classes (powers of two, starting from
+    min_size). acquire(size) returns a buffer of the smallest class fitting
+    size, therefore the buffer can be longer than requested. Buffers larger
+    than max_size are not pooled, and at most max_retained bytes are kept
+    in the pool.
+
+    Buffers still referenced by memoryviews (e.g. decoded binary fields) are
+    not taken back by release(), they are freed by the garbage collector.
+    """
+
+    def __init__(self, min_size = 4096, max_size = 16 * 1024 * 1024, max_retained = 64 * 1024 * 1024):
+        self._min_bits = (min_size - 1).bit_length()
+        self._max_size = max_size
+        self._max_retained = max_retained
+
+        self._lock = threading.Lock()
+        self._classes = {}
+        self._retained = 0
+        self._hits = 0
+        self._misses = 0
+
+    def acquire(self, size):
+        """Return a buffer of at least size bytes."""
+
+        bits = max(self._min_bits, (size - 1).bit_length())
+        class_size = 1 << bits
+
+        if class_size > self._max_size:
+            with self._lock:
+                self._misses += 1
+
+            return bytearray(size)
+
+        with self._lock:
+            bufs = self._classes.get(bits)
+
+            if bufs:
+                self._hits += 1
+                self._retained -= class_size
+
+                return bufs.pop()
+
+            self._misses += 1
+
+        return bytearray(class_size)
+
+    def release(self, buf):
+        """Return buf to the pool, return True if it is retained."""
+
+        buflen = len(buf)
+        bits = (buflen - 1).bit_length()
+
+        # Only buffers of pool size classes are retained.
+
+        if (buflen != 1 << bits or
+            bits < self._min_bits or
+            buflen > self._max_size):
+            return False
+
+        # Exported buffers can't be resized, use this to detect references.
+
+        try:
+            buf.append(0)
+            del buf[-1]
+        except BufferError:
+            return False
+
+        with self._lock:
+            if self._retained + buflen > self._max_retained:
+                return False
+
+            self._classes.setdefault(bits, []).append(buf)
+            self._retained += buflen
+
+        return True
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    def get_retained(self):
+        """Return the number of bytes kept in the pool."""
+
+        return self._retained
+
+    def clear(self):
+        with self._lock:
+            self._classes = {}
+            self._retained = 0
+
+# Pool used by transports by default (see TransportBase.set_buffer_pool).
+DefaultBufferPool = BufferPool()
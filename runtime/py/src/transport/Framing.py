@@ -0,0 +1,109 @@
+import struct
+
+from myrpc.Common import MessageEncodeException, MessageLimitException
+
+# Messages on stream sockets are framed: every message is preceded by its
+# size (32 bits, network byte order).
+FRAME_HEADER_FORMAT = "!I"
+FRAME_HEADER_SIZE = 4
+MAX_FRAME_SIZE = 0xffffffff
+
+# Maximal number of buffers passed to sendmsg (the minimum of IOV_MAX on
+# common platforms).
+_IOV_MAX = 1024
+
+def pack_frame_header(size):
+    if size > MAX_FRAME_SIZE:
+        raise MessageEncodeException("Message size {} is too large".format(size))
+
+    buf = struct.pack(FRAME_HEADER_FORMAT, size)
+
+    return buf
+
+def unpack_frame_header(buf):
+    (size,) = struct.unpack(FRAME_HEADER_FORMAT, buf)
+
+    return size
+
+def send_frame(sock, segs, size):
+    """Send the frame of segs (size bytes in total) on blocking socket sock.
+
+    The frame header and the segments are sent with one sendmsg call if
+    possible, without joining them.
+    """
+
+    bufs = [pack_frame_header(size)]
+    bufs.extend(segs)
+
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(bufs))
+
+        return
+
+    views = [memoryview(buf) for buf in bufs if len(buf) > 0]
+    i = 0
+
+    # sendmsg may send less than requested, continue with the rest.
+
+    while i < len(views):
+        count = sock.sendmsg(views[i:i + _IOV_MAX])
+
+        while count > 0:
+            viewlen = len(views[i])
+
+            if count >= viewlen:
+                count -= viewlen
+                i += 1
+            else:
+                views[i] = views[i][count:]
+                count = 0
+
+def recv_frame(sock, pool, max_size = None):
+    """Receive a frame from blocking socket sock into a buffer acquired from pool.
+
+    Return (buf, size), buf can be longer than size. Return None if the
+    connection is closed before the frame. Throw EOFError if it is closed
+    inside the frame, and MessageLimitException if the frame is larger
+    than max_size.
+    """
+
+    header = bytearray(FRAME_HEADER_SIZE)
+
+    if not _recv_exactly(sock, memoryview(header), True):
+        return None
+
+    size = unpack_frame_header(header)
+
+    if (max_size != None and
+        size > max_size):
+        raise MessageLimitException("Message size {} exceeds {} bytes".format(size, max_size))
+
+    buf = pool.acquire(size)
+
+    try:
+        with memoryview(buf) as view:
+            _recv_exactly(sock, view[:size], False)
+    except:
+        pool.release(buf)
+
+        raise
+
+    return (buf, size)
+
+def _recv_exactly(sock, view, eof_ok):
+    count = 0
+    viewlen = len(view)
+
+    while count < viewlen:
+        n = sock.recv_into(view[count:])
+
+        if n == 0:
+            if (count == 0 and
+                eof_ok):
+                return False
+
+            raise EOFError("Connection closed inside frame")
+
+        count += n
+
+    return True
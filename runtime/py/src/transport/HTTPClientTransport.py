@@ -1,36 +1,67 @@
 import http.client
-import io
+import urllib.parse
 import urllib.request
 import urllib.error
 
 from myrpc.Common import MessageTruncatedException
 from myrpc.transport.TransportBase import TransportState, TransportBase, TransportException
+from myrpc.transport.SpoolBuffer import CHUNK_SIZE, SpoolBuffer
+from myrpc.transport.HTTPConnectionPool import DefaultHTTPConnectionPool
+
+# Errors of reused connections which mean that the server closed the
+# connection while it was idle.
+_STALE_EXCEPTIONS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
 
 class HTTPClientTransport(TransportBase):
-    """Provide HTTP client transport."""
+    """Provide HTTP client transport.
+
+    The request is sent as the list of written segments, and the response is
+    read into a single buffer. read() returns memoryview slices of it,
+    therefore binary fields are not copied by the transport (see
+    BinaryCodec.set_zero_copy for decoding them without copying).
+
+    Requests are sent on persistent connections of the connection pool (see
+    HTTPConnectionPool). If sending the request fails because the server
+    has closed a reused connection, the request is retried once on a new
+    connection. Requests are never resent after they are sent completely.
+    Redirects are not followed on pooled connections (non-2xx responses
+    throw HTTPClientException). If an opener is set, pooling is disabled,
+    or a proxy is configured for the URL in the environment (e.g.
+    http_proxy), urllib is used instead.
+    """
 
     def __init__(self, url):
         super().__init__()
 
         self._url = url
+        self._proxied = _is_proxied(url)
+        self._conn_pool = DefaultHTTPConnectionPool
         self._opener = None
         self._timeout = None
+        self._rbuf = None
+        self._rpool_buf = None
+        self._rspool = None
 
     def set_state(self, state):
-        if state == TransportState.WRITE_BEGIN:
+        if state == TransportState.READ_END:
+            self._release_rbuf()
+        elif state == TransportState.WRITE_BEGIN:
             self._reset()
         elif state == TransportState.WRITE_END:
             self._flush()
 
     def read(self, count):
-        buf = self._rf.read(count)
-        if len(buf) < count:
+        end = self._rpos + count
+        if end > self._rsize:
             raise MessageTruncatedException()
 
+        buf = self._rbuf[self._rpos:end]
+        self._rpos = end
+
         return buf
 
     def write(self, buf):
-        self._wf.write(buf)
+        self._write_segment(buf)
 
     def set_opener(self, opener):
         self._opener = opener
@@ -38,28 +69,219 @@ class HTTPClientTransport(TransportBase):
     def set_timeout(self, timeout):
         self._timeout = timeout
 
+    def set_connection_pool(self, pool):
+        """Set the HTTPConnectionPool used for requests (None disables pooling)."""
+
+        self._conn_pool = pool
+
+    def warmup(self, count = 1):
+        """Connect count connections to the server in advance (see HTTPConnectionPool.warmup)."""
+
+        if self._conn_pool == None:
+            return
+
+        try:
+            self._conn_pool.warmup(self._url, count, self._timeout)
+        except OSError as e:
+            raise HTTPClientException(e)
+
     def _reset(self):
-        self._rf = None
-        self._wf = io.BytesIO()
+        self._release_rbuf()
+        self._rpos = 0
+        self._rsize = 0
+        self._reset_segments()
 
     def _flush(self):
-        wbuf = self._wf.getvalue()
+        if (self._conn_pool != None and
+            self._opener == None and
+            not self._proxied):
+            self._flush_pooled()
+        else:
+            self._flush_urllib()
+
+    def _flush_pooled(self):
+        try:
+            key = self._conn_pool.get_key(self._url)
+        except ValueError as e:
+            raise HTTPClientException(e)
+
+        (conn, reused) = self._conn_pool.acquire(key, self._timeout)
+        reusable = False
+
+        try:
+            try:
+                self._send_request(conn)
+            except _STALE_EXCEPTIONS:
+                # The server couldn't receive the whole request, it is safe
+                # to send it again.
+
+                if not reused:
+                    raise
+
+                conn.close()
+                conn = self._conn_pool.connect(key, self._timeout)
+                self._send_request(conn)
+
+            resp = conn.getresponse()
+
+            if not (200 <= resp.status < 300):
+                raise HTTPClientException("HTTP Error {}: {}".format(resp.status, resp.reason))
+
+            self._read_resp(resp)
+
+            # The connection can be reused only if the response is read
+            # completely.
+
+            reusable = (resp.isclosed() and
+                        not resp.will_close)
+        except (http.client.HTTPException, OSError) as e:
+            raise HTTPClientException(e)
+        finally:
+            if reusable:
+                self._conn_pool.release(key, conn)
+            else:
+                conn.close()
+
+            self._reset_segments()
+
+    def _send_request(self, conn):
+        # Send the segments one after another without joining them, this
+        # requires explicit Content-Length.
+
+        parts = urllib.parse.urlsplit(self._url)
+        path = parts.path if parts.path else "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        conn.putrequest("POST", path)
+        conn.putheader("Content-Type", self._get_request_content_type())
+        conn.putheader("Content-Length", str(self._get_segments_size()))
+        conn.endheaders()
+
+        for seg in self._get_segments():
+            conn.send(seg)
+
+    def _flush_urllib(self):
+        # Send the segments one after another without joining them, this
+        # requires explicit Content-Length.
 
-        req = urllib.request.Request(self._url, data = wbuf, method = "POST")
-        req.add_header("Content-Type", "application/octet-stream")
+        segs = self._get_segments()
+
+        req = urllib.request.Request(self._url, data = segs, method = "POST")
+        req.add_header("Content-Type", self._get_request_content_type())
+        req.add_header("Content-Length", str(self._get_segments_size()))
 
         opener = self._opener.open if self._opener else urllib.request.urlopen
 
         try:
-            resp = opener(req, timeout = self._timeout)
-            rbuf = resp.read()
+            with opener(req, timeout = self._timeout) as resp:
+                self._read_resp(resp)
         except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
             # FIXME: Is it good idea to convert all of those exceptions to
             # HTTPClientException?
 
             raise HTTPClientException(e)
+        finally:
+            self._reset_segments()
+
+    def _get_request_content_type(self):
+        content_type = self._content_type if self._content_type != None else "application/octet-stream"
+
+        return content_type
+
+    def _read_resp(self, resp):
+        # length is None if Content-Length is not present.
+
+        rlen = resp.length
+
+        if rlen != None:
+            self._check_message_size(rlen)
+
+        # Large (or unknown size) responses may have to be spilled to disk.
+
+        if (self._spill_threshold != None and
+            (rlen == None or rlen > self._spill_threshold)):
+            spool = SpoolBuffer(self._spill_threshold)
+            self._rspool = spool
+
+            if rlen == None:
+                while True:
+                    buf = resp.read(CHUNK_SIZE)
+                    if len(buf) == 0:
+                        break
+
+                    spool.write(buf)
+                    self._check_message_size(spool.get_size())
+            else:
+                spool.readfrom(resp, rlen)
+
+            rbuf = spool.get_view()
+            rsize = spool.get_size()
+        elif rlen == None:
+            # Read in chunks to stop at the message size limit.
+
+            rbuf = bytearray()
+
+            while True:
+                buf = resp.read(CHUNK_SIZE)
+                if len(buf) == 0:
+                    break
+
+                self._check_message_size(len(rbuf) + len(buf))
+
+                rbuf += buf
+
+            rsize = len(rbuf)
+        else:
+            # Read the body into a preallocated buffer.
+
+            rbuf = self._pool.acquire(rlen)
+            self._rpool_buf = rbuf
+
+            with memoryview(rbuf) as rview:
+                rsize = 0
+
+                while rsize < rlen:
+                    with rview[rsize:rlen] as view:
+                        count = resp.readinto(view)
+
+                    if count == 0:
+                        # Truncated response, read() will throw exception.
+
+                        break
+
+                    rsize += count
+
+        self._rbuf = memoryview(rbuf)
+        self._rsize = rsize
+
+    def _release_rbuf(self):
+        if self._rbuf != None:
+            self._rbuf.release()
+            self._rbuf = None
+
+        # The pool doesn't take it back, if decoded values still reference it.
+
+        if self._rpool_buf != None:
+            self._pool.release(self._rpool_buf)
+            self._rpool_buf = None
+
+        if self._rspool != None:
+            self._rspool.close()
+            self._rspool = None
+
+def _is_proxied(url):
+    # Environment proxy settings are handled only by urllib.
+
+    parts = urllib.parse.urlsplit(url)
+    proxies = urllib.request.getproxies()
+
+    if parts.scheme.lower() not in proxies:
+        return False
+
+    proxied = not urllib.request.proxy_bypass(parts.hostname or "")
 
-        self._rf = io.BytesIO(rbuf)
+    return proxied
 
 class HTTPClientException(TransportException):
     """Exception class for HTTP-related errors."""
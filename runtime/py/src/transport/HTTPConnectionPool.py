@@ -0,0 +1,201 @@
+import http.client
+import select
+import threading
+import time
+import urllib.parse
+
+_DEFAULT_PORTS = {"http": http.client.HTTP_PORT,
+                  "https": http.client.HTTPS_PORT}
+
+class HTTPConnectionPool:
+    """Thread-safe pool of persistent (keep-alive) HTTP connections.
+
+    Idle connections are kept per (scheme, host, port), at most max_size of
+    them per host. acquire() doesn't block: if there is no idle connection,
+    a new one is created, and the surplus is closed on release(). Connections
+    idle for more than idle_timeout seconds (None means forever) are closed
+    (see also evict_idle), and connections closed by the server while idle
+    are dropped on acquire().
+    """
+
+    def __init__(self, max_size = 8, idle_timeout = 60.0, ssl_context = None):
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._ssl_context = ssl_context
+
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def get_key(url):
+        """Return the pool key of url (scheme, host, port)."""
+
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+
+        if scheme not in _DEFAULT_PORTS:
+            raise ValueError("Unsupported URL scheme {}".format(scheme))
+
+        port = parts.port if parts.port != None else _DEFAULT_PORTS[scheme]
+
+        return (scheme, parts.hostname, port)
+
+    def acquire(self, key, timeout = None):
+        """Return (connection, reused) for key.
+
+        reused is True if the connection is taken from the pool, requests
+        on such connections may fail if the server closes the connection
+        in the meantime.
+        """
+
+        now = time.monotonic()
+        conn = None
+        dropped = []
+
+        with self._lock:
+            conns = self._idle.get(key)
+
+            # Most recently used connections are the most likely alive.
+
+            while conns:
+                (c, released) = conns.pop()
+
+                if (self._is_expired(released, now) or
+                    self._is_dropped(c)):
+                    dropped.append(c)
+                else:
+                    conn = c
+                    break
+
+            if conn != None:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+        for c in dropped:
+            c.close()
+
+        if conn == None:
+            conn = self.connect(key, timeout)
+
+            return (conn, False)
+
+        self._set_timeout(conn, timeout)
+
+        return (conn, True)
+
+    def connect(self, key, timeout = None):
+        """Return a new (not yet connected) connection for key."""
+
+        (scheme, host, port) = key
+
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout = timeout, context = self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout = timeout)
+
+        return conn
+
+    def release(self, key, conn):
+        """Return conn (with completely read response) to the pool."""
+
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+
+            if len(conns) < self._max_size:
+                conns.append((conn, time.monotonic()))
+                conn = None
+
+        if conn != None:
+            conn.close()
+
+    def warmup(self, url, count = 1, timeout = None):
+        """Connect count connections to url in advance, and put them into the pool.
+
+        Throw OSError if the connection fails.
+        """
+
+        key = self.get_key(url)
+
+        for i in range(count):
+            conn = self.connect(key, timeout)
+            conn.connect()
+
+            self.release(key, conn)
+
+    def evict_idle(self):
+        """Close connections idle for more than idle_timeout."""
+
+        now = time.monotonic()
+        dropped = []
+
+        with self._lock:
+            for (key, conns) in self._idle.items():
+                alive = []
+
+                for (conn, released) in conns:
+                    if self._is_expired(released, now):
+                        dropped.append(conn)
+                    else:
+                        alive.append((conn, released))
+
+                self._idle[key] = alive
+
+        for conn in dropped:
+            conn.close()
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    def get_idle(self):
+        """Return the number of idle connections in the pool."""
+
+        with self._lock:
+            count = sum([len(conns) for conns in self._idle.values()])
+
+        return count
+
+    def clear(self):
+        """Close all idle connections."""
+
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for conns in idle.values():
+            for (conn, released) in conns:
+                conn.close()
+
+    def _is_expired(self, released, now):
+        return (self._idle_timeout != None and
+                now - released > self._idle_timeout)
+
+    def _is_dropped(self, conn):
+        # Idle connections shouldn't be readable, otherwise the server
+        # closed it (or sent garbage).
+
+        sock = conn.sock
+        if sock == None:
+            return False
+
+        try:
+            (r, w, x) = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+
+        return (len(r) > 0)
+
+    def _set_timeout(self, conn, timeout):
+        conn.timeout = timeout
+
+        if conn.sock != None:
+            conn.sock.settimeout(timeout)
+
+# Pool used by HTTPClientTransport by default (see
+# HTTPClientTransport.set_connection_pool).
+DefaultHTTPConnectionPool = HTTPConnectionPool()
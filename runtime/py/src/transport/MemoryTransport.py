@@ -1,41 +1,82 @@
-import io
-
 from myrpc.Common import MessageTruncatedException
 from myrpc.transport.TransportBase import TransportState, TransportBase
 
 class MemoryTransport(TransportBase):
-    """Provide memory-buffered transport."""
+    """Provide memory-buffered transport.
+
+    read() returns memoryview slices of the read buffer, therefore it is not
+    copied, and it must not be modified while the transport is used.
+    Scratch buffers are drawn from the buffer pool, call close() when the
+    transport is not needed anymore.
+    """
 
     def __init__(self, buf = None):
         """Initialize transport.
 
-        If rbuf is specified, then its content is copied to the read memory buffer.
+        If buf is specified, then it is used as the read buffer.
         """
 
         super().__init__()
 
-        self._rf = io.BytesIO(buf)
-        self._wf = io.BytesIO()
+        self._rbuf = memoryview(buf if buf else b"")
+        self._rpos = 0
+        self._rsize = len(self._rbuf)
 
     def set_state(self, state):
-        if state == TransportState.READ_END:
-            self._rf.truncate(0)
+        if state == TransportState.READ_BEGIN:
+            self._check_message_size(self._rsize)
+        elif state == TransportState.READ_END:
+            self._rbuf = memoryview(b"")
+            self._rpos = 0
+            self._rsize = 0
         elif state == TransportState.WRITE_BEGIN:
-            self._wf.truncate(0)
+            self._reset_segments()
+
+    def close(self):
+        self._rbuf = memoryview(b"")
+        self._rpos = 0
+        self._rsize = 0
+
+        super().close()
 
     def read(self, count):
-        buf = self._rf.read(count)
-        if len(buf) < count:
+        end = self._rpos + count
+        if end > self._rsize:
             raise MessageTruncatedException()
 
+        buf = self._rbuf[self._rpos:end]
+        self._rpos = end
+
+        return buf
+
+    def peek(self, count):
+        buf = self._rbuf[self._rpos:self._rpos + count]
+
         return buf
 
     def write(self, buf):
-        self._wf.write(buf)
+        self._write_segment(buf)
 
     def get_value(self):
         """Return bytes containing the entire contents of the write memory buffer."""
 
-        buf = self._wf.getvalue()
+        buf = b"".join(self._get_segments())
 
         return buf
+
+    def get_segments(self):
+        """Return the contents of the write memory buffer as list of buffers, without copying.
+
+        The buffers are valid until the next WRITE_BEGIN or close().
+        """
+
+        segs = self._get_segments()
+
+        return segs
+
+    def get_segments_size(self):
+        """Return the total size of the write memory buffer."""
+
+        size = self._get_segments_size()
+
+        return size
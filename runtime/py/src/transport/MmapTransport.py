@@ -0,0 +1,103 @@
+import mmap
+
+from myrpc.Common import MessageTruncatedException
+from myrpc.transport.TransportBase import TransportBase, TransportException
+
+class MmapTransport(TransportBase):
+    """Provide read-only transport over a memory-mapped file.
+
+    The file can contain several concatenated messages, they are decoded
+    one after another:
+
+        while tr.has_more():
+            tr.set_state(TransportState.READ_BEGIN)
+            msg = codec.read_message_begin()
+            ...
+            codec.read_message_end()
+            tr.set_state(TransportState.READ_END)
+
+    read() returns memoryview slices of the mapping. They keep the mapping
+    alive after close(), therefore they can be decoded without copying
+    (see BinaryCodec.set_zero_copy).
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+
+        try:
+            with open(filename, mode = "rb") as f:
+                # Empty files can't be mapped.
+
+                try:
+                    self._mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+                except ValueError:
+                    self._mm = None
+        except OSError as e:
+            raise MmapTransportException(e)
+
+        self._view = memoryview(self._mm if self._mm else b"")
+        self._size = len(self._view)
+        self._pos = 0
+
+    def set_state(self, state):
+        pass
+
+    def read(self, count):
+        end = self._pos + count
+        if end > self._size:
+            raise MessageTruncatedException()
+
+        buf = self._view[self._pos:end]
+        self._pos = end
+
+        return buf
+
+    def peek(self, count):
+        buf = self._view[self._pos:self._pos + count]
+
+        return buf
+
+    def write(self, buf):
+        raise MmapTransportException("Transport is read-only")
+
+    def has_more(self):
+        """Return True if there is unread data after the current position."""
+
+        r = (self._pos < self._size)
+
+        return r
+
+    def get_size(self):
+        return self._size
+
+    def get_offset(self):
+        return self._pos
+
+    def set_offset(self, offset):
+        if (offset < 0 or offset > self._size):
+            raise ValueError("Offset {} is out of range".format(offset))
+
+        self._pos = offset
+
+    def close(self):
+        self._view.release()
+
+        if self._mm:
+            try:
+                self._mm.close()
+            except BufferError:
+                # Slices are still referenced, the mapping is released
+                # when the last one is freed.
+
+                pass
+
+class MmapTransportException(TransportException):
+    """Exception class for mmap-related errors."""
+
+    def __init__(self, reason):
+        super().__init__(str(reason))
+
+        self._reason = reason
+
+    def get_reason(self):
+        return self._reason
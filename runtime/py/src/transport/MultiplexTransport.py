@@ -0,0 +1,311 @@
+import itertools
+import socket
+import threading
+
+from myrpc.Common import MessageTruncatedException, MessageDecodeException, MessageHeaderException
+from myrpc.codec.BinaryCodec import BinaryCodec
+from myrpc.transport.TransportBase import TransportState, TransportBase, TransportException
+from myrpc.transport.BufferPool import DefaultBufferPool
+from myrpc.transport.Framing import send_frame, recv_frame
+
+# Request ids are 32 bits.
+_REQUEST_ID_MASK = 0xffffffff
+
+class MultiplexConnection:
+    """Persistent connection carrying the calls of more clients concurrently.
+
+    address is (host, port) for TCP, or the socket file path for Unix
+    domain socket (see SocketServer and UnixSocketServer). Messages are
+    framed (see Framing), requests carry a request id (see
+    TransportBase.get_request_id), and a reader thread passes the replies
+    to the waiting clients in the order they arrive, therefore a slow call
+    doesn't block the other ones.
+
+    Clients and codecs are not thread-safe, every client needs its own
+    transport created by create_transport(). codec is the codec class of
+    the clients, its peek_request_id() is used to match the replies.
+
+    The connection is opened by the first request. If it is broken (or
+    closed by the server), the waiting calls fail, and a new connection
+    is opened by the next request.
+    """
+
+    def __init__(self, address, codec = BinaryCodec):
+        self._address = address
+        self._codec = codec
+        self._timeout = None
+        self._max_message_size = None
+        self._pool = DefaultBufferPool
+
+        self._lock = threading.Lock()
+        self._stream = None
+        self._request_ids = itertools.count()
+
+    def set_timeout(self, timeout):
+        """Set the timeout of connecting and of waiting for a reply (None means no timeout)."""
+
+        self._timeout = timeout
+
+    def set_max_message_size(self, size):
+        """Limit the size of replies (None means unlimited), the connection is closed if a larger one is received."""
+
+        self._max_message_size = size
+
+    def set_buffer_pool(self, pool):
+        self._pool = pool
+
+    def create_transport(self):
+        tr = MultiplexTransport(self)
+
+        return tr
+
+    def close(self):
+        with self._lock:
+            stream = self._stream
+
+        if stream != None:
+            self._fail(stream, EOFError("Connection closed"))
+
+    def _connect(self):
+        if isinstance(self._address, tuple):
+            sock = socket.create_connection(self._address, self._timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                sock.settimeout(self._timeout)
+                sock.connect(self._address)
+            except:
+                sock.close()
+
+                raise
+
+        # The reader thread blocks until a reply arrives.
+
+        sock.settimeout(None)
+
+        return sock
+
+    def _next_request_id(self):
+        with self._lock:
+            request_id = next(self._request_ids) & _REQUEST_ID_MASK
+
+        return request_id
+
+    def _send(self, request_id, segs, size):
+        waiter = _Waiter()
+
+        try:
+            with self._lock:
+                if self._stream == None:
+                    sock = self._connect()
+                    self._stream = _Stream(sock)
+
+                    thread = threading.Thread(target = self._read_replies, args = (self._stream,), daemon = True)
+                    thread.start()
+
+                stream = self._stream
+                stream.waiters[request_id] = waiter
+        except OSError as e:
+            raise MultiplexTransportException(e)
+
+        try:
+            # Frames of concurrent requests must not be interleaved.
+
+            with stream.send_lock:
+                send_frame(stream.sock, segs, size)
+        except OSError as e:
+            self._fail(stream, e)
+
+            raise MultiplexTransportException(e)
+
+        return (stream, waiter)
+
+    def _wait(self, stream, request_id, waiter):
+        if not waiter.wait(self._timeout):
+            with self._lock:
+                abandoned = (stream.waiters.pop(request_id, None) != None)
+
+            # If the reply has just arrived, then use it, otherwise it
+            # will be dropped by the reader thread.
+
+            if abandoned:
+                raise MultiplexTransportException("Timed out waiting for reply")
+
+            waiter.wait(None)
+
+        return waiter.get_result()
+
+    def _read_replies(self, stream):
+        try:
+            while True:
+                frame = recv_frame(stream.sock, self._pool, self._max_message_size)
+                if frame == None:
+                    raise EOFError("Connection closed by server")
+
+                (buf, size) = frame
+
+                try:
+                    request_id = self._codec.peek_request_id(memoryview(buf)[:size])
+                    if request_id == None:
+                        raise MessageHeaderException("Reply without request id")
+                except:
+                    self._pool.release(buf)
+
+                    raise
+
+                with self._lock:
+                    waiter = stream.waiters.pop(request_id, None)
+
+                if waiter != None:
+                    waiter.set_result(frame)
+                else:
+                    # Reply of an abandoned call.
+
+                    self._pool.release(buf)
+        except (OSError, EOFError, MessageDecodeException) as e:
+            self._fail(stream, e)
+        finally:
+            stream.sock.close()
+
+    def _fail(self, stream, reason):
+        # Drop the connection, and wake up the waiting calls.
+
+        with self._lock:
+            if self._stream is stream:
+                self._stream = None
+
+            waiters = stream.waiters
+            stream.waiters = {}
+
+        for waiter in waiters.values():
+            waiter.set_exc(MultiplexTransportException(reason))
+
+        try:
+            stream.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class MultiplexTransport(TransportBase):
+    """Provide client transport for a MultiplexConnection.
+
+    The reply is read into a buffer of the buffer pool of the connection,
+    read() returns memoryview slices of it.
+    """
+
+    def __init__(self, conn):
+        super().__init__()
+
+        self._conn = conn
+        self._request_id = None
+        self._stream = None
+        self._waiter = None
+        self._rbuf = None
+        self._rpool_buf = None
+        self._rpos = 0
+        self._rsize = 0
+
+    def set_state(self, state):
+        if state == TransportState.READ_BEGIN:
+            self._recv()
+        elif state == TransportState.READ_END:
+            self._release_rbuf()
+        elif state == TransportState.WRITE_BEGIN:
+            self._release_rbuf()
+            self._reset_segments()
+
+            self._request_id = self._conn._next_request_id()
+        elif state == TransportState.WRITE_END:
+            (self._stream, self._waiter) = self._conn._send(self._request_id, self._get_segments(), self._get_segments_size())
+
+    def get_request_id(self):
+        return self._request_id
+
+    def read(self, count):
+        end = self._rpos + count
+        if end > self._rsize:
+            raise MessageTruncatedException()
+
+        buf = self._rbuf[self._rpos:end]
+        self._rpos = end
+
+        return buf
+
+    def peek(self, count):
+        buf = self._rbuf[self._rpos:self._rpos + count]
+
+        return buf
+
+    def write(self, buf):
+        self._write_segment(buf)
+
+    def close(self):
+        self._release_rbuf()
+
+        super().close()
+
+    def _recv(self):
+        (stream, waiter) = (self._stream, self._waiter)
+        self._stream = None
+        self._waiter = None
+
+        (self._rpool_buf, self._rsize) = self._conn._wait(stream, self._request_id, waiter)
+        self._rbuf = memoryview(self._rpool_buf)
+        self._rpos = 0
+
+    def _release_rbuf(self):
+        if self._rbuf != None:
+            self._rbuf.release()
+            self._rbuf = None
+
+        if self._rpool_buf != None:
+            self._conn._pool.release(self._rpool_buf)
+            self._rpool_buf = None
+
+        self._rpos = 0
+        self._rsize = 0
+
+class MultiplexTransportException(TransportException):
+    """Exception class for multiplexed connection errors."""
+
+    def __init__(self, reason):
+        super().__init__(str(reason))
+
+        self._reason = reason
+
+    def get_reason(self):
+        return self._reason
+
+class _Stream:
+    """Socket of a MultiplexConnection, and the calls waiting for reply on it."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.waiters = {}
+
+class _Waiter:
+    """Reply (or exception) of a call, passed by the reader thread."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc = None
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+    def get_result(self):
+        if self._exc != None:
+            raise self._exc
+
+        return self._result
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exc(self, exc):
+        self._exc = exc
+        self._event.set()
@@ -0,0 +1,512 @@
+import multiprocessing
+import multiprocessing.shared_memory
+import struct
+import time
+import weakref
+
+from myrpc.Common import MessageTruncatedException, MessageLimitException
+from myrpc.transport.TransportBase import TransportState, TransportBase, TransportException
+
+DEFAULT_RING_SIZE = 1024 * 1024
+
+# Layout of the shared memory: channel header, ring headers (head and tail
+# are on separate cache lines), ring data.
+_CACHE_LINE = 64
+_CHANNEL_HEADER_SIZE = _CACHE_LINE
+_RING_HEADER_SIZE = 2 * _CACHE_LINE
+_DATA_OFFSET = _CHANNEL_HEADER_SIZE + 2 * _RING_HEADER_SIZE
+_COUNTER_FORMAT = "Q"
+_COUNTER_SIZE = 8
+_CLOSED_INDEX = 0
+_SEQ_INDEX = 1
+
+# Ring of requests (written by the client), and ring of replies.
+(_REQUEST_RING,
+ _REPLY_RING) = range(2)
+
+# Records are aligned to 8 bytes, and start with the size of the message
+# and the sequence number of the request (replies carry the number of the
+# request they belong to). The wrap record means that the next record is at
+# the start of the ring.
+_RECORD_HEADER_FORMAT = "=II"
+_RECORD_HEADER_SIZE = 8
+_RECORD_ALIGN = 8
+_WRAP_SIZE = 0xffffffff
+_SEQ_MASK = 0xffffffff
+
+# Writes are done in place, if at least this much contiguous space is
+# available at WRITE_BEGIN (otherwise the record starts at the start of
+# the ring).
+_MIN_IN_PLACE_SIZE = 4096
+
+# Polling interval (in seconds) while the writer waits for free space.
+_MAX_SPACE_POLL_INTERVAL = 0.001
+
+class SharedMemoryChannel:
+    """Connection of two co-located processes through shared memory.
+
+    The channel consists of two ring buffers in a multiprocessing.shared_memory
+    block: one for the requests and one for the replies. Every ring has one
+    writer and one reader: the client (see create_client_transport) and the
+    server (see create_server_transport, SharedMemoryServer) are in
+    different processes (or threads), and only one transport of each kind
+    is used at a time. No system calls are made for the data: messages are
+    encoded and decoded in place in the shared memory, and only the arrival
+    of messages is signaled by semaphores (futex based on Linux).
+
+    The channel is created by one process, and passed to the other one
+    when it is started (e.g. as argument of multiprocessing.Process).
+    context is the multiprocessing context used to start the process (None
+    means the default one).
+    size is the size of each ring, messages larger than half of it can't
+    be sent (MessageLimitException is thrown). The creator has to call
+    unlink() when the channel is not needed anymore.
+    """
+
+    def __init__(self, size = DEFAULT_RING_SIZE, context = None):
+        if context == None:
+            context = multiprocessing.get_context()
+
+        self._ring_size = (size + _RECORD_ALIGN - 1) // _RECORD_ALIGN * _RECORD_ALIGN
+        self._shm = multiprocessing.shared_memory.SharedMemory(create = True, size = _DATA_OFFSET + 2 * self._ring_size)
+        self._sems = (context.Semaphore(0), context.Semaphore(0))
+
+        self._attach()
+
+    def __getstate__(self):
+        return {"ring_size": self._ring_size,
+                "shm": self._shm,
+                "sems": self._sems}
+
+    def __setstate__(self, state):
+        self._ring_size = state["ring_size"]
+        self._shm = state["shm"]
+        self._sems = state["sems"]
+
+        self._attach()
+
+    def get_name(self):
+        """Return the name of the shared memory block."""
+
+        return self._shm.name
+
+    def get_ring_size(self):
+        return self._ring_size
+
+    def get_max_message_size(self):
+        """Return the size of the largest message which can be sent."""
+
+        size = self._ring_size // 2 - _RECORD_HEADER_SIZE
+
+        return size
+
+    def is_closed(self):
+        return self._counters == None or self._counters[_CLOSED_INDEX] != 0
+
+    def create_client_transport(self):
+        """Return a transport writing requests and reading replies."""
+
+        self._check_open()
+
+        tr = SharedMemoryTransport(self, _REPLY_RING, _REQUEST_RING)
+        self._transports.add(tr)
+
+        return tr
+
+    def create_server_transport(self):
+        """Return a transport reading requests and writing replies."""
+
+        self._check_open()
+
+        tr = SharedMemoryTransport(self, _REQUEST_RING, _REPLY_RING)
+        self._transports.add(tr)
+
+        return tr
+
+    def close(self):
+        """Close the channel for both processes, and unmap it in the current one.
+
+        Transports waiting for messages throw SharedMemoryTransportException.
+        """
+
+        if self._counters == None:
+            return
+
+        self._counters[_CLOSED_INDEX] = 1
+
+        # Wake up the readers.
+
+        for sem in self._sems:
+            sem.release()
+
+        # Views of the transports must be released before unmapping.
+
+        for tr in list(self._transports):
+            tr.close()
+
+        self._counters.release()
+        self._counters = None
+
+        for ring in self._rings:
+            ring.release()
+
+        self._rings = None
+
+        try:
+            self._shm.close()
+        except BufferError:
+            # Decoded values still reference the shared memory, it is
+            # unmapped when the last one is freed.
+
+            pass
+
+    def unlink(self):
+        """Remove the shared memory block, it is freed when both processes unmapped it."""
+
+        self._shm.unlink()
+
+    def _attach(self):
+        buf = self._shm.buf
+
+        self._transports = weakref.WeakSet()
+
+        with buf[:_DATA_OFFSET] as header_view:
+            self._counters = header_view.cast(_COUNTER_FORMAT)
+
+        self._rings = []
+
+        for ring in (_REQUEST_RING, _REPLY_RING):
+            begin = _DATA_OFFSET + ring * self._ring_size
+
+            self._rings.append(buf[begin:begin + self._ring_size])
+
+    def _check_open(self):
+        if self._rings == None:
+            raise SharedMemoryTransportException("Channel is closed")
+
+    def _get_ring(self, ring):
+        self._check_open()
+
+        return self._rings[ring]
+
+    def _get_head(self, ring):
+        return self._counters[(_CHANNEL_HEADER_SIZE + ring * _RING_HEADER_SIZE) // _COUNTER_SIZE]
+
+    def _set_head(self, ring, pos):
+        self._counters[(_CHANNEL_HEADER_SIZE + ring * _RING_HEADER_SIZE) // _COUNTER_SIZE] = pos
+
+    def _get_tail(self, ring):
+        return self._counters[(_CHANNEL_HEADER_SIZE + ring * _RING_HEADER_SIZE + _CACHE_LINE) // _COUNTER_SIZE]
+
+    def _set_tail(self, ring, pos):
+        self._counters[(_CHANNEL_HEADER_SIZE + ring * _RING_HEADER_SIZE + _CACHE_LINE) // _COUNTER_SIZE] = pos
+
+    def _get_seq(self):
+        return self._counters[_SEQ_INDEX]
+
+    def _set_seq(self, seq):
+        self._counters[_SEQ_INDEX] = seq
+
+    def _publish(self, ring, head):
+        self._set_head(ring, head)
+        self._sems[ring].release()
+
+    def _wait_record(self, ring, timeout):
+        if not self._sems[ring].acquire(timeout = timeout):
+            raise SharedMemoryTransportException("Timeout waiting for message")
+
+        if self.is_closed():
+            raise SharedMemoryTransportException("Channel is closed")
+
+class SharedMemoryTransport(TransportBase):
+    """Provide transport over a SharedMemoryChannel.
+
+    The transport states are mapped onto the ring buffers:
+     - READ_BEGIN: release the previous message, and wait for the next one.
+     - WRITE_BEGIN: claim the contiguous free space of the ring, written
+       data is stored there directly.
+     - WRITE_END: publish the message to the reader.
+
+    read() returns memoryview slices of the shared memory, therefore
+    headers and scalars are decoded in place. The space of the message is
+    reused by the writer after the next READ_BEGIN, therefore decoded
+    binary fields are always copied (see can_share_read_buffer). If the
+    written message doesn't fit into the claimed space, it is collected
+    into segments, and copied into the ring at WRITE_END (waiting for the
+    reader to free space, if needed).
+
+    Requests are numbered, and the replies carry the number of their
+    request. If waiting for a reply times out, then the reply arriving
+    later is dropped by the client transport.
+    """
+
+    def __init__(self, channel, rring, wring):
+        super().__init__()
+
+        self._channel = channel
+        self._rring = rring
+        self._wring = wring
+        self._timeout = None
+
+        self._client = (wring == _REQUEST_RING)
+        self._seq = channel._get_seq()
+
+        self._rtail = channel._get_tail(rring)
+        self._rnext = None
+        self._rbuf = None
+        self._rpos = 0
+        self._rsize = 0
+
+        self._whead = channel._get_head(wring)
+        self._wstart = None
+        self._wbuf = None
+        self._wpos = 0
+
+    def set_state(self, state):
+        if state == TransportState.READ_BEGIN:
+            self._recv()
+        elif state == TransportState.WRITE_BEGIN:
+            self._claim()
+        elif state == TransportState.WRITE_END:
+            self._publish()
+
+    def read(self, count):
+        end = self._rpos + count
+        if end > self._rsize:
+            raise MessageTruncatedException()
+
+        buf = self._rbuf[self._rpos:end]
+        self._rpos = end
+
+        return buf
+
+    def peek(self, count):
+        buf = self._rbuf[self._rpos:self._rpos + count]
+
+        return buf
+
+    def write(self, buf):
+        if self._wbuf != None:
+            end = self._wpos + len(buf)
+
+            if end <= len(self._wbuf):
+                self._wbuf[self._wpos:end] = buf
+                self._wpos = end
+
+                return
+
+            # The claimed space is too small, collect the message into
+            # segments.
+
+            self._write_segment(bytes(self._wbuf[:self._wpos]))
+            self._release_wbuf()
+
+        self._write_segment(buf)
+
+    def can_share_read_buffer(self):
+        # The ring is overwritten in place, decoded values can't reference it.
+
+        return False
+
+    def set_timeout(self, timeout):
+        """Set the timeout (in seconds) of waiting for messages and free space (None means no timeout)."""
+
+        self._timeout = timeout
+
+    def close(self):
+        self._release_rbuf()
+        self._release_wbuf()
+
+        super().close()
+
+    def _recv(self):
+        channel = self._channel
+        deadline = time.monotonic() + self._timeout if self._timeout != None else None
+
+        self._release_rbuf()
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline != None else None
+
+            channel._wait_record(self._rring, timeout)
+
+            ring = channel._get_ring(self._rring)
+            offset = self._rtail % len(ring)
+            (size, seq) = struct.unpack_from(_RECORD_HEADER_FORMAT, ring, offset)
+
+            if size == _WRAP_SIZE:
+                self._rtail += len(ring) - offset
+                offset = 0
+                (size, seq) = struct.unpack_from(_RECORD_HEADER_FORMAT, ring, offset)
+
+            self._rnext = self._rtail + _get_record_size(size)
+
+            if not self._client:
+                # The reply is written with the number of the request.
+
+                self._seq = seq
+
+                break
+
+            if seq == self._seq:
+                break
+
+            # Reply of a request whose wait timed out, drop it.
+
+            self._release_rbuf()
+
+        begin = offset + _RECORD_HEADER_SIZE
+
+        self._rbuf = ring[begin:begin + size]
+        self._rpos = 0
+        self._rsize = size
+
+        self._check_message_size(size)
+
+    def _release_rbuf(self):
+        if self._rbuf != None:
+            self._rbuf.release()
+            self._rbuf = None
+
+        # The space of the message is freed now, decoded values may have
+        # referenced it until this point.
+
+        if self._rnext != None:
+            self._rtail = self._rnext
+            self._rnext = None
+
+            if not self._channel.is_closed():
+                self._channel._set_tail(self._rring, self._rtail)
+
+    def _claim(self):
+        channel = self._channel
+
+        self._release_wbuf()
+        self._reset_segments()
+
+        ring = channel._get_ring(self._wring)
+        ring_size = len(ring)
+        free = ring_size - (self._whead - channel._get_tail(self._wring))
+        offset = self._whead % ring_size
+        contiguous = min(ring_size - offset, free)
+
+        # If the space up to the end of the ring is small, then wrap
+        # around (if the reader has freed the space at the start).
+
+        wrap = (contiguous < _MIN_IN_PLACE_SIZE and
+                free - contiguous > contiguous)
+
+        if wrap:
+            begin = 0
+            end = free - contiguous
+        else:
+            begin = offset
+            end = offset + contiguous
+
+        if end - begin > _RECORD_HEADER_SIZE:
+            self._wstart = (begin, wrap)
+            self._wbuf = ring[begin + _RECORD_HEADER_SIZE:end]
+            self._wpos = 0
+
+    def _publish(self):
+        channel = self._channel
+        ring = channel._get_ring(self._wring)
+        ring_size = len(ring)
+
+        if self._wbuf != None:
+            size = self._wpos
+            (begin, wrap) = self._wstart
+
+            self._release_wbuf()
+            self._check_record_size(ring_size, size)
+        else:
+            size = self._get_segments_size()
+            self._check_record_size(ring_size, size)
+
+            (begin, wrap) = self._wait_space(ring_size, size)
+
+            pos = begin + _RECORD_HEADER_SIZE
+
+            for seg in self._get_segments():
+                seglen = len(seg)
+                ring[pos:pos + seglen] = seg
+                pos += seglen
+
+            self._reset_segments()
+
+        if self._client:
+            # Requests are numbered across the client transports of the
+            # channel, replies of previous transports are dropped too.
+
+            self._seq = (self._seq + 1) & _SEQ_MASK
+            channel._set_seq(self._seq)
+
+        struct.pack_into(_RECORD_HEADER_FORMAT, ring, begin, size, self._seq)
+
+        if wrap:
+            offset = self._whead % ring_size
+
+            struct.pack_into(_RECORD_HEADER_FORMAT, ring, offset, _WRAP_SIZE, 0)
+            self._whead += ring_size - offset
+
+        self._whead += _get_record_size(size)
+
+        channel._publish(self._wring, self._whead)
+
+    def _wait_space(self, ring_size, size):
+        """Wait until the record of size bytes fits into the ring, return (begin, wrap)."""
+
+        channel = self._channel
+        record_size = _get_record_size(size)
+        offset = self._whead % ring_size
+        deadline = time.monotonic() + self._timeout if self._timeout != None else None
+        interval = 0.0
+
+        while True:
+            if channel.is_closed():
+                raise SharedMemoryTransportException("Channel is closed")
+
+            free = ring_size - (self._whead - channel._get_tail(self._wring))
+
+            if ring_size - offset >= record_size and free >= record_size:
+                return (offset, False)
+
+            if free - (ring_size - offset) >= record_size:
+                return (0, True)
+
+            if deadline != None and time.monotonic() >= deadline:
+                raise SharedMemoryTransportException("Timeout waiting for free space")
+
+            # The ring is full only if the reader is slow, poll it.
+
+            time.sleep(interval)
+            interval = min(2 * interval + 0.0001, _MAX_SPACE_POLL_INTERVAL)
+
+    def _check_record_size(self, ring_size, size):
+        # Messages up to half of the ring always fit (after the reader
+        # freed the space), the limit doesn't depend on the state of the
+        # ring.
+
+        if _get_record_size(size) > ring_size // 2:
+            raise MessageLimitException("Message size {} exceeds {} bytes".format(size, self._channel.get_max_message_size()))
+
+    def _release_wbuf(self):
+        if self._wbuf != None:
+            self._wbuf.release()
+            self._wbuf = None
+
+class SharedMemoryTransportException(TransportException):
+    """Exception class for shared memory channel errors."""
+
+    def __init__(self, reason):
+        super().__init__(str(reason))
+
+        self._reason = reason
+
+    def get_reason(self):
+        return self._reason
+
+def _get_record_size(size):
+    record_size = (_RECORD_HEADER_SIZE + size + _RECORD_ALIGN - 1) // _RECORD_ALIGN * _RECORD_ALIGN
+
+    return record_size
@@ -0,0 +1,179 @@
+import select
+import socket
+
+from myrpc.Common import MessageTruncatedException
+from myrpc.transport.TransportBase import TransportState, TransportBase, TransportException
+from myrpc.transport.Framing import send_frame, recv_frame
+
+class SocketTransport(TransportBase):
+    """Provide TCP client transport.
+
+    Messages are framed (see Framing), and sent on a persistent connection,
+    which is opened by the first request. The request is sent with one
+    system call (the written segments are not joined), and the response is
+    read into a buffer of the buffer pool, read() returns memoryview slices
+    of it.
+
+    Reused connections closed by the server while idle are detected before
+    sending the request, and a new connection is opened. If sending fails
+    on a reused connection, the request is retried once on a new connection.
+    Requests are never resent after they are sent completely. On other
+    errors, the connection is closed, and a new one is opened by the next
+    request.
+    """
+
+    def __init__(self, host, port):
+        super().__init__()
+
+        self._address = (host, port)
+        self._timeout = None
+        self._sock = None
+        self._reused = False
+        self._rbuf = None
+        self._rpool_buf = None
+        self._rpos = 0
+        self._rsize = 0
+
+    def set_state(self, state):
+        if state == TransportState.READ_BEGIN:
+            self._recv()
+        elif state == TransportState.READ_END:
+            self._release_rbuf()
+        elif state == TransportState.WRITE_BEGIN:
+            self._release_rbuf()
+            self._reset_segments()
+        elif state == TransportState.WRITE_END:
+            self._send()
+
+    def read(self, count):
+        end = self._rpos + count
+        if end > self._rsize:
+            raise MessageTruncatedException()
+
+        buf = self._rbuf[self._rpos:end]
+        self._rpos = end
+
+        return buf
+
+    def peek(self, count):
+        buf = self._rbuf[self._rpos:self._rpos + count]
+
+        return buf
+
+    def write(self, buf):
+        self._write_segment(buf)
+
+    def set_timeout(self, timeout):
+        self._timeout = timeout
+
+        if self._sock != None:
+            self._sock.settimeout(timeout)
+
+    def close(self):
+        self._close_connection()
+        self._release_rbuf()
+
+        super().close()
+
+    def _connect(self):
+        sock = socket.create_connection(self._address, self._timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        return sock
+
+    def _send(self):
+        if (self._sock != None and
+            self._is_dropped()):
+            self._close_connection()
+
+        self._reused = (self._sock != None)
+
+        try:
+            if self._sock == None:
+                self._sock = self._connect()
+
+            send_frame(self._sock, self._get_segments(), self._get_segments_size())
+        except OSError as e:
+            if self._reused:
+                # The server may have closed the idle connection.
+
+                self._retry()
+            else:
+                self._close_connection()
+
+                raise SocketTransportException(e)
+
+    def _recv(self):
+        # The request is not resent, the server may have processed it.
+
+        try:
+            frame = recv_frame(self._sock, self._pool, self._max_message_size)
+
+            if frame == None:
+                raise EOFError("Connection closed by server")
+        except (OSError, EOFError) as e:
+            self._close_connection()
+
+            raise SocketTransportException(e)
+        except:
+            self._close_connection()
+
+            raise
+
+        (self._rpool_buf, self._rsize) = frame
+        self._rbuf = memoryview(self._rpool_buf)
+        self._rpos = 0
+
+    def _retry(self):
+        # Resend the request on a new connection.
+
+        self._close_connection()
+        self._reused = False
+
+        try:
+            self._sock = self._connect()
+
+            send_frame(self._sock, self._get_segments(), self._get_segments_size())
+        except OSError as e:
+            self._close_connection()
+
+            raise SocketTransportException(e)
+
+    def _is_dropped(self):
+        # Idle connections shouldn't be readable, otherwise the server
+        # closed it (or sent garbage).
+
+        try:
+            (r, w, x) = select.select([self._sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+
+        return (len(r) > 0)
+
+    def _close_connection(self):
+        if self._sock != None:
+            self._sock.close()
+            self._sock = None
+
+    def _release_rbuf(self):
+        if self._rbuf != None:
+            self._rbuf.release()
+            self._rbuf = None
+
+        if self._rpool_buf != None:
+            self._pool.release(self._rpool_buf)
+            self._rpool_buf = None
+
+        self._rpos = 0
+        self._rsize = 0
+
+class SocketTransportException(TransportException):
+    """Exception class for socket errors."""
+
+    def __init__(self, reason):
+        super().__init__(str(reason))
+
+        self._reason = reason
+
+    def get_reason(self):
+        return self._reason
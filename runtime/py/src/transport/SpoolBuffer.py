@@ -0,0 +1,179 @@
+import mmap
+import os
+import tempfile
+
+from myrpc.transport.TransportBase import TransportException
+
+# Chunk size used when the size of the source is unknown.
+CHUNK_SIZE = 65536
+
+class SpoolBuffer:
+    """Buffer which spills to a temporary file above a threshold.
+
+    Data is collected in memory until its size exceeds threshold (None means
+    never), then it is moved into an anonymous temporary file (memfd on
+    Linux). get_view() returns a memoryview of the contents, spilled buffers
+    are memory-mapped, therefore the codec's zero-copy read paths work
+    the same way in both cases.
+
+    The buffer can't be written after get_view() is called.
+    """
+
+    def __init__(self, threshold):
+        self._threshold = threshold
+
+        self._mbuf = bytearray()
+        self._f = None
+        self._mm = None
+        self._view = None
+        self._size = 0
+
+    def get_size(self):
+        return self._size
+
+    def is_spilled(self):
+        return (self._f != None)
+
+    def write(self, buf):
+        self._check_writable()
+
+        buflen = len(buf)
+
+        if (self._f == None and
+            self._threshold != None and
+            self._size + buflen > self._threshold):
+            self._spill()
+
+        if self._f != None:
+            self._write_file(buf)
+        else:
+            self._mbuf += buf
+
+        self._size += buflen
+
+    def readfrom(self, f, size):
+        """Read at most size bytes from file object f (using readinto) into the empty buffer.
+
+        Spilled buffers are read directly into the mapping. Return the number
+        of bytes read, it is less than size on EOF.
+        """
+
+        self._check_writable()
+
+        if self._size > 0:
+            raise ValueError("Buffer is not empty")
+
+        if (self._threshold != None and
+            size > self._threshold):
+            self._f = self._open_file()
+
+            try:
+                self._f.truncate(size)
+                self._mm = mmap.mmap(self._f.fileno(), size)
+            except OSError as e:
+                raise SpoolBufferException(e)
+
+            buf = self._mm
+        else:
+            self._mbuf = bytearray(size)
+            buf = self._mbuf
+
+        count = 0
+
+        with memoryview(buf) as view:
+            while count < size:
+                with view[count:size] as chunk_view:
+                    n = f.readinto(chunk_view)
+
+                if not n:
+                    break
+
+                count += n
+
+        if self._f == None:
+            del self._mbuf[count:]
+
+        self._size = count
+
+        return count
+
+    def get_view(self):
+        if self._view == None:
+            if self._f == None:
+                self._view = memoryview(self._mbuf)
+            else:
+                if self._mm == None:
+                    try:
+                        self._f.flush()
+                        self._mm = mmap.mmap(self._f.fileno(), self._size)
+                    except OSError as e:
+                        raise SpoolBufferException(e)
+
+                with memoryview(self._mm) as view:
+                    self._view = view[:self._size]
+
+        return self._view
+
+    def close(self):
+        if self._view != None:
+            self._view.release()
+            self._view = None
+
+        if self._mm != None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # Slices are still referenced, the mapping is released
+                # when the last one is freed.
+
+                pass
+
+            self._mm = None
+
+        if self._f != None:
+            self._f.close()
+            self._f = None
+
+        self._mbuf = bytearray()
+        self._size = 0
+
+    def _check_writable(self):
+        if self._view != None:
+            raise ValueError("Buffer is already mapped")
+
+    def _spill(self):
+        self._f = self._open_file()
+
+        self._write_file(self._mbuf)
+        self._mbuf = bytearray()
+
+    def _write_file(self, buf):
+        try:
+            self._f.write(buf)
+        except OSError as e:
+            raise SpoolBufferException(e)
+
+    def _open_file(self):
+        try:
+            # memfd doesn't need a filesystem.
+
+            if hasattr(os, "memfd_create"):
+                fd = os.memfd_create("myrpc-spool", os.MFD_CLOEXEC)
+                f = open(fd, mode = "w+b")
+            else:
+                f = tempfile.TemporaryFile()
+        except OSError as e:
+            raise SpoolBufferException(e)
+
+        return f
+
+class SpoolBufferException(TransportException):
+    """Exception class for temporary file errors."""
+
+    def __init__(self, reason):
+        super().__init__(str(reason))
+
+        self._reason = reason
+
+    def get_reason(self):
+        return self._reason
@@ -1,6 +1,7 @@
 from abc import ABCMeta, abstractmethod
 
-from myrpc.Common import MyRPCException
+from myrpc.Common import MyRPCException, MessageLimitException
+from myrpc.transport.BufferPool import DefaultBufferPool
 
 class TransportState:
     """Represent the state of the transport.
@@ -22,6 +23,13 @@ class TransportState:
      WRITE_BEGIN,
      WRITE_END) = range(4)
 
+# Written buffers smaller than this are copied into a scratch buffer, larger
+# ones are referenced (see TransportBase._write_segment).
+SEGMENT_COPY_MAX = 1024
+
+# Size of scratch buffers acquired from the buffer pool.
+_SCRATCH_SIZE = 16384
+
 class TransportBase(metaclass = ABCMeta):
     """Base class for transport implementation classes.
 
@@ -33,12 +41,212 @@ class TransportBase(metaclass = ABCMeta):
     """
 
     def __init__(self):
-        pass
+        self._max_message_size = None
+        self._spill_threshold = None
+        self._pool = DefaultBufferPool
+        self._content_type = None
+
+        self._spool = None
+        self._scratches = []
+        self._scratch_views = []
+        self._reset_segments()
 
     @abstractmethod
     def set_state(self, state):
         pass
 
+    def set_max_message_size(self, size):
+        """Limit the size of received messages (None means unlimited).
+
+        Transports which know the message size before buffering it (e.g.
+        from HTTP Content-Length) reject larger messages up front by
+        throwing MessageLimitException. See also CodecLimits.
+        """
+
+        self._max_message_size = size
+
+    def set_spill_threshold(self, size):
+        """Spill messages larger than size bytes to a temporary file (None means never).
+
+        See SpoolBuffer. Transports which don't buffer messages ignore it.
+        """
+
+        self._spill_threshold = size
+
+    def set_buffer_pool(self, pool):
+        """Set the BufferPool used for buffering (DefaultBufferPool by default)."""
+
+        self._pool = pool
+
+    def get_content_type(self):
+        return self._content_type
+
+    def set_content_type(self, content_type):
+        """Set the content type of messages (None means unknown).
+
+        Transports carrying it (e.g. HTTP Content-Type) send it with the
+        messages. For received messages, it is used to select the codec
+        (see CodecRegistry).
+        """
+
+        self._content_type = content_type
+
+    def get_request_id(self):
+        """Return the request id of the request being written (None if the transport doesn't use request ids).
+
+        Clients call it after WRITE_BEGIN, and send the request id in the
+        message header. Multiplexing transports use it to match the replies
+        to the requests.
+        """
+
+        return None
+
+    def can_share_read_buffer(self):
+        """Return True if buffers returned by read() stay valid and unchanged while they are referenced.
+
+        It is True for transports reading into pooled buffers (the pool
+        doesn't reuse referenced buffers) or mapped files. Codecs may return
+        such buffers as decoded values without copying (see
+        BinaryCodec.set_zero_copy).
+        """
+
+        return True
+
+    def peek(self, count):
+        """Return at most count bytes of the received message without consuming them.
+
+        It can be called only between READ_BEGIN...READ_END. Transports which
+        can't peek throw TransportException.
+        """
+
+        raise TransportException("Transport doesn't support peek")
+
+    def close(self):
+        """Return buffers to the pool.
+
+        Data returned by the transport (e.g. MemoryTransport.get_value) is
+        not affected.
+        """
+
+        self._reset_segments()
+
+    def _check_message_size(self, size):
+        if (self._max_message_size != None and
+            size > self._max_message_size):
+            raise MessageLimitException("Message size {} exceeds {} bytes".format(size, self._max_message_size))
+
+    def _reset_segments(self):
+        """Drop the collected write segments, and return scratch buffers to the pool."""
+
+        # Views must be released, otherwise the pool doesn't take back
+        # the scratch buffers.
+
+        for view in self._scratch_views:
+            view.release()
+
+        for scratch in self._scratches:
+            self._pool.release(scratch)
+
+        if self._spool != None:
+            self._spool.close()
+            self._spool = None
+
+        self._segs = []
+        self._scratch_views = []
+        self._segs_size = 0
+        self._scratches = []
+        self._scratch = None
+        self._scratch_begin = 0
+        self._scratch_end = 0
+
+    def _write_segment(self, buf):
+        """Collect buf for sending.
+
+        Small buffers (e.g. encoded numbers) are coalesced into a scratch
+        buffer, large ones (e.g. binary fields) are referenced without
+        copying, therefore they must not be modified until the segments
+        are sent.
+        """
+
+        buflen = len(buf)
+
+        if self._spool != None:
+            self._spool.write(buf)
+            self._segs_size += buflen
+
+            return
+
+        if buflen < SEGMENT_COPY_MAX:
+            end = self._scratch_end + buflen
+
+            if (self._scratch == None or
+                end > len(self._scratch)):
+                self._flush_scratch()
+
+                self._scratch = self._pool.acquire(_SCRATCH_SIZE)
+                self._scratches.append(self._scratch)
+                self._scratch_begin = 0
+                self._scratch_end = 0
+
+                end = buflen
+
+            self._scratch[self._scratch_end:end] = buf
+            self._scratch_end = end
+        else:
+            self._flush_scratch()
+            self._segs.append(buf)
+
+        self._segs_size += buflen
+
+        if (self._spill_threshold != None and
+            self._segs_size > self._spill_threshold):
+            self._spill_segments()
+
+    def _spill_segments(self):
+        # SpoolBuffer depends on this module, import it here.
+
+        from myrpc.transport.SpoolBuffer import SpoolBuffer
+
+        spool = SpoolBuffer(0)
+
+        for seg in self._get_segments():
+            spool.write(seg)
+
+        # Keep the size, _reset_segments clears it.
+
+        segs_size = self._segs_size
+        self._reset_segments()
+
+        self._spool = spool
+        self._segs_size = segs_size
+
+    def _flush_scratch(self):
+        # Add the unflushed part of the scratch buffer as segment.
+
+        if self._scratch_end > self._scratch_begin:
+            with memoryview(self._scratch) as scratch_view:
+                view = scratch_view[self._scratch_begin:self._scratch_end]
+
+            self._segs.append(view)
+            self._scratch_views.append(view)
+            self._scratch_begin = self._scratch_end
+
+    def _get_segments(self):
+        """Return the list of collected segments, e.g. for socket.sendmsg.
+
+        Segments are valid until the next _reset_segments call.
+        """
+
+        if self._spool != None:
+            return [self._spool.get_view()]
+
+        self._flush_scratch()
+
+        return self._segs
+
+    def _get_segments_size(self):
+        return self._segs_size
+
     @abstractmethod
     def read(self, count):
         """Read count bytes from transport.
@@ -0,0 +1,30 @@
+import socket
+
+from myrpc.transport.SocketTransport import SocketTransport
+
+class UnixSocketTransport(SocketTransport):
+    """Provide Unix domain socket client transport.
+
+    It works like SocketTransport (with the same framing and persistent
+    connection), but connects to the socket file path of a server on the
+    same host, see UnixSocketServer. Errors are reported by
+    SocketTransportException.
+    """
+
+    def __init__(self, path):
+        super().__init__(None, None)
+
+        self._path = path
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            sock.settimeout(self._timeout)
+            sock.connect(self._path)
+        except:
+            sock.close()
+
+            raise
+
+        return sock
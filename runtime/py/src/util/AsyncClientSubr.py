@@ -0,0 +1,70 @@
+import asyncio
+
+from myrpc.Common import ServerErrorException
+from myrpc.util.ClientSubr import ClientSubr
+
+class AsyncClientSubr(ClientSubr):
+    """Client class for asyncio applications.
+
+    The transport has to be an AsyncTransportBase: the message is written
+    and read the same way as ClientSubr does, but the I/O is done by
+    awaiting the transport's transfer(). Calls made concurrently on the same
+    client are serialized, use more clients (transports) for concurrent
+    calls.
+    """
+
+    def __init__(self, tr, codec):
+        super().__init__(tr, codec)
+
+        self._lock = asyncio.Lock()
+
+    async def call(self, name, args_seri, result_seri, exc_handler):
+        async with self._lock:
+            compact = self._write_call(name, args_seri)
+
+            await self._tr.transfer()
+
+            try:
+                r = self._read_result(result_seri, exc_handler)
+            except ServerErrorException as e:
+                if not self._is_compact_rejected(compact, e):
+                    raise
+
+                self._write_call(name, args_seri)
+
+                await self._tr.transfer()
+
+                r = self._read_result(result_seri, exc_handler)
+
+        return r
+
+    async def call_iter(self, name, args_seri, result_req, list_iter, exc_handler):
+        """Call a method returning list, and return an iterator over its elements.
+
+        See ClientSubr.call_iter. The elements are decoded before call_iter
+        returns (while the call holds the client), therefore other calls
+        can be made before the iterator is exhausted.
+        """
+
+        async with self._lock:
+            compact = self._write_call(name, args_seri)
+
+            await self._tr.transfer()
+
+            try:
+                r = self._read_iter_result(result_req, list_iter, exc_handler)
+            except ServerErrorException as e:
+                if not self._is_compact_rejected(compact, e):
+                    raise
+
+                self._write_call(name, args_seri)
+
+                await self._tr.transfer()
+
+                r = self._read_iter_result(result_req, list_iter, exc_handler)
+
+            # The buffer of the response is reused by the next call.
+
+            r = iter(list(r))
+
+        return r
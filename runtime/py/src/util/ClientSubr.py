@@ -1,6 +1,6 @@
-from myrpc.Common import MessageHeaderException, ServerErrorException
+from myrpc.Common import MessageHeaderException, MessageBodyException, ServerErrorException
 from myrpc.transport.TransportBase import TransportState
-from myrpc.codec.CodecBase import MessageType, CallRequestMessage
+from myrpc.codec.CodecBase import FID_STOP, FINGERPRINT_MISMATCH, MessageType, DataType, CallRequestMessage
 
 class ClientSubr:
     """Client class for client applications."""
@@ -8,37 +8,132 @@ class ClientSubr:
     def __init__(self, tr, codec):
         self._tr = tr
         self._codec = codec
+        self._request_id = None
 
         self._codec.set_transport(tr)
 
     def call(self, name, args_seri, result_seri, exc_handler):
-        # Serialize method call.
+        compact = self._write_call(name, args_seri)
+
+        try:
+            r = self._read_result(result_seri, exc_handler)
+        except ServerErrorException as e:
+            if not self._is_compact_rejected(compact, e):
+                raise
+
+            self._write_call(name, args_seri)
+
+            r = self._read_result(result_seri, exc_handler)
+
+        return r
+
+    def call_iter(self, name, args_seri, result_req, list_iter, exc_handler):
+        """Call a method returning list, and return an iterator over its elements.
+
+        The whole response is received by call_iter, the elements are
+        decoded by list_iter as the iterator advances (the decoded list is
+        not materialized). Exceptions and errors are thrown by call_iter
+        itself. The iterator has to be exhausted before making the next call.
+        """
+
+        compact = self._write_call(name, args_seri)
+
+        try:
+            r = self._read_iter_result(result_req, list_iter, exc_handler)
+        except ServerErrorException as e:
+            if not self._is_compact_rejected(compact, e):
+                raise
+
+            self._write_call(name, args_seri)
+
+            r = self._read_iter_result(result_req, list_iter, exc_handler)
+
+        return r
+
+    def _write_call(self, name, args_seri):
+        # Serialize method call, return True if compact encoding is used.
 
         self._tr.set_state(TransportState.WRITE_BEGIN)
 
+        self._request_id = self._tr.get_request_id()
+
         msg = CallRequestMessage(name)
+        msg.set_request_id(self._request_id)
         self._codec.write_message_begin(msg)
 
         args_seri.myrpc_write(self._codec)
 
+        compact = self._codec.is_write_compact()
+
         self._codec.write_message_end()
 
         self._tr.set_state(TransportState.WRITE_END)
 
+        return compact
+
+    def _is_compact_rejected(self, compact, e):
+        # The server has a different schema fingerprint, it didn't execute the
+        # call. The codec learned from the reply not to use compact encoding,
+        # therefore the call can be repeated (once).
+
+        rejected = compact and e.get_msg() == FINGERPRINT_MISMATCH
+
+        return rejected
+
+    def _read_result(self, result_seri, exc_handler):
         # Process response.
 
         self._tr.set_state(TransportState.READ_BEGIN)
 
-        err_msg = None
-        exc = None
         r = None
 
+        msg = self._read_message_begin()
+        mtype = msg.get_mtype()
+
+        if mtype != MessageType.CALL_RESPONSE:
+            self._read_failure(msg, exc_handler)
+
+        result_seri.myrpc_read(self._codec)
+
+        self._codec.read_message_end()
+
+        self._tr.set_state(TransportState.READ_END)
+
+        if hasattr(result_seri, "get_result"):
+            r = result_seri.get_result()
+
+        return r
+
+    def _read_iter_result(self, result_req, list_iter, exc_handler):
+        # Process response header.
+
+        self._tr.set_state(TransportState.READ_BEGIN)
+
+        msg = self._read_message_begin()
+        mtype = msg.get_mtype()
+
+        if mtype != MessageType.CALL_RESPONSE:
+            self._read_failure(msg, exc_handler)
+
+        return self._iter_result(result_req, list_iter)
+
+    def _read_message_begin(self):
         msg = self._codec.read_message_begin()
+
+        if msg.get_request_id() != self._request_id:
+            raise MessageHeaderException("Unexpected request id {}".format(msg.get_request_id()))
+
+        return msg
+
+    def _read_failure(self, msg, exc_handler):
+        # Read CALL_EXCEPTION or ERROR message, and throw the exception.
+
+        err_msg = None
+        exc = None
+
         mtype = msg.get_mtype()
 
-        if mtype == MessageType.CALL_RESPONSE:
-            result_seri.myrpc_read(self._codec)
-        elif mtype == MessageType.CALL_EXCEPTION:
+        if mtype == MessageType.CALL_EXCEPTION:
             exc_name = msg.get_name()
             exc = exc_handler(self._codec, exc_name)
         elif mtype == MessageType.ERROR:
@@ -55,12 +150,45 @@ class ClientSubr:
         if err_msg != None:
             raise ServerErrorException(err_msg)
 
-        # Throw exception or return normally.
+        raise exc
 
-        if exc:
-            raise exc
+    def _iter_result(self, result_req, list_iter):
+        # Read result struct (it has one list field with fid 0) the same way
+        # as the generated code does, but yield the list elements.
 
-        if hasattr(result_seri, "get_result"):
-            r = result_seri.get_result()
+        codec = self._codec
+        compact = codec.is_read_compact()
 
-        return r
+        codec.read_struct_begin()
+
+        if compact:
+            present = result_req or codec.read_presence(1)[0]
+        else:
+            (fid, dtype) = codec.read_field_begin()
+            present = (fid != FID_STOP)
+
+            if present:
+                if fid != 0:
+                    raise MessageBodyException("Struct result unknown fid {}".format(fid))
+                if dtype != DataType.LIST:
+                    raise MessageBodyException("Struct result fid {} has unexpected data type {}".format(fid, dtype))
+
+        if present:
+            yield from list_iter(codec)
+
+            if not compact:
+                codec.read_field_end()
+
+                (fid, dtype) = codec.read_field_begin()
+                if fid == 0:
+                    raise MessageBodyException("Struct result fid {} is duplicated".format(fid))
+                if fid != FID_STOP:
+                    raise MessageBodyException("Struct result unknown fid {}".format(fid))
+        elif result_req:
+            raise MessageBodyException("Struct result field result is None")
+
+        codec.read_struct_end()
+
+        self._codec.read_message_end()
+
+        self._tr.set_state(TransportState.READ_END)
@@ -1,6 +1,7 @@
-from myrpc.Common import MyRPCInternalException, MessageDecodeException, MessageHeaderException
+from myrpc.Common import MyRPCInternalException, MessageDecodeException, MessageHeaderException, MessageLimitException
 from myrpc.transport.TransportBase import TransportState
 from myrpc.codec.CodecBase import MessageType, CallResponseMessage, CallExceptionMessage, ErrorMessage
+from myrpc.codec.CodecRegistry import CodecRegistry
 
 class HandlerReturn:
     """Handler return value class."""
@@ -39,6 +40,10 @@ class ProcessorSubr:
 
         self._methodmap = methodmap
 
+        # Codec instances created by CodecRegistry factories.
+
+        self._codecs = {}
+
         self._reset()
 
     def process_one(self, tr, codec):
@@ -47,14 +52,26 @@ class ProcessorSubr:
         process_one can be called even when we are in middle of
         async method execution. In this case, the execution is aborted,
         and processing of the new message begins.
+
+        codec can be a CodecRegistry, then the codec is selected for
+        every message, and the reply is written with the same codec.
         """
 
         self._reset()
 
         self._tr = tr
-        self._codec = codec
 
-        self._codec.set_transport(tr)
+        if isinstance(codec, CodecRegistry):
+            # Until the codec is detected, use the default one (e.g. for
+            # reporting errors).
+
+            self._registry = codec
+            self._set_codec(codec.get_default()[0])
+        else:
+            self._registry = None
+            self._codec = codec
+
+            self._codec.set_transport(tr)
 
         try:
             # Read one message.
@@ -63,13 +80,7 @@ class ProcessorSubr:
         except MessageDecodeException as e:
             # Handle decoding errors.
 
-            err_msg = e.get_msg()
-            msg = ErrorMessage(err_msg)
-
-            self._tr.set_state(TransportState.WRITE_BEGIN)
-            self._codec.write_message_begin(msg)
-            self._codec.write_message_end()
-            self._tr.set_state(TransportState.WRITE_END)
+            self._write_error(e.get_msg())
 
             return True
 
@@ -104,9 +115,20 @@ class ProcessorSubr:
 
         self._tr.set_state(TransportState.READ_BEGIN)
 
+        if self._registry != None:
+            (factory, content_type) = self._registry.lookup(self._tr)
+            self._set_codec(factory)
+
+            if content_type != None:
+                self._tr.set_content_type(content_type)
+
         msg = self._codec.read_message_begin()
         mtype = msg.get_mtype()
 
+        # The reply carries the request id of the request.
+
+        self._request_id = msg.get_request_id()
+
         try:
             readfunc = self._messagemap[mtype][0]
         except KeyError:
@@ -120,6 +142,16 @@ class ProcessorSubr:
 
         return mtype
 
+    def _set_codec(self, factory):
+        try:
+            codec = self._codecs[factory]
+        except KeyError:
+            codec = factory()
+            self._codecs[factory] = codec
+
+        self._codec = codec
+        self._codec.set_transport(self._tr)
+
     def _process(self, mtype):
         processfunc = self._messagemap[mtype][1]
         finished = processfunc()
@@ -180,27 +212,45 @@ class ProcessorSubr:
 
         # Write response.
 
-        self._tr.set_state(TransportState.WRITE_BEGIN)
+        try:
+            self._tr.set_state(TransportState.WRITE_BEGIN)
 
-        if exc:
-            msg = CallExceptionMessage(exc_name)
-            self._codec.write_message_begin(msg)
-            exc.myrpc_write(self._codec)
-        elif r:
-            msg = CallResponseMessage()
-            self._codec.write_message_begin(msg)
-            r.myrpc_write(self._codec)
-        else:
-            raise MyRPCInternalException("Neither exc nor result is set")
+            if exc:
+                msg = CallExceptionMessage(exc_name)
+                msg.set_request_id(self._request_id)
+                self._codec.write_message_begin(msg)
+                exc.myrpc_write(self._codec)
+            elif r:
+                msg = CallResponseMessage()
+                msg.set_request_id(self._request_id)
+                self._codec.write_message_begin(msg)
+                r.myrpc_write(self._codec)
+            else:
+                raise MyRPCInternalException("Neither exc nor result is set")
 
-        self._codec.write_message_end()
+            self._codec.write_message_end()
 
-        self._tr.set_state(TransportState.WRITE_END)
+            self._tr.set_state(TransportState.WRITE_END)
+        except MessageLimitException as e:
+            # The response is too large for the transport (e.g.
+            # SharedMemoryTransport), report it to the client.
+
+            self._write_error(e.get_msg())
 
         return True
 
+    def _write_error(self, err_msg):
+        msg = ErrorMessage(err_msg)
+        msg.set_request_id(self._request_id)
+
+        self._tr.set_state(TransportState.WRITE_BEGIN)
+        self._codec.write_message_begin(msg)
+        self._codec.write_message_end()
+        self._tr.set_state(TransportState.WRITE_END)
+
     def _reset(self):
         self._mtype = None
+        self._request_id = None
         self._args_seri = None
         self._handler = None
 
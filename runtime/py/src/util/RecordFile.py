@@ -0,0 +1,508 @@
+import concurrent.futures
+import os
+import struct
+
+from myrpc.Common import MyRPCException, MessageHeaderException, MessageBodyException
+from myrpc.transport.TransportBase import TransportState
+from myrpc.transport.MemoryTransport import MemoryTransport
+from myrpc.transport.MmapTransport import MmapTransport
+from myrpc.codec.CodecBase import MessageType, CallResponseMessage
+from myrpc.codec.BinaryCodec import BinaryCodec
+
+# Record file layout:
+#  - header: magic, format version, codec id, schema fingerprint (0: none).
+#  - records: length (32 bits) followed by a CALL_RESPONSE message carrying
+#    the struct.
+#
+# Index file (<filename>.idx) layout:
+#  - header: magic, format version, reserved.
+#  - offsets of records (64 bits each).
+#
+# Numbers are in network byte order.
+
+INDEX_SUFFIX = ".idx"
+
+_FORMAT_VERSION = 1
+_HEADER_FORMAT = "!4sHHQ"
+_HEADER_MAGIC = b"MYRF"
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_INDEX_HEADER_FORMAT = "!4sHH"
+_INDEX_HEADER_MAGIC = b"MYRI"
+_INDEX_HEADER_SIZE = struct.calcsize(_INDEX_HEADER_FORMAT)
+_INDEX_ENTRY_FORMAT = "!Q"
+_INDEX_ENTRY_SIZE = struct.calcsize(_INDEX_ENTRY_FORMAT)
+_LENGTH_FORMAT = "!I"
+_LENGTH_SIZE = struct.calcsize(_LENGTH_FORMAT)
+_CODECS = {1: BinaryCodec}
+
+class RecordWriter:
+    """Append structs to a record file.
+
+    Records are encoded by codec (BinaryCodec by default), configure it
+    before passing (e.g. BinaryCodec version 2 with schema fingerprint for
+    compact records). The schema fingerprint of the codec is stored in the
+    file header, readers can check it and decode compact records with it.
+    fingerprint sets the header fingerprint for codecs without one (use
+    myrpc_schema_fingerprint of the generated Types module), ValueError is
+    raised if it differs from the fingerprint of the codec.
+
+    If the file exists, then records are appended to it. A truncated last
+    record (e.g. after a crash) is removed, and the index is rebuilt if it
+    doesn't match the file. If index is True, the offset index is maintained.
+    """
+
+    def __init__(self, filename, codec = None, fingerprint = None, index = True):
+        if codec == None:
+            codec = BinaryCodec()
+
+        codec_id = _lookup_codec_id(codec)
+
+        codec_fingerprint = codec.get_schema_fingerprint()
+
+        if codec_fingerprint != None:
+            if (fingerprint != None and
+                fingerprint != codec_fingerprint):
+                raise ValueError("Fingerprint differs from the schema fingerprint of the codec")
+
+            fingerprint = codec_fingerprint
+
+        self._codec = codec
+        self._tr = MemoryTransport()
+        self._codec.set_transport(self._tr)
+
+        self._f = None
+        self._index_f = None
+
+        try:
+            self._f = open(filename, mode = "a+b")
+
+            if self._f.tell() == 0:
+                buf = struct.pack(_HEADER_FORMAT, _HEADER_MAGIC, _FORMAT_VERSION, codec_id, fingerprint or 0)
+                self._f.write(buf)
+                self._f.flush()
+
+                offsets = []
+                index_valid = False
+            else:
+                # Check header and find the end of the last complete record.
+
+                reader = RecordReader(filename, None)
+
+                try:
+                    if reader.get_codec_id() != codec_id:
+                        raise RecordFileException("Codec id mismatch")
+                    if reader.get_fingerprint() != fingerprint:
+                        raise RecordFileException("Schema fingerprint mismatch")
+
+                    offsets = reader.get_offsets()
+                    end = reader.get_end()
+                    index_valid = reader.is_index_valid()
+                finally:
+                    reader.close()
+
+                if self._f.tell() != end:
+                    self._f.truncate(end)
+                    self._f.seek(end)
+
+            self._count = len(offsets)
+
+            if index:
+                index_filename = filename + INDEX_SUFFIX
+
+                if (self._count == 0 or
+                    not index_valid):
+                    self._index_f = open(index_filename, mode = "w+b")
+                    self._write_index(offsets)
+                else:
+                    self._index_f = open(index_filename, mode = "a+b")
+        except OSError as e:
+            self.close()
+            raise RecordFileException(e)
+        except:
+            self.close()
+            raise
+
+    def append(self, obj):
+        """Append obj, return the record number."""
+
+        # Encode record.
+
+        self._tr.set_state(TransportState.WRITE_BEGIN)
+
+        self._codec.write_message_begin(CallResponseMessage())
+        obj.myrpc_write(self._codec)
+        self._codec.write_message_end()
+
+        self._tr.set_state(TransportState.WRITE_END)
+
+        segs = self._tr.get_segments()
+        reclen = sum([len(seg) for seg in segs])
+
+        # Write record, then its index entry.
+
+        try:
+            offset = self._f.tell()
+
+            self._f.write(struct.pack(_LENGTH_FORMAT, reclen))
+            for seg in segs:
+                self._f.write(seg)
+
+            if self._index_f:
+                self._write_index((offset,))
+        except OSError as e:
+            raise RecordFileException(e)
+        finally:
+            self._tr.close()
+
+        i = self._count
+        self._count += 1
+
+        return i
+
+    def get_count(self):
+        return self._count
+
+    def flush(self):
+        try:
+            self._f.flush()
+
+            if self._index_f:
+                self._index_f.flush()
+        except OSError as e:
+            raise RecordFileException(e)
+
+    def close(self):
+        for f in (self._f, self._index_f):
+            if f:
+                f.close()
+
+        self._f = None
+        self._index_f = None
+
+    def _write_index(self, offsets):
+        # Write index header if the index is empty.
+
+        if self._index_f.tell() == 0:
+            self._index_f.write(struct.pack(_INDEX_HEADER_FORMAT, _INDEX_HEADER_MAGIC, _FORMAT_VERSION, 0))
+
+        for offset in offsets:
+            self._index_f.write(struct.pack(_INDEX_ENTRY_FORMAT, offset))
+
+class RecordReader:
+    """Read structs of struct_class from a record file.
+
+    The file is memory-mapped, decoded binary fields are copied unless
+    zero-copy is enabled (see set_zero_copy). Records are accessed by
+    record number, in O(1) if the index is available and valid, otherwise
+    the offsets are collected by skipping over the records on open.
+
+    If fingerprint is specified, then it has to match the one in the file
+    header. Compact records are decoded with the fingerprint of the header.
+    """
+
+    def __init__(self, filename, struct_class, fingerprint = None):
+        self._struct_class = struct_class
+
+        self._tr = MmapTransport(filename)
+        self._index_tr = None
+        self._index_view = None
+        self._index_count = 0
+        self._tail = []
+
+        try:
+            self._open(filename, fingerprint)
+        except:
+            self.close()
+            raise
+
+    def get_codec_id(self):
+        return self._codec_id
+
+    def set_zero_copy(self, enabled):
+        """Decode binary fields as read-only views of the mapping (see BinaryCodec.set_zero_copy)."""
+
+        self._codec.set_zero_copy(enabled)
+
+    def get_fingerprint(self):
+        """Return the schema fingerprint in the file header (None if not set)."""
+
+        return self._fingerprint
+
+    def get_count(self):
+        count = self._index_count + len(self._tail)
+
+        return count
+
+    def get_offset(self, i):
+        """Return the offset of record i."""
+
+        if i < 0 or i >= self.get_count():
+            raise IndexError("Record {} doesn't exist".format(i))
+
+        if i < self._index_count:
+            pos = _INDEX_HEADER_SIZE + i * _INDEX_ENTRY_SIZE
+            (offset,) = struct.unpack_from(_INDEX_ENTRY_FORMAT, self._index_view, pos)
+        else:
+            offset = self._tail[i - self._index_count]
+
+        return offset
+
+    def get_offsets(self):
+        offsets = [self.get_offset(i) for i in range(self.get_count())]
+
+        return offsets
+
+    def get_end(self):
+        """Return the end offset of the last complete record."""
+
+        return self._end
+
+    def is_index_valid(self):
+        """Return True if the index is available and covers all records."""
+
+        r = (self._index_tr != None and
+             not self._index_stale and
+             len(self._tail) == 0)
+
+        return r
+
+    def get(self, i):
+        """Return record i."""
+
+        offset = self.get_offset(i)
+        (obj, next_offset) = self._read(offset)
+
+        return obj
+
+    def scan(self, start = 0, end = None):
+        """Yield records from start (inclusive) to end (exclusive, None: last record)."""
+
+        count = self.get_count()
+
+        if end == None or end > count:
+            end = count
+
+        if start >= end:
+            return
+
+        offset = self.get_offset(start)
+
+        for i in range(start, end):
+            (obj, offset) = self._read(offset)
+            yield obj
+
+    def close(self):
+        if self._index_view != None:
+            self._index_view.release()
+            self._index_view = None
+
+        for tr in (self._tr, self._index_tr):
+            if tr:
+                tr.close()
+
+        self._tr = None
+        self._index_tr = None
+
+    def _open(self, filename, fingerprint):
+        # Check header.
+
+        size = self._tr.get_size()
+
+        if size < _HEADER_SIZE:
+            raise RecordFileException("File header is truncated")
+
+        self._tr.set_offset(0)
+        buf = self._tr.read(_HEADER_SIZE)
+
+        (magic, version, codec_id, file_fingerprint) = struct.unpack(_HEADER_FORMAT, buf)
+
+        if magic != _HEADER_MAGIC:
+            raise RecordFileException("Invalid file signature")
+        if version != _FORMAT_VERSION:
+            raise RecordFileException("Unknown file format version {}".format(version))
+
+        try:
+            codec_class = _CODECS[codec_id]
+        except KeyError:
+            raise RecordFileException("Unknown codec id {}".format(codec_id))
+
+        self._codec_id = codec_id
+        self._fingerprint = file_fingerprint if file_fingerprint != 0 else None
+
+        if (fingerprint != None and
+            fingerprint != self._fingerprint):
+            raise RecordFileException("Schema fingerprint mismatch")
+
+        self._codec = codec_class()
+        self._codec.set_transport(self._tr)
+
+        # Compact records can be read with the fingerprint of the header.
+
+        if self._fingerprint != None:
+            self._codec.set_schema_fingerprint(self._fingerprint)
+
+        # Use the index as far as it is consistent with the file, and collect
+        # the offsets of the remaining records.
+
+        self._open_index(filename + INDEX_SUFFIX, size)
+
+        if self._index_count > 0:
+            last = self.get_offset(self._index_count - 1)
+            pos = self._skip(last, size)
+
+            if pos == None:
+                # Index points to a truncated record, don't use it.
+
+                self._index_count = 0
+                self._index_stale = True
+                pos = _HEADER_SIZE
+        else:
+            pos = _HEADER_SIZE
+
+        self._tail = []
+
+        while True:
+            next_pos = self._skip(pos, size)
+            if next_pos == None:
+                break
+
+            self._tail.append(pos)
+            pos = next_pos
+
+        self._end = pos
+
+    def _open_index(self, index_filename, size):
+        self._index_count = 0
+        self._index_stale = False
+
+        if not os.path.exists(index_filename):
+            return
+
+        index_tr = MmapTransport(index_filename)
+        index_size = index_tr.get_size()
+
+        if index_size < _INDEX_HEADER_SIZE:
+            index_tr.close()
+            return
+
+        buf = index_tr.read(_INDEX_HEADER_SIZE)
+        (magic, version, reserved) = struct.unpack(_INDEX_HEADER_FORMAT, buf)
+
+        if (magic != _INDEX_HEADER_MAGIC or
+            version != _FORMAT_VERSION):
+            index_tr.close()
+            return
+
+        index_tr.set_offset(0)
+
+        self._index_tr = index_tr
+        self._index_view = index_tr.read(index_size)
+        self._index_count = (index_size - _INDEX_HEADER_SIZE) // _INDEX_ENTRY_SIZE
+
+        # Entries beyond the end of the file are stale.
+
+        while (self._index_count > 0 and
+               self.get_offset(self._index_count - 1) >= size):
+            self._index_count -= 1
+            self._index_stale = True
+
+    def _skip(self, offset, size):
+        # Return the offset of the next record, or None if there is no
+        # complete record at offset.
+
+        if offset + _LENGTH_SIZE > size:
+            return None
+
+        self._tr.set_offset(offset)
+        (reclen,) = struct.unpack(_LENGTH_FORMAT, self._tr.read(_LENGTH_SIZE))
+
+        next_offset = offset + _LENGTH_SIZE + reclen
+        if next_offset > size:
+            return None
+
+        return next_offset
+
+    def _read(self, offset):
+        self._tr.set_offset(offset)
+        (reclen,) = struct.unpack(_LENGTH_FORMAT, self._tr.read(_LENGTH_SIZE))
+
+        next_offset = offset + _LENGTH_SIZE + reclen
+
+        msg = self._codec.read_message_begin()
+        mtype = msg.get_mtype()
+
+        if mtype != MessageType.CALL_RESPONSE:
+            raise MessageHeaderException("Unexpected message type {}".format(mtype))
+
+        obj = self._struct_class()
+        obj.myrpc_read(self._codec)
+
+        self._codec.read_message_end()
+
+        if self._tr.get_offset() != next_offset:
+            raise MessageBodyException("Record length mismatch")
+
+        return (obj, next_offset)
+
+class RecordFileException(MyRPCException):
+    """Exception class for record file errors."""
+
+    def __init__(self, reason):
+        super().__init__(str(reason))
+
+        self._reason = reason
+
+    def get_reason(self):
+        return self._reason
+
+def parallel_scan(filename, struct_class, func, fingerprint = None, processes = None, chunks = None):
+    """Call func on every record of the file in a process pool, return the list of results.
+
+    The records are split into chunks (4 per process by default), every
+    worker process opens the file itself. func and struct_class must be
+    picklable (e.g. module-level functions and generated classes). The
+    results are in record order.
+    """
+
+    reader = RecordReader(filename, struct_class, fingerprint)
+
+    try:
+        count = reader.get_count()
+    finally:
+        reader.close()
+
+    if processes == None:
+        processes = os.cpu_count() or 1
+
+    if chunks == None:
+        chunks = processes * 4
+
+    chunk_size = max(1, -(-count // chunks))
+    ranges = [(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+
+    results = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = processes) as executor:
+        futures = [executor.submit(_scan_chunk, filename, struct_class, func, fingerprint, start, end) for (start, end) in ranges]
+
+        for future in futures:
+            results.extend(future.result())
+
+    return results
+
+def _scan_chunk(filename, struct_class, func, fingerprint, start, end):
+    reader = RecordReader(filename, struct_class, fingerprint)
+
+    try:
+        results = [func(obj) for obj in reader.scan(start, end)]
+    finally:
+        reader.close()
+
+    return results
+
+def _lookup_codec_id(codec):
+    for (codec_id, codec_class) in _CODECS.items():
+        if type(codec) is codec_class:
+            return codec_id
+
+    raise ValueError("Codec {} can't be used for record files".format(type(codec).__name__))
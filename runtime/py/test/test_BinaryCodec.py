@@ -0,0 +1,150 @@
+import unittest
+
+from myrpc.Common import MessageBodyException
+from myrpc.codec.BinaryCodec import BinaryCodec, VERSION_2
+from myrpc.codec.CodecBase import DataType, CallResponseMessage
+from myrpc.transport.MemoryTransport import MemoryTransport
+from myrpc.transport.TransportBase import TransportState
+
+_FINGERPRINT = 0x0123456789abcdef
+
+def create_codec(fingerprint = _FINGERPRINT):
+    codec = BinaryCodec()
+    codec.set_version(VERSION_2)
+    codec.set_schema_fingerprint(fingerprint)
+
+    return codec
+
+def write_message(codec, write_body):
+    tr = MemoryTransport()
+    codec.set_transport(tr)
+
+    tr.set_state(TransportState.WRITE_BEGIN)
+    codec.write_message_begin(CallResponseMessage())
+    write_body(codec)
+    codec.write_message_end()
+    tr.set_state(TransportState.WRITE_END)
+
+    return bytes(tr.get_value())
+
+def read_message(codec, buf, read_body):
+    tr = MemoryTransport(buf)
+    codec.set_transport(tr)
+
+    tr.set_state(TransportState.READ_BEGIN)
+    codec.read_message_begin()
+    r = read_body(codec)
+    codec.read_message_end()
+    tr.set_state(TransportState.READ_END)
+
+    return r
+
+def write_empty_struct(codec):
+    codec.write_struct_begin()
+    codec.write_presence([])
+    codec.write_struct_end()
+
+def read_empty_struct(codec):
+    codec.read_struct_begin()
+    codec.read_presence(0)
+    codec.read_struct_end()
+
+class TestEmptyCompactStructs(unittest.TestCase):
+    """Compact structs without fields are encoded as 0 bytes."""
+
+    def test_list(self):
+        def write_body(codec):
+            codec.write_list_begin(50, DataType.STRUCT)
+
+            for i in range(50):
+                write_empty_struct(codec)
+
+            codec.write_list_end()
+
+        def read_body(codec):
+            (llen, dtype) = codec.read_list_begin()
+
+            for i in range(llen):
+                read_empty_struct(codec)
+
+            codec.read_list_end()
+
+            return (llen, dtype)
+
+        buf = write_message(create_codec(), write_body)
+
+        self.assertEqual(read_message(create_codec(), buf, read_body), (50, DataType.STRUCT))
+
+    def test_chunked_list(self):
+        def write_body(codec):
+            codec.write_list_begin(None, DataType.STRUCT)
+            codec.write_list_chunk(50)
+
+            for i in range(50):
+                write_empty_struct(codec)
+
+            codec.write_list_chunk(0)
+            codec.write_list_end()
+
+        def read_body(codec):
+            (count, dtype) = codec.read_list_begin()
+            total = 0
+
+            while count > 0:
+                for i in range(count):
+                    read_empty_struct(codec)
+
+                total += count
+                count = codec.read_list_chunk()
+
+            codec.read_list_end()
+
+            return total
+
+        buf = write_message(create_codec(), write_body)
+
+        self.assertEqual(read_message(create_codec(), buf, read_body), 50)
+
+    def test_map(self):
+        def write_body(codec):
+            codec.write_map_begin(50, DataType.UI8, DataType.STRUCT)
+
+            for i in range(50):
+                codec.write_ui8(i)
+                write_empty_struct(codec)
+
+            codec.write_map_end()
+
+        def read_body(codec):
+            (mlen, key_dtype, value_dtype) = codec.read_map_begin()
+
+            for i in range(mlen):
+                codec.read_ui8()
+                read_empty_struct(codec)
+
+            codec.read_map_end()
+
+            return mlen
+
+        buf = write_message(create_codec(), write_body)
+
+        self.assertEqual(read_message(create_codec(), buf, read_body), 50)
+
+    def test_list_length_exceeds_message(self):
+        # Elements of other types take at least one byte.
+
+        def write_body(codec):
+            codec.write_list_begin(50, DataType.UI8)
+
+            for i in range(10):
+                codec.write_ui8(i)
+
+            codec.write_list_end()
+
+        buf = write_message(create_codec(), write_body)
+
+        with self.assertRaisesRegex(MessageBodyException, "exceeds message length"):
+            read_message(create_codec(), buf, lambda codec: codec.read_list_begin())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+
+from myrpc.codec.BinaryCodec import BinaryCodec, VERSION_2
+from myrpc.codec.CodecBase import DataType, FID_STOP
+from myrpc.util.RecordFile import RecordWriter, RecordReader
+
+_FINGERPRINT = 0x0123456789abcdef
+
+def create_codec(fingerprint):
+    codec = BinaryCodec()
+    codec.set_version(VERSION_2)
+    codec.set_schema_fingerprint(fingerprint)
+
+    return codec
+
+class Value:
+    """Struct with a single required ui32 field."""
+
+    def __init__(self, value = None):
+        self.value = value
+
+    def myrpc_write(self, codec):
+        codec.write_struct_begin()
+
+        if codec.is_write_compact():
+            codec.write_presence([])
+            codec.write_ui32(self.value)
+        else:
+            codec.write_field_begin(0, DataType.UI32)
+            codec.write_ui32(self.value)
+            codec.write_field_end()
+            codec.write_field_stop()
+
+        codec.write_struct_end()
+
+    def myrpc_read(self, codec):
+        codec.read_struct_begin()
+
+        if codec.is_read_compact():
+            codec.read_presence(0)
+            self.value = codec.read_ui32()
+        else:
+            codec.read_field_begin()
+            self.value = codec.read_ui32()
+            codec.read_field_end()
+
+            (fid, dtype) = codec.read_field_begin()
+            if fid != FID_STOP:
+                raise ValueError("Unexpected field {}".format(fid))
+
+        codec.read_struct_end()
+
+class TestRecordFileFingerprint(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._filename = os.path.join(self._dir.name, "records")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write_records(self, codec, fingerprint = None):
+        writer = RecordWriter(self._filename, codec, fingerprint)
+
+        try:
+            for i in range(3):
+                writer.append(Value(i))
+        finally:
+            writer.close()
+
+    def read_records(self, fingerprint = None):
+        reader = RecordReader(self._filename, Value, fingerprint)
+
+        try:
+            values = [obj.value for obj in reader.scan()]
+            header_fingerprint = reader.get_fingerprint()
+        finally:
+            reader.close()
+
+        return (values, header_fingerprint)
+
+    def test_fingerprint_of_codec(self):
+        # Compact records can be read with the fingerprint stored in the
+        # header.
+
+        self.write_records(create_codec(_FINGERPRINT))
+
+        self.assertEqual(self.read_records(), ([0, 1, 2], _FINGERPRINT))
+        self.assertEqual(self.read_records(_FINGERPRINT), ([0, 1, 2], _FINGERPRINT))
+
+    def test_fingerprint_without_codec_fingerprint(self):
+        self.write_records(create_codec(None), _FINGERPRINT)
+
+        self.assertEqual(self.read_records(_FINGERPRINT), ([0, 1, 2], _FINGERPRINT))
+
+    def test_fingerprint_mismatch(self):
+        with self.assertRaises(ValueError):
+            RecordWriter(self._filename, create_codec(_FINGERPRINT), _FINGERPRINT + 1)
+
+        self.assertFalse(os.path.exists(self._filename))
+
+    def test_append_with_codec_fingerprint(self):
+        self.write_records(create_codec(_FINGERPRINT))
+        self.write_records(create_codec(_FINGERPRINT), _FINGERPRINT)
+
+        self.assertEqual(self.read_records()[0], [0, 1, 2] * 2)
+
+if __name__ == "__main__":
+    unittest.main()